@@ -0,0 +1,138 @@
+"""
+活動的冷熱分層：結束一段時間的活動移到 events_archive
+
+events 是匯入比對、圖片、地理編碼與重複比對每次都要查詢的熱資料表，
+結束超過 ARCHIVE_AFTER_DAYS 天的活動整列（保留原本的 id）搬到結構相同的 events_archive，
+熱資料表與其索引只包含目前相關的活動：
+- 代表活動仍有未到期的重複活動指向它時暫不封存，重複比對的群組不會被拆開
+- 已封存的活動再次出現在來源且內容有變動時，寫入前先搬回 events（restore_archived）
+- 每日活動數彙總保留已封存活動的歷史數量，重新計算時也包含封存表
+- 活動詳情查不到時改查封存表；活動列表加上 include_past=1 才包含已結束與封存的活動
+
+用法:
+    python archive.py
+    python archive.py --days 60
+"""
+import argparse
+from datetime import date, timedelta
+from typing import List, Optional, Sequence
+
+# 結束超過幾天的活動移到封存表
+ARCHIVE_AFTER_DAYS = 30
+
+# 結束日期早於 cutoff（沒有結束日期時看開始日期），與 current_events 判斷是否結束的方式相同
+ENDED = "({alias}.end_date < %s OR ({alias}.end_date IS NULL AND {alias}.start_date < %s))"
+
+ARCHIVE_CANDIDATES = f"""
+    SELECT e.id, e.uid FROM events e
+    WHERE {ENDED.format(alias='e')}
+      AND NOT EXISTS (
+          SELECT 1 FROM events d
+          WHERE d.canonical_id = e.id AND NOT {ENDED.format(alias='d')})
+    ORDER BY e.id
+    LIMIT %s
+"""
+
+# 兩張表共有的欄位（init_database 補完欄位後才會用到，整個程序共用）
+_columns: List[str] = []
+
+
+def archive_columns(cursor) -> List[str]:
+    """兩張表共有的欄位（依 events 的順序），搬移時明確列出欄位，不受欄位順序影響"""
+    if not _columns:
+        cursor.execute("SHOW COLUMNS FROM events_archive")
+        archived = {row[0] for row in cursor.fetchall()}
+        cursor.execute("SHOW COLUMNS FROM events")
+        _columns.extend(row[0] for row in cursor.fetchall() if row[0] in archived)
+    return _columns
+
+
+def _restore(cursor, where: str, params: Sequence) -> int:
+    columns = ", ".join(archive_columns(cursor))
+    cursor.execute(
+        f"INSERT INTO events ({columns}) SELECT {columns} FROM events_archive WHERE {where}",
+        params
+    )
+    restored = cursor.rowcount
+    if restored:
+        cursor.execute(f"DELETE FROM events_archive WHERE {where}", params)
+    return restored
+
+
+def restore_archived(cursor, uids: Sequence[str]) -> int:
+    """
+    把已封存的活動搬回 events（保留原本的 id），之後照一般的更新規則比對
+
+    Returns:
+        int: 搬回的活動數
+    """
+    if not uids:
+        return 0
+    placeholders = ", ".join(["%s"] * len(uids))
+    return _restore(cursor, f"uid IN ({placeholders})", list(uids))
+
+
+def restore_staged(cursor) -> int:
+    """大量匯入：暫存表（events_staging）中已封存的活動先搬回 events"""
+    return _restore(cursor, "uid IN (SELECT uid FROM events_staging)", [])
+
+
+def run_archive(connection, days: int = ARCHIVE_AFTER_DAYS, batch_size: int = 1000,
+                today: Optional[date] = None) -> int:
+    """
+    把結束超過 days 天的活動分批搬到 events_archive，每批一個交易
+
+    Returns:
+        int: 本次封存的活動數
+    """
+    cutoff = (today or date.today()) - timedelta(days=days)
+    cursor = None
+    total = 0
+    try:
+        cursor = connection.cursor(buffered=True)
+        columns = ", ".join(archive_columns(cursor))
+        while True:
+            cursor.execute(ARCHIVE_CANDIDATES, (cutoff, cutoff, cutoff, cutoff, batch_size))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            ids = [event_id for event_id, _ in rows]
+            uids = [uid for _, uid in rows]
+            id_placeholders = ", ".join(["%s"] * len(ids))
+            uid_placeholders = ", ".join(["%s"] * len(uids))
+
+            # 曾經搬回又再次封存的活動，以熱資料表中較新的內容為準
+            cursor.execute(f"DELETE FROM events_archive WHERE uid IN ({uid_placeholders})", uids)
+            cursor.execute(
+                f"""INSERT INTO events_archive ({columns})
+                    SELECT {columns} FROM events WHERE id IN ({id_placeholders})""",
+                ids
+            )
+            cursor.execute(f"DELETE FROM events WHERE id IN ({id_placeholders})", ids)
+            connection.commit()
+            total += len(ids)
+
+        print(f"已封存 {total} 筆結束超過 {days} 天的活動")
+        return total
+
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        if cursor:
+            cursor.close()
+
+
+if __name__ == "__main__":
+    from main import connect_to_mysql
+
+    parser = argparse.ArgumentParser(description="把結束一段時間的活動移到封存表")
+    parser.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS,
+                        help=f"結束超過幾天的活動才封存（預設 {ARCHIVE_AFTER_DAYS}）")
+    args = parser.parse_args()
+
+    connection = connect_to_mysql()
+    try:
+        run_archive(connection, args.days)
+    finally:
+        connection.close()
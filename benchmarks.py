@@ -0,0 +1,888 @@
+"""
+匯入流程的效能基準測試
+
+用法:
+    python benchmarks.py ntpc_csv --rows 200000
+    python benchmarks.py dedup --rows 100000
+    python benchmarks.py culture_normalize --rows 100000
+    python benchmarks.py culture_shards --rows 50000
+    python benchmarks.py images
+    python benchmarks.py bulk_load --rows 50000
+    python benchmarks.py startup
+    python benchmarks.py api_load --rows 50000
+    python benchmarks.py calendar
+    python benchmarks.py event_index --rows 50000
+    python benchmarks.py delta_sync --rows 50000
+"""
+import argparse
+import csv
+import io
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, List
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _timeit(func: Callable, *args, repeat: int = 3, **kwargs):
+    """執行多次取最佳耗時，回傳 (秒數, 最後一次的結果)"""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def _report(title: str, rows: int, timings: Dict[str, float]) -> None:
+    print(f"\n=== {title}（{rows:,} 筆）===")
+    baseline = next(iter(timings.values()))
+    for name, seconds in timings.items():
+        print(f"{name:<24} {seconds:8.3f} 秒  {rows / seconds:12,.0f} 筆/秒  x{baseline / seconds:.2f}")
+
+
+# ---------------------------------------------------------------------------
+# 新北市 CSV 解析
+
+
+NTPC_HEADER = ["id", "title", "activedate", "activeenddate", "description", "classname",
+               "author", "place", "placeTel", "address", "traffic", "abouturl", "picurl"]
+
+
+def make_ntpc_csv(rows: int, seed: int = 42) -> bytes:
+    """產生與新北市開放資料格式相同的合成 CSV（含 BOM）"""
+    rng = random.Random(seed)
+    places = [f"新北市立第{i}活動中心" for i in range(200)]
+    classes = ["藝文", "親子", "運動", "節慶", "講座", "展覽"]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(NTPC_HEADER)
+    for i in range(rows):
+        start = f"2025/{rng.randint(1, 12):02d}/{rng.randint(1, 28):02d}"
+        end = f"2025/{rng.randint(1, 12):02d}/{rng.randint(1, 28):02d} 17:00:00"
+        writer.writerow([
+            f"ntpc-{i}", f"合成活動 {i}", start, end,
+            "活動說明" * rng.randint(5, 40), rng.choice(classes),
+            "新北市政府文化局", rng.choice(places), "02-29603456",
+            f"新北市板橋區中山路一段{rng.randint(1, 300)}號", "捷運板橋站步行5分鐘",
+            f"https://www.ntpc.gov.tw/event/{i}", f"https://www.ntpc.gov.tw/img/{i}.jpg",
+        ])
+    return buffer.getvalue().encode('utf-8-sig')
+
+
+def _legacy_ntpc_parse(raw: bytes) -> List[Dict]:
+    """舊版逐列解析：整份解碼、DictReader、兩次字典轉換"""
+    from newtaipei_api import convert_date_format
+
+    events = []
+    for row in csv.DictReader(io.StringIO(raw.decode('utf-8-sig'))):
+        events.append({key: row.get(key, "") for key in NTPC_HEADER})
+    events = [{
+        "id": e["id"], "活動名稱": e["title"], "活動起始日期": e["activedate"],
+        "活動結束日期": e["activeenddate"], "簡介說明": e["description"],
+        "活動類別": e["classname"], "主辦單位": e["author"], "活動場地": e["place"],
+        "場地電話": e["placeTel"], "地址": e["address"], "交通說明": e["traffic"],
+        "相關連結": e["abouturl"], "圖片連結": e["picurl"],
+    } for e in events]
+    return [{
+        "uid": e["id"], "title": e["活動名稱"], "description": e["簡介說明"],
+        "organizer": e["主辦單位"], "address": e["地址"],
+        "startDate": convert_date_format(e["活動起始日期"]),
+        "endDate": convert_date_format(e["活動結束日期"]),
+        "location": e["活動場地"], "latitude": None, "longitude": None,
+        "price": "", "url": e["相關連結"], "imageUrl": e["圖片連結"],
+        "category": e["活動類別"], "city": "新北市",
+    } for e in events]
+
+
+def bench_ntpc_csv(rows: int = 100000) -> None:
+    """比較舊版逐列解析與欄式批次解析的吞吐量"""
+    from newtaipei_api import parse_ntpc_payload
+
+    raw = make_ntpc_csv(rows)
+    legacy_time, legacy = _timeit(_legacy_ntpc_parse, raw)
+    column_time, columnar = _timeit(parse_ntpc_payload, raw)
+    assert legacy == columnar, "兩種解析方式的結果不一致"
+    print(f"合成 CSV 大小：{len(raw) / 1024 / 1024:.1f} MB")
+    _report("新北市 CSV 解析", rows, {
+        "逐列 DictReader": legacy_time,
+        "欄式批次解析": column_time,
+    })
+
+
+# ---------------------------------------------------------------------------
+# 跨來源重複活動偵測
+
+
+DEDUP_SOURCES = ["culture:1", "tfam:f37de02a-623d-4f72-bca9-7c7aad2f0e10", "taipei", "ntpc"]
+DEDUP_WORDS = ["當代", "藝術", "特展", "音樂會", "親子", "劇場", "攝影", "工作坊", "故事",
+               "回顧", "城市", "光影", "記憶", "春季", "夏日", "國際", "聯展", "講座"]
+
+
+def make_dedup_corpus(rows: int, duplicate_ratio: float = 0.3, seed: int = 42):
+    """
+    產生含跨來源重複的合成活動，回傳 (records, 真正的重複配對集合)
+
+    重複的活動換來源、加上書名號或前後綴、開始日期前後偏移數天，部分缺少場地。
+    """
+    from datetime import date, timedelta
+    from dedup import EventRecord
+
+    rng = random.Random(seed)
+    records = []
+    truth = set()
+    base_day = date(2025, 1, 1)
+    while len(records) < rows:
+        # 常見詞組合再加上幾個隨機漢字，模擬真實標題中具鑑別度的專有名詞
+        title = "".join(rng.sample(DEDUP_WORDS, 2)) + "".join(
+            chr(rng.randint(0x4E00, 0x9FA5)) for _ in range(3)) + rng.choice(DEDUP_WORDS)
+        start = base_day + timedelta(days=rng.randint(0, 365))
+        end = start + timedelta(days=rng.randint(0, 90))
+        venue = rng.randint(1, 2000)
+        sources = rng.sample(DEDUP_SOURCES, 2 if rng.random() < duplicate_ratio else 1)
+
+        first_id = len(records) + 1
+        records.append(EventRecord(first_id, sources[0], title, start, end, venue, 1))
+        for source in sources[1:]:
+            variant = rng.choice([f"《{title}》", f"{title}特展", f" {title} ", f"【{title}】"])
+            shift = timedelta(days=rng.randint(-3, 3))
+            duplicate_id = len(records) + 1
+            records.append(EventRecord(duplicate_id, source, variant, start + shift, end,
+                                       venue if rng.random() < 0.7 else None))
+            truth.add((first_id, duplicate_id))
+    return records[:rows], truth
+
+
+def bench_dedup(rows: int = 100000) -> None:
+    """重複偵測的候選配對數、準確率與不同資料量下的耗時（應接近線性成長）"""
+    from dedup import candidate_pairs, find_duplicates
+
+    timings = {}
+    for size in (rows // 4, rows // 2, rows):
+        records, truth = make_dedup_corpus(size)
+        truth = {pair for pair in truth if pair[1] <= size}
+        seconds, canonical = _timeit(find_duplicates, records, repeat=1)
+        found = set(canonical.items())
+        found = {(canonical_id, event_id) for event_id, canonical_id in found}
+
+        true_positive = len(found & truth)
+        precision = true_positive / len(found) if found else 1.0
+        recall = true_positive / len(truth) if truth else 1.0
+        pairs = len(candidate_pairs(records))
+        print(f"{size:>8,} 筆：候選配對 {pairs:,}（全配對 {size * (size - 1) // 2:,}），"
+              f"precision {precision:.3f}，recall {recall:.3f}")
+        timings[f"{size:,} 筆"] = seconds
+
+    print("\n=== 重複活動偵測 ===")
+    for name, seconds in timings.items():
+        print(f"{name:<24} {seconds:8.3f} 秒")
+
+
+# ---------------------------------------------------------------------------
+# 文化部展演資料正規化
+
+
+def make_culture_events(rows: int, seed: int = 42) -> List[Dict]:
+    """產生與文化部 doFindTypeJ 回應格式相同的合成展演資料"""
+    rng = random.Random(seed)
+    events = []
+    for i in range(rows):
+        shows = []
+        for _ in range(rng.randint(1, 4)):
+            day = f"2025/{rng.randint(1, 12):02d}/{rng.randint(1, 28):02d}"
+            shows.append({
+                "time": f"{day} 19:30:00", "endTime": f"{day} 21:30:00",
+                "location": f"臺北市中正區八德路一段{rng.randint(1, 300)}號",
+                "locationName": f"第{rng.randint(1, 500)}展演廳", "onSales": "Y",
+                "latitude": str(25 + rng.random()), "longitude": str(121 + rng.random()),
+                "price": str(rng.randint(0, 3000)),
+            })
+        events.append({
+            "UID": f"culture-{i}", "title": f"合成展演 {i}", "showUnit": "合成劇團",
+            "descriptionFilterHtml": "展演說明" * rng.randint(5, 40),
+            "imageURL": f"/img/{i}.jpg", "masterUnit": ["文化部"], "showInfo": shows,
+        })
+    return events
+
+
+def bench_culture_normalize(rows: int = 100000) -> None:
+    """比較單一行程與行程池平行正規化文化部展演資料"""
+    from culture_api import NORMALIZE_WORKERS, normalize_culture_events, get_normalize_pool
+
+    events = make_culture_events(rows)
+    # 先啟動行程池，只量測正規化本身
+    get_normalize_pool(NORMALIZE_WORKERS)
+
+    serial_time, serial = _timeit(lambda: list(normalize_culture_events(events, workers=1)))
+    pool_time, pooled = _timeit(lambda: list(normalize_culture_events(events)))
+    assert serial == pooled, "兩種正規化方式的結果不一致"
+    _report(f"文化部展演資料正規化（{NORMALIZE_WORKERS} 個工作行程）", rows, {
+        "單一行程": serial_time,
+        "行程池平行": pool_time,
+    })
+
+
+# 模擬上游的回應延遲與單一連線頻寬（文化部整份目錄的回應很大，傳輸時間隨大小增加）
+CULTURE_LATENCY = 0.3
+CULTURE_BANDWIDTH = 5 * 1024 * 1024
+# 同時屬於兩個類別的活動比例（分片之間的重複）
+CULTURE_SHARED_RATIO = 0.1
+
+
+def bench_culture_shards(rows: int = 100000) -> None:
+    """
+    文化部展演資訊：category=all 再抓 category=11，對比依類別分片並行抓取（模擬上游）
+
+    上游每個請求固定延遲 CULTURE_LATENCY 秒、每條連線 CULTURE_BANDWIDTH 的頻寬，沒有隨機抖動；
+    耗時取三次中最佳。分片要多發十幾個請求，資料量小時延遲占多數，分片反而較慢。
+    另外讓優先的類別回應最慢、重跑一次分片，確認跨類別重複的歸屬與完成順序無關。
+    """
+    import asyncio
+    import json
+    import tempfile
+    import tracemalloc
+
+    import httpx
+    from culture_api import CULTURE_CATEGORIES, CultureAPI
+    from http_client import get_client
+
+    rng = random.Random(3)
+    categories = list(CULTURE_CATEGORIES)
+    events = make_culture_events(rows)
+    shards = {category: [] for category in categories}
+    owners = {}
+    for event in events:
+        members = rng.sample(categories, 2 if rng.random() < CULTURE_SHARED_RATIO else 1)
+        event["category"] = members[0]
+        for category in members:
+            shards[category].append(event)
+        owners[event["UID"]] = "culture:" + min(members, key=categories.index)
+    bodies = {"all": json.dumps(events, ensure_ascii=False).encode("utf-8")}
+    for category, shard in shards.items():
+        bodies[category] = json.dumps(shard, ensure_ascii=False).encode("utf-8")
+    del events, shards
+
+    delays = dict.fromkeys(bodies, CULTURE_LATENCY)
+    transferred = []
+
+    async def upstream(request):
+        category = request.url.params["category"]
+        body = bodies[category]
+        transferred.append(len(body))
+        await asyncio.sleep(delays[category] + len(body) / CULTURE_BANDWIDTH)
+        return httpx.Response(200, content=body, headers={"Content-Type": "application/json"})
+
+    client = get_client()
+    client.aio._clients["https://cloud.culture.tw"] = httpx.AsyncClient(
+        transport=httpx.MockTransport(upstream))
+    api = CultureAPI(workers=1)
+
+    def all_then_11():
+        batches = [api.get_events(), api.get_integrated_events()]
+        return [event["uid"] for batch in batches for event in batch["result"]]
+
+    def sharded():
+        return [event["uid"] for batch in api.get_events_by_category() for event in batch["result"]]
+
+    def shard_owners():
+        return {event["uid"]: batch["source"]
+                for batch in api.get_events_by_category() for event in batch["result"]}
+
+    cwd = os.getcwd()
+    os.chdir(tempfile.mkdtemp(prefix="culture-bench-"))
+    results = {}
+    try:
+        for name, fetch in (("all 再抓 11", all_then_11), ("依類別分片並行", sharded)):
+            transferred.clear()
+            seconds, uids = _timeit(fetch)
+            # 記憶體另外量測一次（tracemalloc 會大幅拖慢執行）
+            tracemalloc.start()
+            fetch()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            # 計時三次加上量測記憶體一次，共抓取四次
+            results[name] = (seconds, len(transferred) // 4, sum(transferred) // 4, peak, uids)
+
+        # 越優先的類別回應越慢，分片完成的順序與優先順序相反
+        delays.update({category: CULTURE_LATENCY * (len(categories) - index) / len(categories)
+                       for index, category in enumerate(categories)})
+        reordered = shard_owners()
+    finally:
+        os.chdir(cwd)
+
+    (_, _, _, _, baseline), (_, _, _, _, sharded_uids) = results.values()
+    assert set(baseline) == set(sharded_uids), "兩種抓取方式的活動不一致"
+    assert len(sharded_uids) == len(set(sharded_uids)), "分片之間的重複活動沒有去除"
+    assert reordered == owners, "跨類別重複活動的歸屬隨分片完成順序改變"
+    print(f"\n模擬上游：延遲 {CULTURE_LATENCY} 秒、單一連線 {CULTURE_BANDWIDTH / 1024 / 1024:.0f} MB/秒，"
+          f"{CULTURE_SHARED_RATIO:.0%} 的活動同時屬於兩個類別")
+    for name, (seconds, requests, size, peak, uids) in results.items():
+        print(f"{name:<16} 請求 {requests:3d} 個  下載 {size / 1024 / 1024:8.1f} MB"
+              f"  記憶體高峰 {peak / 1024 / 1024:8.1f} MB  寫入 {len(uids):,} 筆")
+    _report("文化部展演資訊抓取與正規化", rows,
+            {name: result[0] for name, result in results.items()})
+    print("跨類別重複活動固定歸給優先的類別，與分片完成順序無關")
+
+
+# ---------------------------------------------------------------------------
+# 圖片下載與縮圖（本機圖片測試伺服器）
+
+
+def bench_images(rows: int = 0) -> None:
+    """
+    對 image_stub 執行 fetch_images：只有確定的失敗才標記失效、來源暫時故障留待重試、
+    超過大小上限時不必讀完整個檔案（每個主機有限流，不適合量測吞吐量）
+    """
+    import tempfile
+
+    import image_pipeline
+    from http_client import get_client
+    from image_stub import start_stub_server
+
+    server = start_stub_server()
+    outage = start_stub_server()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    # 來源暫時故障放在另一台伺服器，該主機的斷路器開啟不影響其他網址
+    outage_base = f"http://127.0.0.1:{outage.server_address[1]}"
+    expected = {
+        f"{base}/img/800x600.jpg": "ok",
+        f"{base}/nolength/img/640x480.png": "ok",
+        f"{base}/dead/a.jpg": "dead",
+        f"{base}/broken/a.jpg": "dead",
+        f"{base}/img/4000x4000.jpg": "dead",
+        f"{base}/nolength/img/4000x4000.jpg": "dead",
+    }
+    expected.update({f"{outage_base}/error/{i}.jpg": "retry" for i in range(8)})
+    try:
+        seconds, results = _timeit(
+            lambda: get_client().run(image_pipeline.fetch_images(
+                expected, 8, tempfile.mkdtemp(prefix="image-bench-"), max_bytes=50 * 1024)),
+            repeat=1)
+    finally:
+        server.shutdown()
+        outage.shutdown()
+
+    for url, outcome in expected.items():
+        result = results[image_pipeline.url_hash(url)]
+        actual = "dead" if result["dead"] else "retry" if result["retry"] else "ok"
+        assert actual == outcome, f"{url}: 預期 {outcome}，實際 {actual}"
+        assert (result["thumb_key"] is not None) == (outcome == "ok"), url
+    print(f"\n{len(expected)} 個圖片網址的處理結果皆符合預期（成功 / 失效 / 暫時失敗），"
+          f"耗時 {seconds:.2f} 秒")
+
+
+# ---------------------------------------------------------------------------
+# 大量匯入（逐筆寫入與 LOAD DATA 的比較）
+
+
+# 測試用的獨立資料庫，測試結束後刪除
+BULK_BENCH_DATABASE = "fun_events_bench"
+
+
+def bench_bulk_load(rows: int = 100000) -> None:
+    """逐筆 save_to_mysql 與 LOAD DATA 大量匯入的每秒筆數（需要可連線且開啟 local_infile 的 MySQL）"""
+    import mysql.connector
+    import main
+    from bulk_load import bulk_save
+    from culture_api import normalize_culture_events
+    from watermark import filter_unseen
+
+    server_config = {key: value for key, value in main.DB_CONFIG.items() if key != "database"}
+    try:
+        server = mysql.connector.connect(**server_config)
+    except mysql.connector.Error as e:
+        print(f"\n無法連線 MySQL，略過大量匯入測試：{e}")
+        return
+
+    data = filter_unseen({
+        "result": list(normalize_culture_events(make_culture_events(rows), workers=1)),
+        "source": "culture:all", "total": rows, "limit": rows, "offset": 0,
+    }, {})
+
+    cursor = server.cursor(buffered=True)
+    connection = None
+    try:
+        cursor.execute(f"DROP DATABASE IF EXISTS {BULK_BENCH_DATABASE}")
+        cursor.execute(f"CREATE DATABASE {BULK_BENCH_DATABASE}")
+        cursor.execute(f"USE {BULK_BENCH_DATABASE}")
+        with open(os.path.join(BASE_DIR, "create_tables.sql"), encoding="utf-8") as f:
+            for command in f.read().split(";"):
+                if command.strip():
+                    cursor.execute(command)
+        # 與 init_database 相同補上 INDEXES，逐筆寫入才會用 idx_events_uid 查 uid
+        for table, index_name, column in main.INDEXES:
+            try:
+                cursor.execute(f"CREATE INDEX {index_name} ON {table}({column})")
+            except mysql.connector.Error as e:
+                if e.errno != 1061:  # 索引已存在
+                    raise
+        connection = mysql.connector.connect(
+            **server_config, database=BULK_BENCH_DATABASE, allow_local_infile=True)
+
+        def reset():
+            reset_cursor = connection.cursor()
+            reset_cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
+            for table in ("events", "organizers", "venues", "event_day_counts", "event_day_ranges"):
+                reset_cursor.execute(f"TRUNCATE TABLE {table}")
+            reset_cursor.execute("SET FOREIGN_KEY_CHECKS = 1")
+            reset_cursor.close()
+            main.dimension_cache.reset()
+
+        reset()
+        row_time, _ = _timeit(main.save_to_mysql, data, connection, repeat=1)
+        reset()
+        rebuild_time, _ = _timeit(bulk_save, data, connection, repeat=1)
+        # 同一批再寫一次：events 已有資料，走 UPDATE ... JOIN 合併
+        merge_time, _ = _timeit(bulk_save, data, connection, repeat=1)
+        _report("活動寫入", rows, {
+            "逐筆 save_to_mysql": row_time,
+            "LOAD DATA 空表重建": rebuild_time,
+            "LOAD DATA 合併既有資料": merge_time,
+        })
+    finally:
+        if connection:
+            connection.close()
+        cursor.execute(f"DROP DATABASE IF EXISTS {BULK_BENCH_DATABASE}")
+        cursor.close()
+        server.close()
+
+
+# ---------------------------------------------------------------------------
+# 命令列冷啟動時間
+
+
+# 冷啟動時間上限（秒）；超過時以非零結束碼結束，可放在 CI 中當作門檻
+STARTUP_BUDGETS = {
+    "ingest.py --help": ([os.path.join(BASE_DIR, "ingest.py"), "--help"], 0.2),
+    "import main": (["-c", "import main"], 0.3),
+    "import newtaipei_api": (["-c", "import newtaipei_api"], 0.3),
+}
+
+
+def bench_startup(rows: int = 0, repeat: int = 7) -> None:
+    """量測命令列與單一來源轉接器的冷啟動時間（取中位數），超過上限即失敗"""
+    failures = []
+    print("\n=== 冷啟動時間 ===")
+    for name, (argv, budget) in STARTUP_BUDGETS.items():
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, *argv], cwd=BASE_DIR, check=True,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            samples.append(time.perf_counter() - start)
+        median = statistics.median(samples)
+        status = "OK" if median <= budget else "超過上限"
+        print(f"{name:<24} {median * 1000:8.1f} ms  上限 {budget * 1000:6.0f} ms  {status}")
+        if median > budget:
+            failures.append(name)
+
+    if failures:
+        raise SystemExit(f"冷啟動時間超過上限：{', '.join(failures)}")
+
+
+# ---------------------------------------------------------------------------
+# 活動 API（WSGI 與 ASGI 的負載比較）
+
+
+API_FIXTURE_TABLES = [
+    "CREATE TABLE organizers (id INTEGER PRIMARY KEY, name TEXT)",
+    "CREATE TABLE venues (id INTEGER PRIMARY KEY, venue_key TEXT, name TEXT, address TEXT)",
+    """CREATE TABLE events (
+        id INTEGER PRIMARY KEY, uid TEXT, activity_name TEXT, description TEXT,
+        organizer_id INTEGER, venue_id INTEGER, start_date DATE, end_date DATE,
+        latitude REAL, longitude REAL, ticket_price TEXT, related_link TEXT, image_url TEXT,
+        source TEXT, content_digest TEXT, thumb_key TEXT, image_width INTEGER,
+        image_height INTEGER, image_dead INTEGER NOT NULL DEFAULT 0, canonical_id INTEGER,
+        category TEXT, city TEXT, created_at TEXT)""",
+    "CREATE INDEX idx_events_uid ON events (uid)",
+    "CREATE TABLE events_archive AS SELECT * FROM events WHERE 0",
+    "CREATE INDEX idx_events_archive_uid ON events_archive (uid)",
+    """CREATE TABLE current_events (
+        position INTEGER PRIMARY KEY, event_id INTEGER, uid TEXT UNIQUE, title TEXT,
+        description TEXT, organizer_id INTEGER, organizer TEXT, venue_id INTEGER,
+        location TEXT, address TEXT, start_date DATE, end_date DATE, latitude REAL,
+        longitude REAL, ticket_price TEXT, related_link TEXT, image_url TEXT, thumb_key TEXT,
+        has_image INTEGER NOT NULL DEFAULT 0, source TEXT, category TEXT, city TEXT)""",
+    "CREATE INDEX idx_current_events_geo ON current_events (latitude, longitude)",
+    "CREATE INDEX idx_current_events_category ON current_events (category, position)",
+    "CREATE INDEX idx_current_events_city ON current_events (city, position)",
+    "CREATE INDEX idx_current_events_source ON current_events (source, position)",
+    """CREATE TABLE current_event_facets (
+        category TEXT, city TEXT, source TEXT, has_image INTEGER, end_date DATE,
+        event_count INTEGER)""",
+    """CREATE TABLE event_day_counts (
+        day DATE, source TEXT, city TEXT, category TEXT, event_count INTEGER,
+        PRIMARY KEY (day, source, city, category))""",
+    """CREATE TABLE event_day_ranges (
+        start_day DATE, end_day DATE, source TEXT, city TEXT, category TEXT, event_count INTEGER,
+        PRIMARY KEY (start_day, end_day, source, city, category))""",
+    "CREATE TABLE event_changes (seq INTEGER PRIMARY KEY, uid TEXT, deleted INTEGER)",
+]
+
+
+API_FIXTURE_CATEGORIES = ["音樂", "戲劇", "展覽", "親子", "講座", "節慶", ""]
+
+
+def setup_api_fixture(rows: int, seed: int = 42) -> None:
+    """
+    以 SQLite 暫存資料庫設定 Django，並建立合成的活動資料（只供效能測試使用）
+
+    資料表結構與 create_tables.sql 相同欄位，current_events 以匯入流程相同的 SELECT 產生。
+    """
+    import tempfile
+    from datetime import date, timedelta
+
+    import django
+    from django.conf import settings
+
+    if not settings.configured:
+        settings.configure(
+            DEBUG=False, SECRET_KEY="benchmark", ALLOWED_HOSTS=["*"],
+            ROOT_URLCONF="theme_entertainment.urls", INSTALLED_APPS=["theme_entertainment"],
+            USE_TZ=True, TIME_ZONE="Asia/Taipei", EVENT_API_ASYNC=False, EVENT_API_DB_THREADS=8,
+            THUMBNAIL_ROOT=os.path.join(tempfile.gettempdir(), "thumbs"),
+            DATABASES={"default": {
+                "ENGINE": "django.db.backends.sqlite3",
+                "NAME": os.path.join(tempfile.mkdtemp(prefix="events-bench-"), "events.sqlite3"),
+            }},
+        )
+        django.setup()
+
+    from django.db import connection
+    from current_events import FACETS_SELECT, SNAPSHOT_COLUMNS, SNAPSHOT_SELECT
+
+    rng = random.Random(seed)
+    today = date.today()
+    with connection.cursor() as cursor:
+        for table in ("event_changes", "event_day_counts", "event_day_ranges", "current_event_facets",
+                      "current_events", "events_archive", "events", "venues", "organizers"):
+            cursor.execute(f"DROP TABLE IF EXISTS {table}")
+        for statement in API_FIXTURE_TABLES:
+            cursor.execute(statement)
+        cursor.executemany("INSERT INTO organizers VALUES (%s, %s)",
+                           [(i, f"主辦單位{i}") for i in range(1, 301)])
+        cursor.executemany("INSERT INTO venues VALUES (%s, %s, %s, %s)",
+                           [(i, f"k{i}", f"場地{i}", f"臺北市松高路{i}號") for i in range(1, 2001)])
+        events = []
+        for i in range(rows):
+            if rng.random() < 0.02:
+                # 常設展：開始超過一年，結束在一年以後
+                start = today - timedelta(days=rng.randint(400, 900))
+                span = rng.randint(900, 1800)
+            else:
+                start = today + timedelta(days=rng.randint(-60, 180))
+                span = rng.randint(0, 60)
+            words = rng.sample(DEDUP_WORDS, 3)
+            events.append((
+                f"bench-{i}", "".join(words) + str(i), "活動說明" * rng.randint(5, 30) + words[0],
+                rng.randint(1, 300), rng.randint(1, 2000), start,
+                start + timedelta(days=span),
+                25.0 + rng.random() * 0.2, 121.4 + rng.random() * 0.2,
+                f"https://example.com/{i}.jpg" if rng.random() < 0.8 else "",
+                rng.choice(DEDUP_SOURCES), rng.choice(API_FIXTURE_CATEGORIES),
+                rng.choice(["臺北市", "臺北市", "新北市", "基隆市"]),
+            ))
+        cursor.executemany(
+            """INSERT INTO events (uid, activity_name, description, organizer_id, venue_id,
+                   start_date, end_date, latitude, longitude, image_url, source, category, city)
+               VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)""", events)
+        cursor.execute(f"INSERT INTO current_events ({SNAPSHOT_COLUMNS}) {SNAPSHOT_SELECT}", [today])
+        cursor.execute(
+            f"""INSERT INTO current_event_facets
+                (category, city, source, has_image, end_date, event_count)
+                {FACETS_SELECT.replace('current_events_new', 'current_events')}""")
+
+
+def _api_workload(requests: int, seed: int = 7) -> List[str]:
+    """模擬前端的請求組合：首頁與前幾頁、熱門關鍵字、附近活動、卡片預先載入的批次詳情與熱門活動詳情"""
+    rng = random.Random(seed)
+    urls = []
+    for _ in range(requests):
+        kind = rng.random()
+        if kind < 0.4:
+            urls.append(f"/api/events/?page={rng.choice([1, 1, 1, 2, 3])}&page_size=24&has_image=1")
+        elif kind < 0.65:
+            urls.append(f"/api/events/search/?q={rng.choice(DEDUP_WORDS[:6])}&page=1&page_size=24")
+        elif kind < 0.75:
+            lat, lng = rng.choice([(25.033, 121.565), (25.047, 121.517), (25.1, 121.5)])
+            urls.append(f"/api/events/nearby/?lat={lat}&lng={lng}&radius=2")
+        elif kind < 0.9:
+            first = rng.choice([0, 0, 24, 48])
+            uids = ",".join(f"bench-{i}" for i in range(first, first + 24))
+            urls.append(f"/api/events/details/?uids={uids}")
+        else:
+            urls.append(f"/api/events/bench-{rng.randint(0, 200)}/")
+    return urls
+
+
+def _latency_summary(latencies: List[float], wall: float) -> str:
+    latencies = sorted(latencies)
+    p50 = latencies[len(latencies) // 2]
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    return (f"{len(latencies) / wall:8.1f} req/s  p50 {p50 * 1000:7.1f} ms  "
+            f"p99 {p99 * 1000:7.1f} ms")
+
+
+def bench_api_load(rows: int = 100000, requests: int = 2000, concurrency: int = 64) -> None:
+    """
+    同一組請求分別以 WSGI（固定 8 條工作執行緒，類似 gunicorn --threads 8）與
+    ASGI（單一事件迴圈 + 非同步 view）處理，比較吞吐量與延遲
+
+    兩者都由 concurrency 個同時連線的用戶端送出請求，延遲從送出請求算起
+    （WSGI 包含等待工作執行緒的時間），各自先以同一組請求暖機（載入記憶體索引與連線）。
+    """
+    import asyncio
+    import types
+    from concurrent.futures import ThreadPoolExecutor
+
+    rows = min(rows, 50000)
+    setup_api_fixture(rows)
+
+    from django.conf import settings
+    from django.test import AsyncClient, Client
+    from django.urls import clear_url_caches, path
+    from theme_entertainment import async_views, views
+
+    def use_views(name, module):
+        urlconf = types.ModuleType(name)
+        urlconf.urlpatterns = [
+            path("api/events/", module.get_events),
+            path("api/events/search/", module.search_events),
+            path("api/events/nearby/", module.get_nearby_events),
+            path("api/events/details/", module.get_event_details),
+            path("api/events/<str:event_id>/", module.get_event_detail),
+        ]
+        sys.modules[name] = urlconf
+        settings.ROOT_URLCONF = name
+        clear_url_caches()
+
+    urls = _api_workload(requests)
+
+    def wsgi_request(url):
+        assert Client().get(url).status_code in (200, 404)
+
+    async def wsgi_run(batch, latencies):
+        semaphore = asyncio.Semaphore(concurrency)
+        loop = asyncio.get_running_loop()
+        with ThreadPoolExecutor(max_workers=8) as workers:
+            async def request(url):
+                async with semaphore:
+                    start = time.perf_counter()
+                    await loop.run_in_executor(workers, wsgi_request, url)
+                    latencies.append(time.perf_counter() - start)
+            await asyncio.gather(*(request(url) for url in batch))
+
+    async def asgi_run(batch, latencies):
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def request(url):
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.get(url)
+                assert response.status_code in (200, 404)
+                latencies.append(time.perf_counter() - start)
+
+        await asyncio.gather(*(request(url) for url in batch))
+
+    results = {}
+    for label, module, run in (("WSGI 同步 view", views, wsgi_run),
+                               ("ASGI 非同步 view", async_views, asgi_run)):
+        use_views(f"bench_{module.__name__.rsplit('.', 1)[-1]}_urls", module)
+        asyncio.run(run(urls[:200], []))
+        latencies = []
+        start = time.perf_counter()
+        asyncio.run(run(urls, latencies))
+        results[label] = _latency_summary(latencies, time.perf_counter() - start)
+
+    print(f"\n=== 活動 API 負載（{rows:,} 筆活動，{requests:,} 個請求，同時 {concurrency} 個，"
+          f"資料庫執行緒 {async_views.DB_THREADS}）===")
+    for label, summary in results.items():
+        print(f"{label:<20} {summary}")
+
+
+# ---------------------------------------------------------------------------
+# 行事曆（每日活動數彙總表與 GROUP BY 的比較）
+
+
+def bench_calendar(rows: int = 100000) -> None:
+    """一個月與一整年的每日活動數：彙總表查詢對比 events 的日期區間 GROUP BY"""
+    import json
+    from datetime import date, timedelta
+
+    setup_api_fixture(min(rows, 100000))
+
+    from django.db import connection
+    from django.test import RequestFactory
+    from calendar_rollup import rebuild_day_counts
+    from theme_entertainment import views
+
+    with connection.cursor() as cursor:
+        seconds, groups = _timeit(rebuild_day_counts, cursor, repeat=1)
+    print(f"\n彙總表重建：{seconds:.3f} 秒，{groups:,} 列")
+
+    factory = RequestFactory()
+    today = date.today()
+    for label, start, days in (("一個月", today.replace(day=1), 31), ("一年", today, 366)):
+        end = start + timedelta(days=days - 1)
+
+        def group_by_events():
+            with connection.cursor() as cursor:
+                cursor.execute("DROP TABLE IF EXISTS calendar_days")
+                cursor.execute("CREATE TEMP TABLE calendar_days (day DATE PRIMARY KEY)")
+                cursor.executemany("INSERT INTO calendar_days VALUES (%s)",
+                                   [(start + timedelta(days=n),) for n in range(days)])
+                cursor.execute(
+                    """SELECT d.day, COUNT(*)
+                       FROM calendar_days d
+                       JOIN events e ON e.start_date <= d.day
+                                    AND COALESCE(e.end_date, e.start_date) >= d.day
+                       WHERE e.canonical_id IS NULL
+                       GROUP BY d.day""")
+                return {str(day): count for day, count in cursor.fetchall()}
+
+        def rollup():
+            request = factory.get("/api/events/calendar/", {"from": start, "to": end})
+            body = json.loads(views.get_event_calendar(request).content)
+            return {day["date"]: day["count"] for day in body["days"] if day["count"]}
+
+        group_seconds, expected = _timeit(group_by_events)
+        rollup_seconds, actual = _timeit(rollup)
+        assert actual == expected, "彙總表與 GROUP BY 的結果不一致"
+        print(f"\n=== 行事曆 {label}（{rows:,} 筆活動，{days} 天）===")
+        print(f"{'events GROUP BY':<24} {group_seconds * 1000:8.1f} ms")
+        print(f"{'event_day_counts 彙總表':<24} {rollup_seconds * 1000:8.1f} ms  "
+              f"x{group_seconds / rollup_seconds:.1f}")
+
+
+# ---------------------------------------------------------------------------
+# 活動列表的記憶體索引（與查詢資料庫的比較）
+
+
+def bench_event_index(rows: int = 50000, requests: int = 500) -> None:
+    """列表、篩選與搜尋：查詢 current_events 對比記憶體索引，並確認兩者回應完全相同"""
+    setup_api_fixture(min(rows, 100000))
+
+    from django.conf import settings
+    from django.db import connection
+    from django.test import RequestFactory
+    from django.test.utils import CaptureQueriesContext
+    from theme_entertainment import event_index, views
+
+    rng = random.Random(11)
+    urls = []
+    for _ in range(requests):
+        kind = rng.random()
+        if kind < 0.3:
+            urls.append(f"/api/events/?page={rng.choice([1, 2, 3])}&page_size=24&has_image=1")
+        elif kind < 0.55:
+            urls.append(f"/api/events/?q={rng.choice(DEDUP_WORDS[:6])}&page=1&page_size=24")
+        elif kind < 0.75:
+            urls.append(f"/api/events/?category={rng.choice(API_FIXTURE_CATEGORIES[:-1])}"
+                        f"&city=臺北市&page=1&page_size=24")
+        elif kind < 0.9:
+            urls.append(f"/api/events/?organizer_id={rng.randint(1, 300)}&fields=full")
+        else:
+            # 單一字與不存在的關鍵字
+            urls.append(f"/api/events/?q={rng.choice(['音', '說', 'zz'])}&page=2&page_size=24")
+    factory = RequestFactory()
+    request_list = [factory.get(url) for url in urls]
+
+    def serve():
+        return [views.get_events(request).content for request in request_list]
+
+    settings.EVENT_API_MEMORY_INDEX = False
+    db_seconds, expected = _timeit(serve)
+
+    settings.EVENT_API_MEMORY_INDEX = True
+    load_seconds, _ = _timeit(event_index.get_index, repeat=1)
+    index_seconds, actual = _timeit(serve)
+    with CaptureQueriesContext(connection) as queries:
+        serve()
+    settings.EVENT_API_MEMORY_INDEX = False
+
+    assert actual == expected, "記憶體索引與資料庫查詢的回應不一致"
+    print(f"\n索引載入：{load_seconds:.3f} 秒；使用索引時的資料庫查詢數：{len(queries)}")
+    _report(f"活動列表 {requests} 個請求", rows, {
+        "查詢 current_events": db_seconds,
+        "記憶體索引": index_seconds,
+    })
+
+
+def bench_delta_sync(rows: int = 50000, changed_ratio: float = 0.01) -> None:
+    """前端再次造訪：重新下載完整列表對比只下載上次同步之後的變更（傳輸量與耗時）"""
+    setup_api_fixture(min(rows, 100000))
+
+    from django.db import connection
+    from django.test import RequestFactory
+    from theme_entertainment import views
+
+    rng = random.Random(5)
+    with connection.cursor() as cursor:
+        # 第一次匯入：每筆目前活動各一筆變更
+        cursor.execute("INSERT INTO event_changes (uid, deleted) SELECT uid, 0 FROM current_events")
+        cursor.execute("SELECT MAX(seq), COUNT(*) FROM event_changes")
+        since, current = cursor.fetchone()
+
+        # 下一次匯入：少數活動變動或移除
+        cursor.execute("SELECT uid FROM current_events")
+        uids = [row[0] for row in cursor.fetchall()]
+        changed = rng.sample(uids, max(1, int(current * changed_ratio)))
+        removed = changed[:len(changed) // 4]
+        cursor.executemany("UPDATE current_events SET title = title || '（更新）' WHERE uid = %s",
+                           [(uid,) for uid in changed[len(removed):]])
+        cursor.executemany("DELETE FROM current_events WHERE uid = %s", [(uid,) for uid in removed])
+        cursor.executemany("INSERT INTO event_changes (uid, deleted) VALUES (%s, %s)",
+                           [(uid, int(uid in removed)) for uid in changed])
+
+    factory = RequestFactory()
+    full_request = factory.get("/api/events/", {"has_image": "1"})
+    delta_request = factory.get("/api/events/changes/", {"since": str(since)})
+    full_seconds, full = _timeit(lambda: views.get_events(full_request).content)
+    delta_seconds, delta = _timeit(lambda: views.get_event_changes(delta_request).content)
+
+    print(f"\n完整列表 {len(full) / 1024:,.0f} KB；"
+          f"變更 {len(changed)} 筆的增量同步 {len(delta) / 1024:,.1f} KB")
+    _report("再次造訪的活動下載", current, {
+        "完整列表": full_seconds,
+        "增量同步": delta_seconds,
+    })
+
+
+BENCHMARKS = {
+    "ntpc_csv": bench_ntpc_csv,
+    "dedup": bench_dedup,
+    "culture_normalize": bench_culture_normalize,
+    "culture_shards": bench_culture_shards,
+    "images": bench_images,
+    "bulk_load": bench_bulk_load,
+    "startup": bench_startup,
+    "api_load": bench_api_load,
+    "calendar": bench_calendar,
+    "event_index": bench_event_index,
+    "delta_sync": bench_delta_sync,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="匯入流程效能基準測試")
+    parser.add_argument("names", nargs="*",
+                        help=f"要執行的測試（預設全部）：{', '.join(BENCHMARKS)}")
+    parser.add_argument("--rows", type=int, default=100000, help="合成資料筆數")
+    args = parser.parse_args()
+
+    unknown = set(args.names) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"未知的測試：{', '.join(sorted(unknown))}")
+
+    for name in args.names or BENCHMARKS:
+        BENCHMARKS[name](rows=args.rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+"""
+大量匯入的快速路徑（首次回填與由原始存檔整批重建時使用）
+
+save_to_mysql 逐筆 SELECT 再 INSERT / UPDATE，適合每次只有少量變動的增量匯入；
+首次回填或整批重建改走這裡：
+1. 標準格式活動先換好維度表 id，寫成暫存 TSV
+2. LOAD DATA LOCAL INFILE 載入沒有索引的暫存表，載入完才建立 uid 索引
+3. 以一個 UPDATE ... JOIN 與一個 INSERT ... SELECT 合併到 events
+events 為空（整批重建）時，合併前先移除 events 的次要索引，寫入完成後一次建回。
+寫入結果與逐筆寫入相同；每日活動數彙總在合併後整表重新計算。
+
+MySQL 伺服器需開啟 local_infile（SET GLOBAL local_infile = 1）。
+
+用法:
+    python ingest.py replay --source culture --bulk
+"""
+import os
+import tempfile
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, TextIO
+
+import mysql.connector
+
+from archive import restore_staged
+from calendar_rollup import rebuild_day_counts
+from dimensions import event_category, event_city, event_coordinates
+from main import DB_CONFIG, INDEXES, dimension_cache, parse_date
+from retention import pack_event_ids
+
+# 暫存表與 TSV 的欄位順序
+STAGING_COLUMNS = (
+    "seq", "uid", "activity_name", "description", "organizer_id", "venue_id",
+    "start_date", "end_date", "latitude", "longitude", "ticket_price",
+    "related_link", "image_url", "source", "category", "city", "content_digest",
+)
+
+# 暫存表不建任何索引，LOAD DATA 只是依序寫入
+STAGING_TABLE = """
+    CREATE TEMPORARY TABLE events_staging (
+        seq INTEGER NOT NULL,
+        uid VARCHAR(100) NOT NULL,
+        activity_name TEXT NOT NULL,
+        description TEXT,
+        organizer_id BIGINT,
+        venue_id BIGINT,
+        start_date DATE,
+        end_date DATE,
+        latitude DECIMAL(12, 8),
+        longitude DECIMAL(12, 8),
+        ticket_price TEXT,
+        related_link TEXT,
+        image_url TEXT,
+        source VARCHAR(50),
+        category VARCHAR(50),
+        city VARCHAR(20),
+        content_digest CHAR(32)
+    )
+"""
+
+# 與 save_to_mysql 相同的更新規則：新值為空時保留舊值，有內容摘要時才更新來源與摘要
+MERGE_UPDATE = """
+    UPDATE events e
+    JOIN events_staging s ON s.uid = e.uid
+    SET e.start_date = COALESCE(s.start_date, e.start_date),
+        e.end_date = COALESCE(s.end_date, e.end_date),
+        e.ticket_price = COALESCE(NULLIF(s.ticket_price, ''), e.ticket_price),
+        e.related_link = COALESCE(NULLIF(s.related_link, ''), e.related_link),
+        e.image_url = COALESCE(NULLIF(s.image_url, ''), e.image_url),
+        e.organizer_id = COALESCE(s.organizer_id, e.organizer_id),
+        e.venue_id = COALESCE(s.venue_id, e.venue_id),
+        e.category = COALESCE(s.category, e.category),
+        e.city = COALESCE(s.city, e.city),
+        e.source = IF(s.content_digest IS NULL, e.source, s.source),
+        e.content_digest = COALESCE(s.content_digest, e.content_digest)
+"""
+
+MERGE_INSERT = """
+    INSERT INTO events
+        (uid, activity_name, description, organizer_id, venue_id,
+         start_date, end_date, latitude, longitude,
+         ticket_price, related_link, image_url,
+         source, category, city, content_digest)
+    SELECT s.uid, s.activity_name, s.description, s.organizer_id, s.venue_id,
+           s.start_date, s.end_date, s.latitude, s.longitude,
+           s.ticket_price, s.related_link, s.image_url,
+           s.source, s.category, s.city, s.content_digest
+    FROM events_staging s
+    LEFT JOIN events e ON e.uid = s.uid
+    WHERE e.id IS NULL
+    ORDER BY s.seq
+"""
+
+# 外鍵需要的索引不能移除
+KEEP_INDEXES = {"idx_events_organizer_id", "idx_events_venue_id"}
+
+# LOAD DATA 預設的跳脫規則（ESCAPED BY '\\'），NULL 寫成 \N
+TSV_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r", "\0": "\\0"})
+
+
+def connect_for_bulk_load() -> mysql.connector.connection.MySQLConnection:
+    """允許 LOAD DATA LOCAL INFILE 的資料庫連線"""
+    return mysql.connector.connect(**DB_CONFIG, allow_local_infile=True)
+
+
+def _tsv_value(value: Any) -> str:
+    if value is None:
+        return "\\N"
+    return str(value).translate(TSV_ESCAPES)
+
+
+def staging_rows(data: Dict[str, Any], cursor) -> Iterator[tuple]:
+    """
+    標準格式活動轉成暫存表的列
+
+    同一個 uid 出現多次時只保留最後一筆的內容（與逐筆寫入後的結果相同），
+    順序則依第一次出現的位置，供 run_event_sets 記錄顯示順序。
+    """
+    latest: Dict[str, Dict[str, Any]] = {}
+    for event in data["result"]:
+        latest[str(event.get("uid", ""))] = event
+
+    source = data.get("source")
+    for seq, (uid, event) in enumerate(latest.items()):
+        organizer_id, venue_id = dimension_cache.ids_for(cursor, event)
+        yield (seq, uid, event.get("title", ""), event.get("description", ""),
+               organizer_id, venue_id,
+               parse_date(event.get("startDate")), parse_date(event.get("endDate")),
+               *event_coordinates(event),
+               event.get("price", ""), event.get("url", ""), event.get("imageUrl", ""),
+               source, event_category(event) or None, event_city(event) or None,
+               event.get("contentDigest"))
+
+
+def write_staging_tsv(rows: Iterator[tuple], f: TextIO) -> int:
+    """將暫存列寫成 LOAD DATA 格式的 TSV，回傳筆數"""
+    count = 0
+    for row in rows:
+        f.write("\t".join(_tsv_value(value) for value in row))
+        f.write("\n")
+        count += 1
+    return count
+
+
+def _deferrable_indexes(cursor) -> List[tuple]:
+    """events 目前存在、可以暫時移除的次要索引"""
+    cursor.execute(
+        """SELECT DISTINCT INDEX_NAME FROM information_schema.STATISTICS
+           WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'events'"""
+    )
+    existing = {name for (name,) in cursor.fetchall()}
+    return [(name, columns) for table, name, columns in INDEXES
+            if table == "events" and name in existing and name not in KEEP_INDEXES]
+
+
+def _add_indexes(cursor, indexes: List[tuple]) -> None:
+    # 一個 ALTER TABLE 建立全部索引，資料表只需掃描一次
+    cursor.execute("ALTER TABLE events " + ", ".join(
+        f"ADD INDEX {name} ({columns})" for name, columns in indexes))
+
+
+def bulk_save(data: Dict[str, Any], connection: mysql.connector.connection.MySQLConnection,
+              rollup: bool = True) -> int:
+    """
+    以 LOAD DATA 與集合式合併寫入一批標準格式活動（資料格式與 save_to_mysql 相同）
+
+    連續寫入多批時可傳 rollup=False，最後再呼叫一次 rebuild_day_counts。
+
+    Returns:
+        int: 寫入暫存表的活動數
+    """
+    if not data or not data.get("result"):
+        return 0
+
+    cursor = None
+    path = None
+    dropped: List[tuple] = []
+    try:
+        cursor = connection.cursor(buffered=True)
+
+        with tempfile.NamedTemporaryFile("w", encoding="utf-8", newline="\n",
+                                         suffix=".tsv", delete=False) as f:
+            path = f.name
+            count = write_staging_tsv(staging_rows(data, cursor), f)
+
+        cursor.execute("DROP TEMPORARY TABLE IF EXISTS events_staging")
+        cursor.execute(STAGING_TABLE)
+        cursor.execute(
+            f"""LOAD DATA LOCAL INFILE %s INTO TABLE events_staging
+                CHARACTER SET utf8mb4
+                FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\'
+                LINES TERMINATED BY '\\n'
+                ({', '.join(STAGING_COLUMNS)})""",
+            (path,)
+        )
+        # 載入後才建立合併需要的索引
+        cursor.execute("ALTER TABLE events_staging ADD INDEX idx_staging_uid (uid)")
+
+        # 已封存的活動先搬回 events，合併時與其他既有活動相同處理
+        restore_staged(cursor)
+        cursor.execute("SELECT 1 FROM events LIMIT 1")
+        rebuild = cursor.fetchone() is None
+        if rebuild:
+            # ALTER TABLE 會隱含提交，維度表已新增的列先提交
+            dropped = _deferrable_indexes(cursor)
+            for name, _ in dropped:
+                cursor.execute(f"ALTER TABLE events DROP INDEX {name}")
+        else:
+            cursor.execute(MERGE_UPDATE)
+        cursor.execute(MERGE_INSERT)
+        connection.commit()
+
+        if dropped:
+            _add_indexes(cursor, dropped)
+            dropped = []
+
+        # 與 save_to_mysql 相同的匯入紀錄
+        current_time = datetime.now()
+        cursor.execute(
+            "INSERT INTO import_dates (import_date, timezone_type, timezone) VALUES (%s, %s, %s)",
+            (current_time, 3, "Asia/Taipei")
+        )
+        cursor.execute(
+            """INSERT INTO query_results (query_timestamp, limit_count, offset_count,
+                   total_count, sort_order, created_at) VALUES (%s, %s, %s, %s, %s, %s)""",
+            (data.get("queryTime", current_time.strftime("%Y-%m-%d %H:%M:%S")),
+             data.get("limit", 0), data.get("offset", 0), data.get("total", 0),
+             data.get("sort", ""), current_time)
+        )
+        query_id = cursor.lastrowid
+        cursor.execute(
+            """SELECT MIN(e.id) FROM events_staging s
+               JOIN events e ON e.uid = s.uid
+               GROUP BY s.seq ORDER BY s.seq"""
+        )
+        event_ids = [event_id for (event_id,) in cursor.fetchall()]
+        cursor.execute(
+            """INSERT INTO run_event_sets (query_id, created_at, event_count, event_ids)
+               VALUES (%s, %s, %s, %s)""",
+            (query_id, current_time, len(event_ids), pack_event_ids(event_ids))
+        )
+
+        # 集合式合併不逐筆追蹤區間變動，每日活動數直接重新計算
+        if rollup:
+            rebuild_day_counts(cursor)
+        cursor.execute("DROP TEMPORARY TABLE events_staging")
+        connection.commit()
+        print(f"{data.get('source')} 大量匯入完成：{count} 筆")
+        return count
+
+    except Exception:
+        connection.rollback()
+        dimension_cache.reset()
+        raise
+    finally:
+        if dropped and cursor:
+            # 合併失敗時仍要把移除的索引建回
+            _add_indexes(cursor, dropped)
+        if cursor:
+            cursor.close()
+        if path:
+            os.remove(path)
@@ -0,0 +1,250 @@
+"""
+每日活動數彙總（行事曆用）
+
+event_day_counts 以 (日期, 來源, 縣市, 類別) 為鍵，記錄當天進行中的活動數。
+匯入時依每筆活動的起訖日期增減：新增的活動區間內每天 +1，日期、來源、縣市
+或類別變動時先扣掉舊區間再加上新區間；被標記為重複的活動不計入。
+超過 MAX_SPAN_DAYS 天的活動（常設展等）不展開成每日列，改以整段區間記在
+event_day_ranges，行事曆查詢時再把涵蓋查詢區間的部分加進每天的數量。
+行事曆 API 直接讀這兩張表，不必對 events 做日期區間的 GROUP BY。
+
+用法:
+    python calendar_rollup.py --rebuild
+"""
+import argparse
+from collections import Counter
+from datetime import date, timedelta
+from typing import Iterable, List, Optional, Tuple, Union
+
+# 區間不超過這個天數的活動展開成每日列；更長的活動（常設展可能長達數年）記成區間列
+MAX_SPAN_DAYS = 366
+
+RollupKey = Tuple[str, str, str]
+
+
+def rollup_key(source: Optional[str], city: Optional[str],
+               category: Optional[str]) -> RollupKey:
+    """活動在彙總表中的 (來源, 縣市, 類別)；來源只取提供者（culture:1 → culture）"""
+    return (source or '').split(':', 1)[0], city or '', category or ''
+
+
+def _as_date(value: Union[date, str, None]) -> Optional[date]:
+    if value is None or isinstance(value, date):
+        return value
+    return date.fromisoformat(value)
+
+
+def event_span(start: Union[date, str, None],
+               end: Union[date, str, None]) -> Optional[Tuple[date, date]]:
+    """活動的起訖日期（沒有結束日期時只算開始當天），沒有開始日期時回傳 None"""
+    start, end = _as_date(start), _as_date(end)
+    if start is None:
+        return None
+    if end is None or end < start:
+        end = start
+    return start, end
+
+
+def event_days(start: Union[date, str, None], end: Union[date, str, None]) -> List[date]:
+    """活動進行中的每一天"""
+    span = event_span(start, end)
+    if span is None:
+        return []
+    return [span[0] + timedelta(days=offset) for offset in range((span[1] - span[0]).days + 1)]
+
+
+class DayCountDelta:
+    """一次交易內累積的每日活動數與長區間活動數增減，提交前以 apply 寫回"""
+
+    def __init__(self):
+        self.counts: Counter = Counter()
+        self.ranges: Counter = Counter()
+
+    def add(self, start, end, key: RollupKey, sign: int = 1) -> None:
+        span = event_span(start, end)
+        if span is None:
+            return
+        if (span[1] - span[0]).days >= MAX_SPAN_DAYS:
+            self.ranges[(*span, *key)] += sign
+            return
+        for day in event_days(*span):
+            self.counts[(day, *key)] += sign
+
+    def move(self, old: tuple, new: tuple) -> None:
+        """活動由 (start, end, key) 的舊區間移到新區間"""
+        old = (_as_date(old[0]), _as_date(old[1]), old[2])
+        new = (_as_date(new[0]), _as_date(new[1]), new[2])
+        if old != new:
+            self.add(*old, sign=-1)
+            self.add(*new)
+
+    def apply(self, cursor) -> int:
+        """
+        將增減寫回 event_day_counts 與 event_day_ranges，並刪除歸零的列
+
+        Returns:
+            int: 異動的列數
+        """
+        rows = [(*key, count) for key, count in self.counts.items() if count]
+        ranges = [(*key, count) for key, count in self.ranges.items() if count]
+        if rows:
+            cursor.executemany(
+                """INSERT INTO event_day_counts (day, source, city, category, event_count)
+                   VALUES (%s, %s, %s, %s, %s)
+                   ON DUPLICATE KEY UPDATE event_count = event_count + VALUES(event_count)""",
+                rows
+            )
+            decreased = [row[0] for row in rows if row[-1] < 0]
+            if decreased:
+                cursor.execute(
+                    "DELETE FROM event_day_counts WHERE day BETWEEN %s AND %s AND event_count <= 0",
+                    (min(decreased), max(decreased))
+                )
+        if ranges:
+            cursor.executemany(
+                """INSERT INTO event_day_ranges
+                       (start_day, end_day, source, city, category, event_count)
+                   VALUES (%s, %s, %s, %s, %s, %s)
+                   ON DUPLICATE KEY UPDATE event_count = event_count + VALUES(event_count)""",
+                ranges
+            )
+            if any(row[-1] < 0 for row in ranges):
+                cursor.execute("DELETE FROM event_day_ranges WHERE event_count <= 0")
+        self.counts.clear()
+        self.ranges.clear()
+        return len(rows) + len(ranges)
+
+
+EVENT_SPAN_SELECT = "SELECT start_date, end_date, source, city, category FROM events"
+ARCHIVE_SPAN_SELECT = "SELECT start_date, end_date, source, city, category FROM events_archive"
+
+
+def adjust_for_events(cursor, event_ids: Iterable[int], sign: int,
+                      batch_size: int = 1000) -> int:
+    """
+    將指定活動整段區間加入（sign=1）或移出（sign=-1）彙總，供重複比對改變代表活動時使用
+    """
+    event_ids = list(event_ids)
+    delta = DayCountDelta()
+    for offset in range(0, len(event_ids), batch_size):
+        batch = event_ids[offset:offset + batch_size]
+        placeholders = ', '.join(['%s'] * len(batch))
+        cursor.execute(f"{EVENT_SPAN_SELECT} WHERE id IN ({placeholders})", batch)
+        for start, end, *key in cursor.fetchall():
+            delta.add(start, end, rollup_key(*key), sign)
+    return delta.apply(cursor)
+
+
+# 日期運算在 MySQL 與 SQLite（基準測試）的寫法不同，其餘 SQL 兩邊共用
+DATE_SQL = {
+    'mysql': {'span_days': "DATEDIFF({end}, {start})",
+              'add_days': "{start} + INTERVAL {days} DAY"},
+    'sqlite': {'span_days': "CAST(julianday({end}) - julianday({start}) AS INTEGER)",
+               'add_days': "date({start}, '+' || {days} || ' days')"},
+}
+
+
+def _dialect(cursor) -> str:
+    """Django 的 cursor 帶有連線的 vendor；mysql.connector 的 cursor 一律視為 MySQL"""
+    vendor = getattr(getattr(cursor, 'db', None), 'vendor', 'mysql')
+    return vendor if vendor in DATE_SQL else 'mysql'
+
+
+def _spans_cte(dialect: str) -> str:
+    """未重複活動（含封存）的起訖日期、天數差與彙總鍵，與 event_span、rollup_key 的規則相同"""
+    end = "CASE WHEN end_date IS NULL OR end_date < start_date THEN start_date ELSE end_date END"
+    span_days = DATE_SQL[dialect]['span_days'].format(start="start_date", end=end)
+    selects = [
+        f"""SELECT start_date AS start_day, {end} AS end_day, {span_days} AS span_days,
+                   CASE WHEN INSTR(source, ':') > 0 THEN SUBSTR(source, 1, INSTR(source, ':') - 1)
+                        ELSE COALESCE(source, '') END AS source,
+                   COALESCE(city, '') AS city, COALESCE(category, '') AS category
+            FROM {table}
+            WHERE canonical_id IS NULL AND start_date IS NOT NULL"""
+        # 已封存的活動仍計入歷史的每日活動數
+        for table in ("events", "events_archive")
+    ]
+    return "spans AS (" + " UNION ALL ".join(selects) + ")"
+
+
+def rebuild_day_counts(cursor) -> int:
+    """
+    由 events 與 events_archive 全部重新計算彙總表（首次建立或修復時使用）
+
+    整個重建在資料庫內以兩句 INSERT ... SELECT 完成：短區間活動與 0..MAX_SPAN_DAYS-1
+    的日數序列 JOIN 展開成每日列，長區間活動直接 GROUP BY 成區間列。
+
+    Returns:
+        int: 彙總表的列數（每日列加上長區間列）
+    """
+    dialect = _dialect(cursor)
+    spans = _spans_cte(dialect)
+    day = DATE_SQL[dialect]['add_days'].format(start="spans.start_day", days="day_numbers.n")
+
+    cursor.execute("DELETE FROM event_day_counts")
+    cursor.execute("DELETE FROM event_day_ranges")
+    cursor.execute(
+        f"""INSERT INTO event_day_counts (day, source, city, category, event_count)
+            WITH RECURSIVE day_numbers (n) AS (
+                SELECT 0 UNION ALL SELECT n + 1 FROM day_numbers WHERE n < {MAX_SPAN_DAYS - 1}
+            ), {spans}
+            SELECT {day} AS day, spans.source, spans.city, spans.category, COUNT(*)
+            FROM spans
+            JOIN day_numbers ON day_numbers.n <= spans.span_days
+            WHERE spans.span_days < {MAX_SPAN_DAYS}
+            GROUP BY {day}, spans.source, spans.city, spans.category"""
+    )
+    total = cursor.rowcount
+    cursor.execute(
+        f"""INSERT INTO event_day_ranges (start_day, end_day, source, city, category, event_count)
+            WITH {spans}
+            SELECT start_day, end_day, source, city, category, COUNT(*)
+            FROM spans
+            WHERE span_days >= {MAX_SPAN_DAYS}
+            GROUP BY start_day, end_day, source, city, category"""
+    )
+    return total + cursor.rowcount
+
+
+def ensure_day_counts(cursor) -> None:
+    """
+    彙總表是空的而 events 已有資料時（剛升級的資料庫）先完整建立一次；
+    舊版彙總表只計入長區間活動開始後的一年，有長區間活動卻沒有區間列時也重新計算
+    """
+    cursor.execute("SELECT 1 FROM event_day_counts LIMIT 1")
+    if cursor.fetchone():
+        cursor.execute("SELECT 1 FROM event_day_ranges LIMIT 1")
+        if cursor.fetchone():
+            return
+        cursor.execute(
+            "SELECT 1 FROM events WHERE canonical_id IS NULL AND end_date >= start_date + INTERVAL %s DAY LIMIT 1",
+            (MAX_SPAN_DAYS,)
+        )
+        if not cursor.fetchone():
+            return
+    else:
+        cursor.execute("SELECT 1 FROM events LIMIT 1")
+        if not cursor.fetchone():
+            return
+    print(f"已建立每日活動數彙總：{rebuild_day_counts(cursor)} 列")
+
+
+if __name__ == "__main__":
+    from main import connect_to_mysql
+
+    parser = argparse.ArgumentParser(description="每日活動數彙總維護")
+    parser.add_argument("--rebuild", action="store_true", help="由 events 與 events_archive 全部重新計算")
+    args = parser.parse_args()
+    if not args.rebuild:
+        parser.error("請指定 --rebuild")
+
+    connection = connect_to_mysql()
+    cursor = None
+    try:
+        cursor = connection.cursor(buffered=True)
+        print(f"每日活動數彙總重建完成：{rebuild_day_counts(cursor)} 列")
+        connection.commit()
+    finally:
+        if cursor:
+            cursor.close()
+        connection.close()
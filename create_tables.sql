@@ -1,9 +1,27 @@
--- 創建資料表來儲存匯入時間資訊
+-- 創建資料表來儲存匯入時間資訊（依月份分區，由 retention.py 維護）
 CREATE TABLE IF NOT EXISTS import_dates (
-    id BIGINT PRIMARY KEY AUTO_INCREMENT,
+    id BIGINT AUTO_INCREMENT,
     import_date DATETIME NOT NULL,
     timezone_type INTEGER NOT NULL,
-    timezone VARCHAR(50) NOT NULL
+    timezone VARCHAR(50) NOT NULL,
+    PRIMARY KEY (id, import_date)
+)
+PARTITION BY RANGE COLUMNS(import_date) (
+    PARTITION pmax VALUES LESS THAN MAXVALUE
+);
+-- 創建主辦單位維度表
+CREATE TABLE IF NOT EXISTS organizers (
+    id BIGINT PRIMARY KEY AUTO_INCREMENT,
+    name VARCHAR(200) NOT NULL,
+    UNIQUE KEY uq_organizers_name (name)
+);
+-- 創建場地維度表（以場地名稱＋地址的摘要識別）
+CREATE TABLE IF NOT EXISTS venues (
+    id BIGINT PRIMARY KEY AUTO_INCREMENT,
+    venue_key CHAR(32) NOT NULL,
+    name VARCHAR(200) NOT NULL,
+    address TEXT,
+    UNIQUE KEY uq_venues_key (venue_key)
 );
 -- 創建主要的活動/展覽資訊表
 CREATE TABLE IF NOT EXISTS events (
@@ -11,34 +29,175 @@ CREATE TABLE IF NOT EXISTS events (
     uid VARCHAR(100) NOT NULL,
     activity_name TEXT NOT NULL,
     description TEXT,
-    organizer VARCHAR(200),
-    address TEXT,
+    organizer_id BIGINT,
+    venue_id BIGINT,
     start_date DATE,
     end_date DATE,
-    location VARCHAR(200),
     latitude DECIMAL(12, 8),
     longitude DECIMAL(12, 8),
     ticket_price TEXT,
     related_link TEXT,
     image_url TEXT,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    source VARCHAR(50),
+    content_digest CHAR(32),
+    thumb_key CHAR(64),
+    image_width INTEGER,
+    image_height INTEGER,
+    image_dead TINYINT(1) NOT NULL DEFAULT 0,
+    canonical_id BIGINT,
+    category VARCHAR(50),
+    city VARCHAR(20),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (organizer_id) REFERENCES organizers(id),
+    FOREIGN KEY (venue_id) REFERENCES venues(id)
+);
+-- 創建已結束活動的封存表（欄位與 events 相同，保留原本的 id；由 archive.py 把結束一段時間的活動搬過來）
+CREATE TABLE IF NOT EXISTS events_archive (
+    id BIGINT PRIMARY KEY,
+    uid VARCHAR(100) NOT NULL,
+    activity_name TEXT NOT NULL,
+    description TEXT,
+    organizer_id BIGINT,
+    venue_id BIGINT,
+    start_date DATE,
+    end_date DATE,
+    latitude DECIMAL(12, 8),
+    longitude DECIMAL(12, 8),
+    ticket_price TEXT,
+    related_link TEXT,
+    image_url TEXT,
+    source VARCHAR(50),
+    content_digest CHAR(32),
+    thumb_key CHAR(64),
+    image_width INTEGER,
+    image_height INTEGER,
+    image_dead TINYINT(1) NOT NULL DEFAULT 0,
+    canonical_id BIGINT,
+    category VARCHAR(50),
+    city VARCHAR(20),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    KEY idx_events_archive_uid (uid),
+    KEY idx_events_archive_start_date (start_date)
+);
+-- 創建圖片處理紀錄表（以網址雜湊去除重複下載）
+CREATE TABLE IF NOT EXISTS image_assets (
+    url_hash CHAR(40) PRIMARY KEY,
+    url TEXT NOT NULL,
+    thumb_key CHAR(64),
+    width INTEGER,
+    height INTEGER,
+    dead TINYINT(1) NOT NULL DEFAULT 0,
+    checked_at DATETIME NOT NULL
+);
+-- 創建地理編碼快取表（以正規化後的場地名稱＋地址雜湊識別，每個地址只解析一次）
+CREATE TABLE IF NOT EXISTS geocode_cache (
+    address_hash CHAR(40) PRIMARY KEY,
+    query_text VARCHAR(500) NOT NULL,
+    latitude DECIMAL(12, 8),
+    longitude DECIMAL(12, 8),
+    match_level VARCHAR(10),
+    gazetteer_version CHAR(16) NOT NULL,
+    resolved_at DATETIME NOT NULL
+);
+-- 創建各資料來源的同步水位表（增量匯入用）
+CREATE TABLE IF NOT EXISTS sync_watermarks (
+    source VARCHAR(50) PRIMARY KEY,
+    last_sync_at DATETIME NOT NULL,
+    content_digest CHAR(32),
+    last_offset INTEGER NOT NULL DEFAULT 0,
+    record_count INTEGER NOT NULL DEFAULT 0
 );
--- 創建查詢結果資訊表
+-- 創建查詢結果資訊表（依月份分區，由 retention.py 維護）
 CREATE TABLE IF NOT EXISTS query_results (
-    id BIGINT PRIMARY KEY AUTO_INCREMENT,
+    id BIGINT AUTO_INCREMENT,
     query_timestamp VARCHAR(50) NOT NULL,
     limit_count INTEGER NOT NULL,
     offset_count INTEGER NOT NULL,
     total_count INTEGER NOT NULL,
     sort_order VARCHAR(50),
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, created_at)
+)
+PARTITION BY RANGE COLUMNS(created_at) (
+    PARTITION pmax VALUES LESS THAN MAXVALUE
 );
--- 創建關聯表，連接查詢結果和事件
-CREATE TABLE IF NOT EXISTS query_event_relations (
+-- 創建每次查詢包含的活動清單（一次匯入一列，活動 id 依顯示順序壓縮存放）
+CREATE TABLE IF NOT EXISTS run_event_sets (
     query_id BIGINT NOT NULL,
+    created_at DATETIME NOT NULL,
+    event_count INTEGER NOT NULL,
+    event_ids MEDIUMBLOB NOT NULL,
+    PRIMARY KEY (query_id, created_at)
+)
+PARTITION BY RANGE COLUMNS(created_at) (
+    PARTITION pmax VALUES LESS THAN MAXVALUE
+);
+-- 創建目前與即將舉行活動的讀取表（反正規化、依顯示順序排好，由 current_events.py 每次匯入後整表重建並換上）
+CREATE TABLE IF NOT EXISTS current_events (
+    position INTEGER PRIMARY KEY AUTO_INCREMENT,
     event_id BIGINT NOT NULL,
-    display_order INTEGER NOT NULL,
-    PRIMARY KEY (query_id, event_id),
-    FOREIGN KEY (query_id) REFERENCES query_results(id),
-    FOREIGN KEY (event_id) REFERENCES events(id)
-);
\ No newline at end of file
+    uid VARCHAR(100) NOT NULL,
+    title TEXT NOT NULL,
+    description TEXT,
+    organizer_id BIGINT,
+    organizer VARCHAR(200),
+    venue_id BIGINT,
+    location VARCHAR(200),
+    address TEXT,
+    start_date DATE,
+    end_date DATE,
+    latitude DECIMAL(12, 8),
+    longitude DECIMAL(12, 8),
+    ticket_price TEXT,
+    related_link TEXT,
+    image_url TEXT,
+    thumb_key CHAR(64),
+    has_image TINYINT(1) NOT NULL DEFAULT 0,
+    source VARCHAR(20),
+    category VARCHAR(50),
+    city VARCHAR(20),
+    UNIQUE KEY uq_current_events_uid (uid),
+    KEY idx_current_events_image (has_image, position),
+    KEY idx_current_events_organizer (organizer_id, position),
+    KEY idx_current_events_venue (venue_id, position),
+    KEY idx_current_events_category (category, position),
+    KEY idx_current_events_city (city, position),
+    KEY idx_current_events_source (source, position)
+);
+-- 創建目前活動的分面統計表（類別 × 縣市 × 來源 × 圖片 × 結束日期的活動數，與 current_events 一起重建並換上）
+CREATE TABLE IF NOT EXISTS current_event_facets (
+    category VARCHAR(50),
+    city VARCHAR(20),
+    source VARCHAR(20),
+    has_image TINYINT(1) NOT NULL DEFAULT 0,
+    end_date DATE,
+    event_count INTEGER NOT NULL
+);
+-- 創建目前活動的變更紀錄（current_events 每次換上新版時記錄新增、變動與移除的活動，供前端增量同步）
+CREATE TABLE IF NOT EXISTS event_changes (
+    seq BIGINT PRIMARY KEY AUTO_INCREMENT,
+    uid VARCHAR(100) NOT NULL,
+    deleted TINYINT(1) NOT NULL DEFAULT 0,
+    changed_at DATETIME NOT NULL,
+    KEY idx_event_changes_changed_at (changed_at)
+);
+-- 創建每日活動數彙總表（行事曆用，由匯入流程依活動起訖日期增量維護，見 calendar_rollup.py）
+CREATE TABLE IF NOT EXISTS event_day_counts (
+    day DATE NOT NULL,
+    source VARCHAR(20) NOT NULL,
+    city VARCHAR(20) NOT NULL DEFAULT '',
+    category VARCHAR(50) NOT NULL DEFAULT '',
+    event_count INTEGER NOT NULL,
+    PRIMARY KEY (day, source, city, category)
+);
+-- 創建長區間活動數彙總表（超過一年的活動不展開成每日列，以整段區間計數，見 calendar_rollup.py）
+CREATE TABLE IF NOT EXISTS event_day_ranges (
+    start_day DATE NOT NULL,
+    end_day DATE NOT NULL,
+    source VARCHAR(20) NOT NULL,
+    city VARCHAR(20) NOT NULL DEFAULT '',
+    category VARCHAR(50) NOT NULL DEFAULT '',
+    event_count INTEGER NOT NULL,
+    PRIMARY KEY (start_day, end_day, source, city, category),
+    KEY idx_event_day_ranges_end (end_day)
+);
@@ -1,11 +1,31 @@
-import requests
+import asyncio
 import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from itertools import islice
 import os
-from typing import Optional
-from requests.adapters import HTTPAdapter
-from urllib3.util import Retry
-import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from http_client import get_client, HttpError
+
+# 標準格式活動的欄位順序（平行正規化時以 tuple 傳回，減少跨行程傳輸量）
+EVENT_FIELDS = ("uid", "title", "description", "organizer", "address", "startDate",
+                "endDate", "location", "latitude", "longitude", "price", "url", "imageUrl",
+                "category")
+
+# 文化部展演資訊的類別代碼（查詢參數 category 與每筆資料的 category 欄位）
+CULTURE_CATEGORIES = {
+    "1": "音樂", "2": "戲劇", "3": "舞蹈", "4": "親子", "5": "獨立音樂",
+    "6": "展覽", "7": "講座", "8": "電影", "11": "綜藝", "13": "競賽",
+    "14": "徵選", "15": "其他", "17": "演唱會", "19": "研習課程",
+}
+
+# 依類別分片抓取時同時下載的分片數（主機另有限流與連線數上限）
+SHARD_CONCURRENCY = 4
+
+# 平行正規化的預設工作行程數與每批筆數
+NORMALIZE_WORKERS = os.cpu_count() or 1
+NORMALIZE_CHUNK_SIZE = 500
 
 
 def convert_date_format(date_str: str) -> str:
@@ -60,96 +80,150 @@ def validate_coordinate(value: float, is_latitude: bool = True) -> Optional[floa
         return None
 
 
+def filter_event_data(event: Dict[str, Any]) -> Dict[str, Any]:
+    """擷取展演資料需要的欄位並轉換 showInfo 中的日期"""
+    # 提取 showInfo 中的資料
+    show_info_list = []
+    if 'showInfo' in event:
+        for show in event['showInfo']:
+            # 檢查並安全地獲取時間資訊
+            start_date = show.get('time', {})
+            end_date = show.get('endTime', {})
+
+            show_info = {
+                '活動起始日期': convert_date_format(start_date),
+                '活動結束日期': convert_date_format(end_date),
+                '地址': show.get('location', ''),
+                '場地名稱': show.get('locationName', ''),
+                '是否售票': show.get('onSales', ''),
+                '緯度': show.get('latitude', ''),
+                '經度': show.get('longitude', ''),
+                '票價': show.get('price', '')
+            }
+            show_info_list.append(show_info)
+
+    # 取得圖片連結並加上基礎網址
+    image_url = event.get('imageURL', '')
+    if image_url and not image_url.startswith('http'):
+        image_url = f"https://cloud.culture.tw{image_url}"
+
+    # 建立過濾後的資料結構
+    filtered_data = {
+        'UID': event.get('UID', ''),
+        '活動名稱': event.get('title', ''),
+        '演出單位': event.get('showUnit', ''),
+        '簡介說明': event.get('descriptionFilterHtml', ''),
+        '圖片連結': image_url,
+        '主辦單位': event.get('masterUnit', ''),
+        '相關資訊': show_info_list
+    }
+    return filtered_data
+
+
+def normalize_culture_event(event: Dict[str, Any]) -> Tuple:
+    """將一筆展演原始資料轉成依 EVENT_FIELDS 排列的標準格式 tuple"""
+    category = CULTURE_CATEGORIES.get(str(event.get('category', '')), '')
+    event = filter_event_data(event)
+    # 使用第一個 showInfo 的資訊（如果有的話）
+    show_info = event['相關資訊'][0] if event['相關資訊'] else {}
+
+    return (
+        str(event['UID']),  # 確保是字串
+        str(event['活動名稱']),
+        str(event['簡介說明']),
+        str(event['主辦單位']),
+        str(show_info.get('地址', '')),
+        show_info.get('活動起始日期'),
+        show_info.get('活動結束日期'),
+        str(show_info.get('場地名稱', '')),
+        validate_coordinate(show_info.get('緯度'), True),
+        validate_coordinate(show_info.get('經度'), False),
+        str(show_info.get('票價', '')),
+        "",  # 文化部的資料沒有直接的 URL
+        str(event['圖片連結']),
+        category,
+    )
+
+
+def normalize_culture_chunk(events: List[Dict[str, Any]]) -> List[Tuple]:
+    """工作行程執行的單位：正規化一批展演資料"""
+    return [normalize_culture_event(event) for event in events]
+
+
+def _chunked(items: Iterable, size: int) -> Iterator[List]:
+    iterator = iter(items)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+_normalize_pool: Optional[ProcessPoolExecutor] = None
+_normalize_pool_workers = 0
+
+
+def get_normalize_pool(workers: int) -> ProcessPoolExecutor:
+    """取得常駐的正規化行程池（排程常駐時重複使用，不必每次重新啟動行程）"""
+    global _normalize_pool, _normalize_pool_workers
+    if _normalize_pool is None or _normalize_pool_workers != workers:
+        if _normalize_pool is not None:
+            _normalize_pool.shutdown()
+        # 不用 fork：程序中已有 HTTP 用戶端的事件迴圈執行緒，fork 出的行程可能繼承被鎖住的鎖
+        _normalize_pool = ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("forkserver"))
+        _normalize_pool_workers = workers
+    return _normalize_pool
+
+
+def normalize_culture_events(events: Iterable[Dict[str, Any]],
+                             workers: int = NORMALIZE_WORKERS,
+                             chunk_size: int = NORMALIZE_CHUNK_SIZE,
+                             category: str = "all") -> Iterator[Dict[str, Any]]:
+    """
+    正規化展演資料，依原始順序逐筆產生標準格式活動
+
+    資料量超過兩批時，分批送到行程池平行處理（不受 GIL 限制）；
+    workers 為 1 或資料量小時直接在本行程處理，省去啟動與傳輸成本。
+    資料本身沒有類別時，以查詢的類別切片（category）補上。
+    """
+    default_category = CULTURE_CATEGORIES.get(category, "")
+    events = events if isinstance(events, list) else list(events)
+    if workers <= 1 or len(events) <= chunk_size * 2:
+        chunks = map(normalize_culture_chunk, _chunked(events, chunk_size))
+    else:
+        chunks = get_normalize_pool(workers).map(
+            normalize_culture_chunk, _chunked(events, chunk_size))
+
+    for chunk in chunks:
+        for row in chunk:
+            event = dict(zip(EVENT_FIELDS, row))
+            event["category"] = event["category"] or default_category
+            yield event
+
+
 class CultureAPI:
-    def __init__(self):
+    def __init__(self, workers: int = NORMALIZE_WORKERS,
+                 chunk_size: int = NORMALIZE_CHUNK_SIZE):
         self.base_url = "https://cloud.culture.tw/frontsite/trans/SearchShowAction.do"
         self.params = {
             "method": "doFindTypeJ",
             "category": "all"
         }
 
-        # 設定重試策略
-        retry_strategy = Retry(
-            total=3,  # 最多重試3次
-            backoff_factor=1,  # 重試間隔時間
-            status_forcelist=[500, 502, 503, 504]  # 需要重試的HTTP狀態碼
-        )
+        # 共用的 HTTP 用戶端（連線池、逾時與退避重試都由它處理）
+        self.client = get_client()
 
-        # 創建帶有重試機制的 session
-        self.session = requests.Session()
-        adapter = HTTPAdapter(max_retries=retry_strategy)
-        self.session.mount("http://", adapter)
-        self.session.mount("https://", adapter)
+        # 平行正規化設定
+        self.workers = workers
+        self.chunk_size = chunk_size
 
     def make_request(self, url, params=None):
-        """發送請求並處理可能的錯誤"""
-        max_retries = 3
-        retry_delay = 5  # 秒
-        timeout = 30  # 秒
-
-        for attempt in range(max_retries):
-            try:
-                response = self.session.get(
-                    url,
-                    params=params,
-                    timeout=timeout,
-                    verify=True  # SSL 驗證
-                )
-                response.raise_for_status()
-                return response.json()
-
-            except requests.exceptions.Timeout:
-                if attempt < max_retries - 1:
-                    print(f"請求超時，{retry_delay}秒後進行第{attempt + 2}次嘗試...")
-                    time.sleep(retry_delay)
-                    continue
-                raise
-
-            except requests.exceptions.RequestException as e:
-                if attempt < max_retries - 1:
-                    print(f"請求失敗，{retry_delay}秒後進行第{
-                          attempt + 2}次嘗試... 錯誤: {e}")
-                    time.sleep(retry_delay)
-                    continue
-                raise
+        """發送請求並解析 JSON（重試與逾時由共用用戶端統一處理）"""
+        return self.client.get_json(url, params=params)
 
     def filter_event_data(self, event):
-        # 提取 showInfo 中的資料
-        show_info_list = []
-        if 'showInfo' in event:
-            for show in event['showInfo']:
-                # 檢查並安全地獲取時間資訊
-                start_date = show.get('time', {})
-                end_date = show.get('endTime', {})
-
-                show_info = {
-                    '活動起始日期': convert_date_format(start_date),
-                    '活動結束日期': convert_date_format(end_date),
-                    '地址': show.get('location', ''),
-                    '場地名稱': show.get('locationName', ''),
-                    '是否售票': show.get('onSales', ''),
-                    '緯度': show.get('latitude', ''),
-                    '經度': show.get('longitude', ''),
-                    '票價': show.get('price', '')
-                }
-                show_info_list.append(show_info)
-
-        # 取得圖片連結並加上基礎網址
-        image_url = event.get('imageURL', '')
-        if image_url and not image_url.startswith('http'):
-            image_url = f"https://cloud.culture.tw{image_url}"
-
-        # 建立過濾後的資料結構
-        filtered_data = {
-            'UID': event.get('UID', ''),
-            '活動名稱': event.get('title', ''),
-            '演出單位': event.get('showUnit', ''),
-            '簡介說明': event.get('descriptionFilterHtml', ''),
-            '圖片連結': image_url,
-            '主辦單位': event.get('masterUnit', ''),
-            '相關資訊': show_info_list
-        }
-        return filtered_data
+        return filter_event_data(event)
 
     def filter_festival_data(self, festival):
         """過濾節慶活動資料"""
@@ -168,8 +242,8 @@ class CultureAPI:
             '活動起始時間': convert_date_format(festival.get('startTime', '')),
             '活動結束時間': convert_date_format(festival.get('endTime', '')),
             '網址': festival.get('website', ''),
-            '緯度': festival.get('longitude', ''),
-            '經度': festival.get('latitude', ''),
+            '緯度': festival.get('latitude', ''),
+            '經度': festival.get('longitude', ''),
             '交通資訊': festival.get('travellinginfo', ''),
             '停車資訊': festival.get('parkinginfo', ''),
             '費用': festival.get('charge', ''),
@@ -179,73 +253,108 @@ class CultureAPI:
         }
         return filtered_data
 
+    def save_raw(self, raw_data, category):
+        """保存原始回應，之後可以直接重新正規化（不必再向上游請求）"""
+        # 建立結果資料夾（如果不存在）
+        os.makedirs("culture_api", exist_ok=True)
+
+        # 使用當前時間戳記建立檔案名稱
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        if category == "all":
+            category_name = "所有"
+        elif category == "11":
+            category_name = "文化部整合綜藝活動"
+        else:
+            category_name = f"類別{category}"
+        filename = f"culture_api/{category_name}藝文活動_{timestamp}.json"
+
+        with open(filename, "w", encoding="utf-8-sig") as f:
+            json.dump(raw_data, f, ensure_ascii=False, indent=2)
+
+        print(f"成功獲取{category_name}展演資訊，共 {
+              len(raw_data)} 筆！資料已儲存至：{filename}")
+
+    def format_events(self, events, category, total):
+        return {
+            "result": events,
+            "source": f"culture:{category}",  # 每個類別切片各自記錄同步水位
+            "queryTime": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "total": total,
+            "limit": total,
+            "offset": 0
+        }
+
     def get_events(self, category="all"):
         try:
             self.params["category"] = category
             raw_data = self.make_request(self.base_url, self.params)
-            filtered_data = [self.filter_event_data(
-                event) for event in raw_data]
-
-            # 建立結果資料夾（如果不存在）
-            os.makedirs("culture_api", exist_ok=True)
-
-            # 使用當前時間戳記建立檔案名稱
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            if category == "all":
-                category_name = "所有"
-            elif category == "11":
-                category_name = "文化部整合綜藝活動"
-            else:
-                category_name = f"類別{category}"
-            filename = f"culture_api/{category_name}藝文活動_{timestamp}.json"
-
-            # 將資料儲存為 JSON 檔案
-            with open(filename, "w", encoding="utf-8-sig") as f:
-                json.dump(filtered_data, f, ensure_ascii=False, indent=2)
-
-            print(f"成功獲取{category_name}展演資訊，共 {
-                  len(filtered_data)} 筆！資料已儲存至：{filename}")
-
-            # 將資料轉換為標準格式
-            formatted_data = {
-                "result": [],
-                "queryTime": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "total": len(filtered_data),
-                "limit": len(filtered_data),
-                "offset": 0
-            }
-
-            for event in filtered_data:
-                # 使用第一個 showInfo 的資訊（如果有的話）
-                show_info = event['相關資訊'][0] if event['相關資訊'] else {}
+            self.save_raw(raw_data, category)
 
-                # 處理經緯度
-                latitude = validate_coordinate(show_info.get('緯度'), True)
-                longitude = validate_coordinate(show_info.get('經度'), False)
-
-                formatted_event = {
-                    "uid": str(event['UID']),  # 確保是字串
-                    "title": str(event['活動名稱']),
-                    "description": str(event['簡介說明']),
-                    "organizer": str(event['主辦單位']),
-                    "address": str(show_info.get('地址', '')),
-                    "startDate": show_info.get('活動起始日期'),
-                    "endDate": show_info.get('活動結束日期'),
-                    "location": str(show_info.get('場地名稱', '')),
-                    "latitude": latitude,
-                    "longitude": longitude,
-                    "price": str(show_info.get('票價', '')),
-                    "url": "",  # 文化部的資料沒有直接的 URL
-                    "imageUrl": str(event['圖片連結'])
-                }
-                formatted_data["result"].append(formatted_event)
+            # 將資料轉換為標準格式（大量資料時以行程池平行處理）
+            return self.format_events(
+                list(normalize_culture_events(raw_data, self.workers, self.chunk_size, category)),
+                category, len(raw_data))
 
-            return formatted_data
-
-        except requests.exceptions.RequestException as e:
+        except HttpError as e:
             print(f"獲取資料時發生錯誤：{str(e)}")
             return {"result": [], "error": str(e)}
 
+    async def _fetch_shard(self, category, semaphore):
+        async with semaphore:
+            return await self.client.aio.get_json(
+                self.base_url, params={"method": "doFindTypeJ", "category": category})
+
+    def get_events_by_category(self, categories=None, concurrency=SHARD_CONCURRENCY):
+        """
+        依類別分片並行抓取展演資訊，依 CULTURE_CATEGORIES 的順序逐一正規化並產生標準格式資料
+
+        取代 category=all 再加上 category=11（後者是前者的子集，會重複下載與寫入）：
+        - 同時最多 concurrency 個分片在下載，正規化前面的分片時後面的分片繼續下載
+        - 同一 uid 出現在多個分片時固定歸給 CULTURE_CATEGORIES 中排在最前面的類別，
+          與分片完成的先後無關，events.source 與各分片的內容摘要才不會每次同步都變動
+        - 每個分片各自保存原始回應，並以 culture:<類別> 記錄同步水位
+        抓取失敗的分片印出錯誤後略過，其他分片照常產生。
+        """
+        priority = {category: index for index, category in enumerate(CULTURE_CATEGORIES)}
+        categories = sorted(categories or CULTURE_CATEGORIES,
+                            key=lambda category: priority.get(category, len(priority)))
+        semaphore = asyncio.Semaphore(concurrency)
+        futures = {category: self.client.submit(self._fetch_shard(category, semaphore))
+                   for category in categories}
+
+        seen = set()
+        duplicates = 0
+        try:
+            for category, future in futures.items():
+                try:
+                    raw_data = future.result()
+                except (HttpError, ValueError) as e:
+                    # ValueError：回應 200 但內容不是 JSON（例如維護頁面）
+                    print(f"獲取類別 {category} 展演資訊時發生錯誤：{str(e)}")
+                    continue
+                if not isinstance(raw_data, list):
+                    print(f"獲取類別 {category} 展演資訊時發生錯誤：回應格式不是活動列表")
+                    continue
+                self.save_raw(raw_data, category)
+
+                events = []
+                for event in normalize_culture_events(raw_data, self.workers, self.chunk_size, category):
+                    if event["uid"] in seen:
+                        duplicates += 1
+                        continue
+                    seen.add(event["uid"])
+                    events.append(event)
+                total = len(raw_data)
+                # 原始回應已存檔並正規化，不再保留
+                del raw_data
+                yield self.format_events(events, category, total)
+        finally:
+            # 呼叫端提早結束（或中途出錯）時取消還在下載的分片
+            for future in futures.values():
+                future.cancel()
+
+        print(f"文化部展演資訊分片抓取完成：{len(seen)} 筆，略過跨類別重複 {duplicates} 筆")
+
     def get_integrated_events(self):
         """獲取文化部整合綜藝活動資料（包含表演、美食、講座、旅遊等綜合類型之整合活動）"""
         return self.get_events(category="11")
@@ -276,6 +385,7 @@ class CultureAPI:
             # 將資料轉換為標準格式
             formatted_data = {
                 "result": [],
+                "source": "culture:festival",
                 "queryTime": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
                 "total": len(filtered_data),
                 "limit": len(filtered_data),
@@ -300,13 +410,15 @@ class CultureAPI:
                     "longitude": longitude,
                     "price": str(festival['費用']),
                     "url": str(festival['網址']),
-                    "imageUrl": str(festival['圖片連結'])
+                    "imageUrl": str(festival['圖片連結']),
+                    "category": "節慶",
+                    "city": str(festival['所在區域'])
                 }
                 formatted_data["result"].append(formatted_event)
 
             return formatted_data
 
-        except requests.exceptions.RequestException as e:
+        except HttpError as e:
             print(f"獲取資料時發生錯誤：{str(e)}")
             return {"result": [], "error": str(e)}
 
@@ -314,11 +426,8 @@ class CultureAPI:
 if __name__ == "__main__":
     api = CultureAPI()
 
-    # 獲取所有藝文活動
-    all_events = api.get_events()
-
-    # 獲取文化部整合綜藝活動
-    integrated_events = api.get_integrated_events()
+    # 依類別分片獲取所有藝文活動（包含文化部整合綜藝活動）
+    culture_shards = list(api.get_events_by_category())
 
     # 獲取文化部節慶活動
     festival_events = api.get_festival_events()
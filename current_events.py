@@ -0,0 +1,166 @@
+"""
+目前與即將舉行活動的讀取表（current_events）
+
+每次匯入結束後，把「今天仍在進行或尚未開始」的代表活動（跨來源重複者只留一筆）
+連同主辦單位、場地名稱整理成一張反正規化、已依開始日期排好順序的小表，
+先建在 current_events_new，再以一個 RENAME TABLE 原子地換上。讀取端只查這張小表，匯入期間也不會被鎖住。
+分面統計表 current_event_facets 由新的讀取表彙總而成，在同一個 RENAME TABLE 中一起換上。
+換上後與舊表逐筆比對，新增、變動與移除的活動依序記錄在 event_changes，
+前端以 /api/events/changes/?since=<seq> 只下載上次同步之後的變更。
+換上之後、記錄完成之前程序中斷時，current_events_old 會留下來，下一次更新先補記這次的變更。
+
+用法:
+    python current_events.py
+"""
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+# 寫入讀取表的欄位（順序需與 SELECT 相同）
+SNAPSHOT_COLUMNS = """
+    event_id, uid, title, description,
+    organizer_id, organizer, venue_id, location, address,
+    start_date, end_date, latitude, longitude,
+    ticket_price, related_link, image_url, thumb_key, has_image,
+    source, category, city
+"""
+
+# position 由 AUTO_INCREMENT 依 ORDER BY 順序產生，讀取端直接依 position 排序
+SNAPSHOT_SELECT = """
+    SELECT e.id, e.uid, e.activity_name, e.description,
+           e.organizer_id, o.name, e.venue_id, v.name, v.address,
+           e.start_date, e.end_date, e.latitude, e.longitude,
+           e.ticket_price, e.related_link, e.image_url, e.thumb_key,
+           (e.image_url IS NOT NULL AND e.image_url != '' AND e.image_dead = 0),
+           CASE WHEN INSTR(e.source, ':') > 0
+                THEN SUBSTR(e.source, 1, INSTR(e.source, ':') - 1) ELSE e.source END,
+           e.category, e.city
+    FROM events e
+    LEFT JOIN organizers o ON o.id = e.organizer_id
+    LEFT JOIN venues v ON v.id = e.venue_id
+    WHERE e.canonical_id IS NULL
+      AND (COALESCE(e.end_date, e.start_date) >= %s
+           OR (e.start_date IS NULL AND e.end_date IS NULL))
+    ORDER BY e.start_date IS NULL, e.start_date, e.id
+"""
+
+# 分面統計：保留結束日期與圖片欄位，讀取端仍可排除已結束的活動並篩選有圖片者
+FACETS_SELECT = """
+    SELECT category, city, source, has_image, end_date, COUNT(*)
+    FROM current_events_new
+    GROUP BY category, city, source, has_image, end_date
+"""
+
+# 前端列表用得到的欄位；任一欄位不同（NULL 視為相同值）就記錄為變動
+CHANGE_COLUMNS = (
+    "event_id", "title", "organizer_id", "organizer", "venue_id", "location",
+    "start_date", "end_date", "image_url", "thumb_key", "has_image",
+)
+
+# 變更紀錄保留天數；更久沒有同步的前端改為重新下載完整列表
+CHANGE_LOG_DAYS = 30
+
+
+def record_changes(cursor, changed_at: datetime) -> int:
+    """
+    比對剛換下的 current_events_old 與新的 current_events，記錄新增、變動與移除的活動
+
+    在換上新表之後才記錄：讀取端看到某個序號時，讀取表一定已經包含該次變更。
+
+    Returns:
+        int: 記錄的變更數
+    """
+    same = " AND ".join(f"n.{column} <=> o.{column}" for column in CHANGE_COLUMNS)
+    cursor.execute(
+        f"""INSERT INTO event_changes (uid, deleted, changed_at)
+            SELECT n.uid, 0, %s FROM current_events n
+            LEFT JOIN current_events_old o ON o.uid = n.uid
+            WHERE o.uid IS NULL OR NOT ({same})
+            ORDER BY n.position""",
+        (changed_at,)
+    )
+    count = cursor.rowcount
+    # 結束、被判定為重複或刪除的活動以墓碑記錄
+    cursor.execute(
+        """INSERT INTO event_changes (uid, deleted, changed_at)
+           SELECT o.uid, 1, %s FROM current_events_old o
+           LEFT JOIN current_events n ON n.uid = o.uid
+           WHERE n.uid IS NULL
+           ORDER BY o.position""",
+        (changed_at,)
+    )
+    return count + cursor.rowcount
+
+
+def prune_changes(cursor, days: int = CHANGE_LOG_DAYS) -> int:
+    """刪除過期的變更紀錄（保留最新一筆，讀取端才能判斷前端的序號是否已過期）"""
+    cursor.execute("SELECT MAX(seq) FROM event_changes")
+    latest = cursor.fetchone()[0]
+    if latest is None:
+        return 0
+    cursor.execute("DELETE FROM event_changes WHERE changed_at < %s AND seq < %s",
+                   (datetime.now() - timedelta(days=days), latest))
+    return cursor.rowcount
+
+
+def refresh_current_events(connection, today: Optional[date] = None) -> int:
+    """
+    重建 current_events 並以 RENAME TABLE 原子地換上
+
+    Returns:
+        int: 讀取表中的活動數
+    """
+    today = today or date.today()
+    cursor = None
+    try:
+        cursor = connection.cursor(buffered=True)
+        # 上一次換上新表之後沒有完成記錄：先補記，前端才不會留著過時的活動
+        # （若其實已記錄、只是沒刪掉舊表，重複的紀錄對前端沒有影響）
+        cursor.execute("SHOW TABLES LIKE 'current_events_old'")
+        if cursor.fetchone():
+            changes = record_changes(cursor, datetime.now())
+            connection.commit()
+            print(f"已補記上次更新讀取表的 {changes} 筆變更")
+        cursor.execute(
+            """DROP TABLE IF EXISTS current_events_new, current_events_old,
+                                    current_event_facets_new, current_event_facets_old""")
+        cursor.execute("CREATE TABLE current_events_new LIKE current_events")
+        cursor.execute("CREATE TABLE current_event_facets_new LIKE current_event_facets")
+        cursor.execute(
+            f"INSERT INTO current_events_new ({SNAPSHOT_COLUMNS}) {SNAPSHOT_SELECT}",
+            (today,)
+        )
+        count = cursor.rowcount
+        cursor.execute(
+            f"""INSERT INTO current_event_facets_new
+                (category, city, source, has_image, end_date, event_count) {FACETS_SELECT}""")
+        connection.commit()
+
+        # 新舊表在同一個敘述中互換，讀取端不會看到空表、半成品或彼此不一致的統計
+        cursor.execute(
+            """RENAME TABLE current_events TO current_events_old,
+                            current_events_new TO current_events,
+                            current_event_facets TO current_event_facets_old,
+                            current_event_facets_new TO current_event_facets""")
+        changes = record_changes(cursor, datetime.now())
+        prune_changes(cursor)
+        connection.commit()
+        cursor.execute("DROP TABLE current_events_old, current_event_facets_old")
+        print(f"已更新 current_events，共 {count} 筆目前或即將舉行的活動，{changes} 筆變更")
+        return count
+
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        if cursor:
+            cursor.close()
+
+
+if __name__ == "__main__":
+    from main import connect_to_mysql
+
+    connection = connect_to_mysql()
+    try:
+        refresh_current_events(connection)
+    finally:
+        connection.close()
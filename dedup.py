@@ -0,0 +1,236 @@
+"""
+跨來源重複活動偵測
+
+同一檔展覽常同時出現在文化部、北美館與台北市政府的資料中，但 uid 各不相同。
+這裡以「標題 n-gram ＋ 開始日期區間」與「場地 ＋ 開始日期區間」建立分塊索引，
+只比較落在同一分塊的候選配對（不做全配對比較），評分後以聯集尋找把重複活動
+串成群組，群組內選一筆作為代表，其餘的 events.canonical_id 指向代表活動。
+
+用法:
+    python dedup.py
+"""
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from calendar_rollup import adjust_for_events
+
+# 標題 n-gram 長度（中文標題以兩字為單位最能容忍前後綴差異）
+NGRAM_SIZE = 2
+
+# 每筆活動只取文件頻率最低的幾個 n-gram 當分塊鍵，常見字詞不會造成大分塊
+BLOCK_KEYS_PER_TITLE = 4
+
+# 開始日期分桶天數；比對時也會查相鄰的桶，等於 ±DATE_WINDOW_DAYS 的日期區間
+DATE_WINDOW_DAYS = 7
+
+# 超過此大小的分塊視為沒有鑑別度，直接略過
+MAX_BLOCK_SIZE = 100
+
+# 判定為重複的分數門檻
+MATCH_THRESHOLD = 0.75
+
+# 標題中不影響判斷的符號與括號
+TITLE_NOISE = re.compile(r'[\s\W_]+', re.UNICODE)
+
+
+def normalize_title(title: Optional[str]) -> str:
+    """標題正規化：全形轉半形、轉小寫並移除空白、標點與括號"""
+    title = unicodedata.normalize('NFKC', title or '').lower()
+    return TITLE_NOISE.sub('', title)
+
+
+def title_ngrams(normalized: str, size: int = NGRAM_SIZE) -> Set[str]:
+    """正規化標題的字元 n-gram 集合（標題太短時整串當成一個 n-gram）"""
+    if len(normalized) <= size:
+        return {normalized} if normalized else set()
+    return {normalized[i:i + size] for i in range(len(normalized) - size + 1)}
+
+
+def source_family(source: Optional[str]) -> Optional[str]:
+    """來源所屬的資料提供者（culture:1 與 culture:festival 同屬 culture）"""
+    return source.split(':', 1)[0] if source else None
+
+
+class EventRecord:
+    """重複比對所需的活動欄位"""
+    __slots__ = ("id", "family", "grams", "start", "end", "venue_id", "quality")
+
+    def __init__(self, event_id: int, source: Optional[str], title: Optional[str],
+                 start: Optional[date], end: Optional[date], venue_id: Optional[int],
+                 quality: int = 0):
+        self.id = event_id
+        self.family = source_family(source)
+        self.grams = title_ngrams(normalize_title(title))
+        self.start = start
+        self.end = end
+        self.venue_id = venue_id
+        self.quality = quality
+
+
+def _bucket(day: Optional[date]) -> Optional[int]:
+    return day.toordinal() // DATE_WINDOW_DAYS if day else None
+
+
+def candidate_pairs(records: List[EventRecord]) -> Set[Tuple[int, int]]:
+    """
+    以分塊索引找出候選配對（records 的索引值組合）
+
+    分塊鍵為 (n-gram, 日期桶) 與 (場地, 日期桶)；每筆活動只取最少見的 n-gram，
+    因此分塊數量與資料量成線性關係。
+    """
+    frequency = Counter(gram for record in records for gram in record.grams)
+    blocks: Dict[tuple, List[int]] = defaultdict(list)
+    for index, record in enumerate(records):
+        bucket = _bucket(record.start)
+        rare = sorted(record.grams, key=lambda gram: (frequency[gram], gram))
+        for gram in rare[:BLOCK_KEYS_PER_TITLE]:
+            blocks[("t", gram, bucket)].append(index)
+        if record.venue_id:
+            blocks[("v", record.venue_id, bucket)].append(index)
+
+    pairs = set()
+    for (kind, key, bucket), members in blocks.items():
+        # 同一鍵的相鄰日期桶也要比對，避免剛好跨桶的活動漏掉
+        neighbours = members
+        if bucket is not None:
+            neighbours = members + blocks.get((kind, key, bucket + 1), [])
+        if len(neighbours) > MAX_BLOCK_SIZE:
+            continue
+        for i, left in enumerate(members):
+            for right in neighbours[i + 1:]:
+                if left != right:
+                    pairs.add((left, right) if left < right else (right, left))
+    return pairs
+
+
+def match_score(a: EventRecord, b: EventRecord) -> float:
+    """兩筆活動的相似分數（0~1）：標題 n-gram 重疊為主，日期與場地為輔"""
+    if a.family and a.family == b.family:
+        # 同一提供者內的同名活動通常是不同場次，不合併
+        return 0.0
+    if not a.grams or not b.grams:
+        return 0.0
+
+    # 以較短標題為分母，容忍「特展」「展覽」等前後綴
+    overlap = len(a.grams & b.grams) / min(len(a.grams), len(b.grams))
+    score = 0.6 * overlap
+
+    if a.start and b.start:
+        days = abs((a.start - b.start).days)
+        if days > DATE_WINDOW_DAYS * 2:
+            return 0.0
+        score += 0.25 * (1 - days / (DATE_WINDOW_DAYS * 2))
+        if a.end and b.end and a.end == b.end:
+            score += 0.05
+    if a.venue_id and a.venue_id == b.venue_id:
+        score += 0.1
+    return score
+
+
+def find_duplicates(records: List[EventRecord],
+                    threshold: float = MATCH_THRESHOLD) -> Dict[int, int]:
+    """
+    找出重複活動並分組
+
+    Returns:
+        Dict[int, int]: 重複活動 id → 代表活動 id（代表活動本身不列入）
+    """
+    parent = list(range(len(records)))
+
+    def find(index: int) -> int:
+        while parent[index] != index:
+            parent[index] = parent[parent[index]]
+            index = parent[index]
+        return index
+
+    for left, right in candidate_pairs(records):
+        if match_score(records[left], records[right]) >= threshold:
+            root_left, root_right = find(left), find(right)
+            if root_left != root_right:
+                parent[root_right] = root_left
+
+    groups: Dict[int, List[EventRecord]] = defaultdict(list)
+    for index, record in enumerate(records):
+        groups[find(index)].append(record)
+
+    canonical = {}
+    for members in groups.values():
+        if len(members) < 2:
+            continue
+        # 代表活動：資料最完整者，同分時取最早匯入的
+        best = max(members, key=lambda record: (record.quality, -record.id))
+        for record in members:
+            if record is not best:
+                canonical[record.id] = best.id
+    return canonical
+
+
+def load_records(cursor) -> List[EventRecord]:
+    """讀取所有活動的比對欄位"""
+    cursor.execute(
+        """SELECT id, source, activity_name, start_date, end_date, venue_id,
+                  (image_url IS NOT NULL AND image_url != '' AND image_dead = 0)
+                  + (description IS NOT NULL AND description != '')
+           FROM events"""
+    )
+    return [EventRecord(event_id, source, title, start, end, venue_id, int(quality or 0))
+            for event_id, source, title, start, end, venue_id, quality in cursor.fetchall()]
+
+
+def _chunks(items: List, size: int) -> Iterable[List]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def run_dedup(connection, threshold: float = MATCH_THRESHOLD, batch_size: int = 1000) -> int:
+    """
+    重新計算所有活動的代表活動，只寫回有變動的 canonical_id
+
+    Returns:
+        int: 被標記為重複的活動數
+    """
+    cursor = None
+    try:
+        cursor = connection.cursor(buffered=True)
+        canonical = find_duplicates(load_records(cursor), threshold)
+
+        cursor.execute("SELECT id, canonical_id FROM events WHERE canonical_id IS NOT NULL")
+        current = dict(cursor.fetchall())
+
+        cleared = [event_id for event_id in current if event_id not in canonical]
+        for batch in _chunks(cleared, batch_size):
+            placeholders = ', '.join(['%s'] * len(batch))
+            cursor.execute(
+                f"UPDATE events SET canonical_id = NULL WHERE id IN ({placeholders})", batch)
+
+        changed = [(canonical_id, event_id) for event_id, canonical_id in canonical.items()
+                   if current.get(event_id) != canonical_id]
+        cursor.executemany("UPDATE events SET canonical_id = %s WHERE id = %s", changed)
+
+        # 每日活動數只計代表活動：新標記為重複的移出，不再重複的加回
+        adjust_for_events(cursor, [event_id for event_id in canonical if event_id not in current], -1)
+        adjust_for_events(cursor, cleared, 1)
+
+        connection.commit()
+        print(f"重複活動比對完成：{len(canonical)} 筆重複（本次變動 {len(changed) + len(cleared)} 筆）")
+        return len(canonical)
+
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        if cursor:
+            cursor.close()
+
+
+if __name__ == "__main__":
+    from main import connect_to_mysql
+
+    connection = connect_to_mysql()
+    try:
+        run_dedup(connection)
+    finally:
+        connection.close()
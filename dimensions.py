@@ -0,0 +1,175 @@
+import hashlib
+import re
+from typing import Dict, Optional, Tuple
+
+# 地址開頭的縣市（可能帶郵遞區號）
+CITY_PATTERN = re.compile(r'^\s*\d{0,6}\s*(\S{2}[縣市])')
+
+# 臺灣（含金門、馬祖、澎湖與蘭嶼）的經緯度範圍：(最小緯度, 最大緯度, 最小經度, 最大經度)
+TAIWAN_BOUNDS = (21.5, 26.5, 118.0, 122.5)
+
+
+def venue_key(name: str, address: str) -> str:
+    """場地的唯一鍵（名稱＋地址的摘要，避免對 TEXT 欄位建唯一索引）"""
+    return hashlib.md5(f"{name}\x1f{address}".encode('utf-8')).hexdigest()
+
+
+def address_city(address: Optional[str]) -> str:
+    """由地址取出縣市（「台」統一為「臺」），取不到時為空字串"""
+    match = CITY_PATTERN.match((address or '').replace('台', '臺'))
+    return match.group(1) if match else ''
+
+
+def event_city(event: Dict) -> str:
+    """活動所在縣市：轉接器有提供就用，否則由地址開頭取出"""
+    city = (event.get("city") or "").strip().replace('台', '臺')
+    return city[:20] if city else address_city(event.get("address"))
+
+
+def taiwan_coordinates(latitude, longitude) -> Tuple[Optional[float], Optional[float]]:
+    """
+    檢查經緯度是否落在臺灣範圍內；緯度與經度寫反時對調，仍不符合則視為沒有座標
+
+    臺灣的緯度（21.5–26.5）與經度（118–122.5）範圍不重疊，順序可以直接判斷。
+    """
+    try:
+        latitude, longitude = float(latitude), float(longitude)
+    except (TypeError, ValueError):
+        return None, None
+    min_lat, max_lat, min_lng, max_lng = TAIWAN_BOUNDS
+    if min_lat <= latitude <= max_lat and min_lng <= longitude <= max_lng:
+        return round(latitude, 8), round(longitude, 8)
+    if min_lat <= longitude <= max_lat and min_lng <= latitude <= max_lng:
+        return round(longitude, 8), round(latitude, 8)
+    return None, None
+
+
+def event_coordinates(event: Dict) -> Tuple[Optional[float], Optional[float]]:
+    """活動的 (緯度, 經度)，經過臺灣範圍檢查"""
+    return taiwan_coordinates(event.get("latitude"), event.get("longitude"))
+
+
+def event_category(event: Dict) -> str:
+    """活動類別（各轉接器自行對應成中文名稱）"""
+    return (event.get("category") or "").strip()[:50]
+
+
+class DimensionCache:
+    """主辦單位與場地維度表的行程內快取，匯入時以整數 id 取代重複的長字串"""
+
+    def __init__(self):
+        self.organizers: Dict[str, int] = {}
+        self.venues: Dict[str, int] = {}
+        self.loaded = False
+
+    def load(self, cursor) -> None:
+        """一次載入既有的維度資料（數量很少，整表放進記憶體）"""
+        cursor.execute("SELECT id, name FROM organizers")
+        self.organizers = {name: organizer_id for organizer_id, name in cursor.fetchall()}
+        cursor.execute("SELECT id, venue_key FROM venues")
+        self.venues = {key: venue_id for venue_id, key in cursor.fetchall()}
+        self.loaded = True
+
+    def reset(self) -> None:
+        """交易回滾後清除快取，避免留下已被回滾的 id"""
+        self.organizers.clear()
+        self.venues.clear()
+        self.loaded = False
+
+    def organizer_id(self, cursor, name: Optional[str]) -> Optional[int]:
+        """取得主辦單位 id，不存在則新增"""
+        name = (name or "").strip()[:200]
+        if not name:
+            return None
+        if not self.loaded:
+            self.load(cursor)
+
+        organizer_id = self.organizers.get(name)
+        if organizer_id is None:
+            # 以 LAST_INSERT_ID(id) 讓重複鍵時也能一次取回既有 id
+            cursor.execute(
+                """INSERT INTO organizers (name) VALUES (%s)
+                   ON DUPLICATE KEY UPDATE id = LAST_INSERT_ID(id)""",
+                (name,)
+            )
+            organizer_id = cursor.lastrowid
+            self.organizers[name] = organizer_id
+        return organizer_id
+
+    def venue_id(self, cursor, name: Optional[str], address: Optional[str]) -> Optional[int]:
+        """取得場地 id（以場地名稱＋地址識別），不存在則新增"""
+        name = (name or "").strip()[:200]
+        address = (address or "").strip()
+        if not name and not address:
+            return None
+        if not self.loaded:
+            self.load(cursor)
+
+        key = venue_key(name, address)
+        venue_id = self.venues.get(key)
+        if venue_id is None:
+            cursor.execute(
+                """INSERT INTO venues (venue_key, name, address) VALUES (%s, %s, %s)
+                   ON DUPLICATE KEY UPDATE id = LAST_INSERT_ID(id)""",
+                (key, name, address)
+            )
+            venue_id = cursor.lastrowid
+            self.venues[key] = venue_id
+        return venue_id
+
+    def ids_for(self, cursor, event: Dict) -> Tuple[Optional[int], Optional[int]]:
+        """回傳標準格式活動對應的 (organizer_id, venue_id)"""
+        return (self.organizer_id(cursor, event.get("organizer")),
+                self.venue_id(cursor, event.get("location"), event.get("address")))
+
+
+def migrate_event_dimensions(cursor) -> None:
+    """將舊版 events 表的 organizer / location / address 字串搬到維度表並改存外鍵"""
+    cursor.execute(
+        """SELECT COUNT(*) FROM information_schema.COLUMNS
+           WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'events'
+             AND COLUMN_NAME = 'organizer'"""
+    )
+    if not cursor.fetchone()[0]:
+        return
+
+    print("正在將主辦單位與場地搬移到維度表...")
+    cursor.execute(
+        """INSERT IGNORE INTO organizers (name)
+           SELECT DISTINCT LEFT(TRIM(organizer), 200) FROM events
+           WHERE organizer IS NOT NULL AND TRIM(organizer) != ''"""
+    )
+    cursor.execute(
+        """INSERT IGNORE INTO venues (venue_key, name, address)
+           SELECT DISTINCT
+               MD5(CONCAT(LEFT(TRIM(COALESCE(location, '')), 200), CHAR(31), TRIM(COALESCE(address, '')))),
+               LEFT(TRIM(COALESCE(location, '')), 200), TRIM(COALESCE(address, ''))
+           FROM events
+           WHERE TRIM(COALESCE(location, '')) != '' OR TRIM(COALESCE(address, '')) != ''"""
+    )
+    cursor.execute(
+        """UPDATE events e JOIN organizers o ON o.name = LEFT(TRIM(e.organizer), 200)
+           SET e.organizer_id = o.id"""
+    )
+    cursor.execute(
+        """UPDATE events e JOIN venues v ON v.venue_key = MD5(CONCAT(
+               LEFT(TRIM(COALESCE(e.location, '')), 200), CHAR(31), TRIM(COALESCE(e.address, ''))))
+           SET e.venue_id = v.id"""
+    )
+    cursor.execute(
+        "ALTER TABLE events DROP COLUMN organizer, DROP COLUMN location, DROP COLUMN address")
+    print("維度表搬移完成！")
+
+
+def backfill_event_cities(cursor) -> int:
+    """新增 city 欄位後，由場地地址補上既有活動的縣市（類別等下次匯入時寫入）"""
+    cursor.execute(
+        """SELECT e.id, v.address FROM events e
+           JOIN venues v ON v.id = e.venue_id
+           WHERE e.city IS NULL"""
+    )
+    updates = [(city, event_id) for event_id, address in cursor.fetchall()
+               if (city := address_city(address))]
+    cursor.executemany("UPDATE events SET city = %s WHERE id = %s", updates)
+    print(f"已補上 {len(updates)} 筆活動的縣市")
+    return len(updates)
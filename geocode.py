@@ -0,0 +1,287 @@
+"""
+離線地理編碼（匯入後處理）
+
+臺北市與新北市的轉接器沒有經緯度，這個階段以本機的地名資料（gazetteer/）
+依場地名稱與地址補上座標，不連網：
+1. 場地名稱完全相同
+2. 完整門牌地址（縣市＋路段＋巷弄號）
+3. 場地名稱中包含已知場地
+4. 路段（縣市＋路名＋段）
+解析結果以正規化後的「場地名稱＋地址」雜湊存入 geocode_cache，每個地址只解析一次；
+解析不到的地址也會記錄，地名資料更新後才重新解析。
+既有座標會檢查是否在臺灣範圍內，緯度與經度寫反的直接對調。
+
+用法:
+    python geocode.py
+    python geocode.py --gazetteer gazetteer/taipei_newtaipei.tsv
+"""
+import argparse
+import hashlib
+import os
+import re
+import unicodedata
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from dimensions import TAIWAN_BOUNDS, taiwan_coordinates
+
+GAZETTEER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              "gazetteer", "taipei_newtaipei.tsv")
+
+# 場地名稱包含比對時，已知場地名稱的最短長度（太短容易誤判）
+MIN_CONTAINED_NAME = 3
+
+# 地址的組成：郵遞區號、縣市、鄉鎮市區、村里鄰、路段與巷弄號
+ADDRESS_PATTERN = re.compile(
+    r'^\d{0,6}'
+    r'(?P<city>[^\d]{2}[縣市])?'
+    r'(?:[^\d市縣路街道段]{1,3}?[區鎮鄉市])?'
+    r'(?:[^\d路街道段]{1,3}?[村里])?(?:\d+鄰)?'
+    r'(?P<road>[^\d]+?(?:大道|路|街)(?:[一二三四五六七八九十]+段)?)'
+    r'(?P<number>(?:\d+巷)?(?:\d+弄)?\d+(?:之\d+)?號)?'
+)
+SECTION_NUMBER = re.compile(r'(\d+)段')
+SUB_NUMBER = re.compile(r'(\d+)[-—–](\d+)號')
+SECTION_NAMES = "一二三四五六七八九十"
+BRACKETS = re.compile(r'[（(][^）)]*[）)]')
+
+Coordinate = Tuple[float, float, str]
+
+
+def normalize_text(text: Optional[str]) -> str:
+    """全形轉半形、「台」統一為「臺」、移除空白與括號內的說明"""
+    text = unicodedata.normalize("NFKC", text or "").replace("台", "臺")
+    text = BRACKETS.sub("", text)
+    text = re.sub(r"\s+", "", text)
+    text = SUB_NUMBER.sub(r"\1之\2號", text)
+    # 「4段」改為「四段」，與門牌資料的寫法一致
+    return SECTION_NUMBER.sub(
+        lambda m: (SECTION_NAMES[int(m.group(1)) - 1] if 1 <= int(m.group(1)) <= 10
+                   else m.group(1)) + "段", text)
+
+
+def parse_address(address: str) -> Optional[Tuple[str, str, str]]:
+    """正規化後的地址拆成 (縣市, 路段, 巷弄號)，不是地址時為 None"""
+    match = ADDRESS_PATTERN.match(address)
+    if not match:
+        return None
+    return match.group("city") or "", match.group("road"), match.group("number") or ""
+
+
+def geocode_key(name: Optional[str], address: Optional[str]) -> str:
+    """快取用的查詢字串（正規化後的場地名稱＋地址）"""
+    return f"{normalize_text(name)}|{normalize_text(address)}"[:500]
+
+
+def address_hash(key: str) -> str:
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def gazetteer_version(path: str = GAZETTEER_PATH) -> str:
+    """地名資料的版本（內容雜湊），內容改變時重新解析之前找不到的地址"""
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()[:16]
+
+
+class Gazetteer:
+    """本機地名資料：場地名稱、完整門牌與路段 → 座標"""
+
+    def __init__(self, path: str = GAZETTEER_PATH):
+        self.venues: Dict[str, Tuple[float, float]] = {}
+        self.addresses: Dict[Tuple[str, str, str], Tuple[float, float]] = {}
+        self.roads: Dict[Tuple[str, str], Tuple[float, float]] = {}
+
+        with open(path, "r", encoding="utf-8") as f:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip() or line.startswith("#"):
+                    continue
+                try:
+                    kind, name, latitude, longitude = line.rstrip("\n").split("\t")
+                except ValueError:
+                    print(f"地名資料格式錯誤（第 {line_number} 行）")
+                    continue
+                point = taiwan_coordinates(latitude, longitude)
+                if point[0] is None:
+                    print(f"地名資料座標不在臺灣範圍內（第 {line_number} 行）：{name}")
+                    continue
+                self._add(kind, normalize_text(name), point)
+
+        # 沒寫縣市的地址：路段（與門牌）只出現在一個縣市時才能直接對應
+        for table in (self.addresses, self.roads):
+            cities: Dict[tuple, List[Tuple[float, float]]] = {}
+            for (city, *rest), point in table.items():
+                cities.setdefault(tuple(rest), []).append(point)
+            for rest, points in cities.items():
+                if len(points) == 1:
+                    table.setdefault(("", *rest), points[0])
+
+        # 包含比對由長到短，較完整的名稱優先
+        self.contained = sorted((name for name in self.venues if len(name) >= MIN_CONTAINED_NAME),
+                                key=len, reverse=True)
+
+    def _add(self, kind: str, name: str, point: Tuple[float, float]) -> None:
+        if kind == "venue":
+            self.venues[name] = point
+            return
+        parsed = parse_address(name)
+        if parsed is None:
+            print(f"地名資料無法解析的地址：{name}")
+        elif kind == "address" and parsed[2]:
+            self.addresses[parsed] = point
+        elif kind == "road":
+            self.roads[parsed[:2]] = point
+
+    def resolve(self, name: Optional[str], address: Optional[str]) -> Optional[Coordinate]:
+        """
+        依場地名稱與地址解析座標
+
+        Returns:
+            (緯度, 經度, 比對層級) 或 None；比對層級為 venue / address / road
+        """
+        name, address = normalize_text(name), normalize_text(address)
+        if name in self.venues:
+            return (*self.venues[name], "venue")
+
+        parsed = parse_address(address) if address else None
+        if parsed and parsed[2]:
+            for city in {parsed[0], ""}:
+                point = self.addresses.get((city, parsed[1], parsed[2]))
+                if point:
+                    return (*point, "address")
+
+        # 有些來源把場地名稱寫在地址欄
+        for text in (name, address):
+            for venue in self.contained:
+                if text and venue in text:
+                    return (*self.venues[venue], "venue")
+
+        if parsed:
+            point = self.roads.get(parsed[:2])
+            if point:
+                return (*point, "road")
+        return None
+
+
+def repair_coordinates(cursor) -> int:
+    """既有座標不在臺灣範圍內時：寫反的對調，其餘清除（之後由地名資料補上）"""
+    min_lat, max_lat, min_lng, max_lng = TAIWAN_BOUNDS
+    cursor.execute(
+        """SELECT id, latitude, longitude FROM events
+           WHERE latitude IS NOT NULL
+             AND NOT (latitude BETWEEN %s AND %s AND longitude BETWEEN %s AND %s)""",
+        (min_lat, max_lat, min_lng, max_lng)
+    )
+    rows = [(*taiwan_coordinates(latitude, longitude), event_id)
+            for event_id, latitude, longitude in cursor.fetchall()]
+    if rows:
+        cursor.executemany("UPDATE events SET latitude = %s, longitude = %s WHERE id = %s", rows)
+    return len(rows)
+
+
+def _load_cache(cursor, hashes: List[str], batch_size: int) -> Dict[str, tuple]:
+    cached = {}
+    for offset in range(0, len(hashes), batch_size):
+        batch = hashes[offset:offset + batch_size]
+        placeholders = ", ".join(["%s"] * len(batch))
+        cursor.execute(
+            f"""SELECT address_hash, latitude, longitude, match_level, gazetteer_version
+                FROM geocode_cache WHERE address_hash IN ({placeholders})""",
+            batch
+        )
+        cached.update((row[0], row[1:]) for row in cursor.fetchall())
+    return cached
+
+
+def run_geocode_stage(connection, gazetteer_path: str = GAZETTEER_PATH,
+                      batch_size: int = 1000) -> int:
+    """
+    匯入後的地理編碼：修正既有座標，再依場地為沒有座標的活動補上座標
+
+    同一場地的活動座標相同，以場地為單位解析；快取命中時不必載入地名資料。
+
+    Returns:
+        int: 本次補上座標的場地數
+    """
+    cursor = None
+    try:
+        cursor = connection.cursor(buffered=True)
+        repaired = repair_coordinates(cursor)
+        if repaired:
+            print(f"已修正 {repaired} 筆不在臺灣範圍內的座標")
+
+        cursor.execute(
+            """SELECT DISTINCT v.id, v.name, v.address FROM events e
+               JOIN venues v ON v.id = e.venue_id
+               WHERE e.latitude IS NULL"""
+        )
+        venues = [(venue_id, geocode_key(name, address), name, address)
+                  for venue_id, name, address in cursor.fetchall()]
+        if not venues:
+            connection.commit()
+            return 0
+
+        version = gazetteer_version(gazetteer_path)
+        cached = _load_cache(cursor, sorted({address_hash(key) for _, key, _, _ in venues}),
+                             batch_size)
+        gazetteer = None
+        resolved: Dict[str, Optional[Coordinate]] = {}
+        updates = []
+        for venue_id, key, name, address in venues:
+            digest = address_hash(key)
+            if digest not in resolved:
+                hit = cached.get(digest)
+                if hit and hit[0] is not None:
+                    resolved[digest] = (hit[0], hit[1], hit[2])
+                elif hit and hit[3] == version:
+                    # 同一版地名資料已確認解析不到
+                    resolved[digest] = None
+                else:
+                    if gazetteer is None:
+                        gazetteer = Gazetteer(gazetteer_path)
+                    resolved[digest] = gazetteer.resolve(name, address)
+                    point = resolved[digest] or (None, None, None)
+                    cursor.execute(
+                        """INSERT INTO geocode_cache
+                           (address_hash, query_text, latitude, longitude, match_level,
+                            gazetteer_version, resolved_at)
+                           VALUES (%s, %s, %s, %s, %s, %s, %s)
+                           ON DUPLICATE KEY UPDATE
+                               latitude = VALUES(latitude), longitude = VALUES(longitude),
+                               match_level = VALUES(match_level),
+                               gazetteer_version = VALUES(gazetteer_version),
+                               resolved_at = VALUES(resolved_at)""",
+                        (digest, key, *point, version, datetime.now())
+                    )
+            if resolved[digest]:
+                updates.append((resolved[digest][0], resolved[digest][1], venue_id))
+
+        if updates:
+            cursor.executemany(
+                """UPDATE events SET latitude = %s, longitude = %s
+                   WHERE venue_id = %s AND latitude IS NULL""",
+                updates
+            )
+        connection.commit()
+        print(f"地理編碼：{len(venues)} 個場地缺少座標，補上 {len(updates)} 個")
+        return len(updates)
+
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        if cursor:
+            cursor.close()
+
+
+if __name__ == "__main__":
+    from main import connect_to_mysql
+
+    parser = argparse.ArgumentParser(description="以本機地名資料為活動補上座標")
+    parser.add_argument("--gazetteer", default=GAZETTEER_PATH, help="地名資料檔案")
+    args = parser.parse_args()
+
+    connection = connect_to_mysql()
+    try:
+        run_geocode_stage(connection, args.gazetteer)
+    finally:
+        connection.close()
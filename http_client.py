@@ -0,0 +1,234 @@
+import asyncio
+import concurrent.futures
+import random
+import threading
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from rate_limit import HostGuard, CircuitOpenError, parse_retry_after
+
+# 對外統一的錯誤型別，各爬蟲只需捕捉這一個
+HttpError = httpx.HTTPError
+HttpTimeout = httpx.TimeoutException
+HttpStatusError = httpx.HTTPStatusError
+
+# 需要重試的 HTTP 狀態碼
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class ResponseTooLarge(httpx.HTTPError):
+    """回應內容超過呼叫端設定的大小上限（不重試，也不算主機失敗）"""
+
+    def __init__(self, message: str, response: httpx.Response):
+        super().__init__(message)
+        self.response = response
+
+
+class AsyncHttpClient:
+    """共用的非同步 HTTP 用戶端：每個主機各自一組連線池，保持連線、自動解壓 gzip、統一逾時與退避重試"""
+
+    def __init__(self,
+                 timeout: float = 30,
+                 max_retries: int = 3,
+                 backoff_base: float = 1.0,
+                 backoff_max: float = 30.0,
+                 max_connections_per_host: int = 10,
+                 requests_per_second: float = 5.0,
+                 failure_threshold: int = 5,
+                 cooldown: float = 60.0,
+                 max_retry_after: float = 60.0):
+        self.timeout = httpx.Timeout(timeout, connect=min(timeout, 10))
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.limits = httpx.Limits(
+            max_connections=max_connections_per_host,
+            max_keepalive_connections=max_connections_per_host,
+            keepalive_expiry=60
+        )
+        self.requests_per_second = requests_per_second
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_retry_after = max_retry_after
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._guards: Dict[str, HostGuard] = {}
+
+    def _guard_for(self, host: str) -> HostGuard:
+        """取得（或建立）該主機的限流器與斷路器"""
+        guard = self._guards.get(host)
+        if guard is None:
+            guard = HostGuard(host, self.requests_per_second,
+                              self.failure_threshold, self.cooldown)
+            self._guards[host] = guard
+        return guard
+
+    def _client_for(self, host: str) -> httpx.AsyncClient:
+        """取得（或建立）該主機專用的連線池"""
+        client = self._clients.get(host)
+        if client is None:
+            client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=self.limits,
+                follow_redirects=True,
+                headers={"Accept-Encoding": "gzip, deflate"}
+            )
+            self._clients[host] = client
+        return client
+
+    def _backoff(self, attempt: int) -> float:
+        """指數退避加上完全隨機抖動，避免多個請求同時重試"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    async def _get_limited(self, client: httpx.AsyncClient, url: str,
+                           params: Optional[Dict[str, Any]], headers: Optional[Dict[str, str]],
+                           max_bytes: int) -> httpx.Response:
+        """以串流方式下載：先看 Content-Length，再邊讀邊計算，超過上限就中止不再讀取"""
+        async with client.stream("GET", url, params=params, headers=headers) as response:
+            if response.status_code >= 400:
+                # 錯誤回應只需要狀態碼，不讀取內容
+                return httpx.Response(response.status_code, headers=response.headers,
+                                      request=response.request)
+            length = response.headers.get("Content-Length", "")
+            if length.isdigit() and int(length) > max_bytes:
+                raise ResponseTooLarge(f"回應大小 {length} 位元組超過上限 {max_bytes}", response)
+            body = bytearray()
+            async for chunk in response.aiter_bytes():
+                body.extend(chunk)
+                if len(body) > max_bytes:
+                    raise ResponseTooLarge(f"回應內容超過上限 {max_bytes} 位元組", response)
+        # 內容已解壓，去掉 Content-Encoding 以免重新建立回應時再解壓一次
+        return httpx.Response(
+            response.status_code,
+            headers=[(k, v) for k, v in response.headers.multi_items()
+                     if k.lower() not in ("content-encoding", "content-length")],
+            content=bytes(body), request=response.request)
+
+    async def get(self,
+                  url: str,
+                  params: Optional[Dict[str, Any]] = None,
+                  headers: Optional[Dict[str, str]] = None,
+                  max_bytes: Optional[int] = None) -> httpx.Response:
+        """
+        發送 GET 請求：先經過主機限流與斷路器，逾時、連線錯誤與 5xx/429 會以非阻塞方式退避後重試
+
+        Args:
+            max_bytes: 回應內容的大小上限，超過時丟出 ResponseTooLarge（不會先把整個檔案讀進記憶體）
+        """
+        parts = urlsplit(url)
+        host = f"{parts.scheme}://{parts.netloc}"
+        client = self._client_for(host)
+        guard = self._guard_for(host)
+
+        for attempt in range(self.max_retries):
+            probe = await guard.before_request()
+            try:
+                if max_bytes is None:
+                    response = await client.get(url, params=params, headers=headers)
+                else:
+                    response = await self._get_limited(client, url, params, headers, max_bytes)
+            except ResponseTooLarge as e:
+                guard.after_response(e.response)
+                raise
+            except httpx.TransportError as e:
+                guard.after_error()
+                if attempt < self.max_retries - 1:
+                    delay = self._backoff(attempt)
+                    print(f"請求失敗，{delay:.1f}秒後進行第{attempt + 2}次嘗試... 錯誤: {e!r}")
+                    await asyncio.sleep(delay)
+                    continue
+                raise
+            except BaseException:
+                guard.after_abort(probe)
+                raise
+
+            guard.after_response(response)
+            if response.status_code in RETRY_STATUS and attempt < self.max_retries - 1:
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                if retry_after is not None and retry_after > self.max_retry_after:
+                    # 上游要求等待太久，直接放棄，不拖慢整個匯入流程
+                    response.raise_for_status()
+                # 有 Retry-After 時權杖桶已暫停到指定時間，不再額外疊加退避
+                delay = 0 if retry_after is not None else self._backoff(attempt)
+                print(f"伺服器回應 {response.status_code}，{retry_after or delay:.1f}秒後進行第{attempt + 2}次嘗試...")
+                await asyncio.sleep(delay)
+                continue
+            response.raise_for_status()
+            return response
+
+    def metrics(self) -> Dict[str, Dict[str, Any]]:
+        """各上游主機的限流、斷路器與請求統計"""
+        return {host: guard.metrics() for host, guard in self._guards.items()}
+
+    async def get_json(self, url: str, params: Optional[Dict[str, Any]] = None,
+                       headers: Optional[Dict[str, str]] = None) -> Any:
+        """發送 GET 請求並解析 JSON"""
+        response = await self.get(url, params=params, headers=headers)
+        return response.json()
+
+    async def aclose(self) -> None:
+        """關閉所有主機的連線池"""
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients.clear()
+
+
+class HttpClient:
+    """同步介面：在背景執行緒跑一個常駐事件迴圈，讓同步程式也能共用同一組連線池"""
+
+    def __init__(self, **kwargs):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self.loop.run_forever, name="http-client", daemon=True)
+        self._thread.start()
+        self.aio = AsyncHttpClient(**kwargs)
+
+    def run(self, coro):
+        """在共用事件迴圈上執行協程並等待結果（可用於並行分頁抓取）"""
+        return self.submit(coro).result()
+
+    def submit(self, coro) -> concurrent.futures.Future:
+        """在共用事件迴圈上排入協程並立即回傳 Future，呼叫端可依完成順序逐一處理結果"""
+        if not self.loop.is_running():
+            # 已關閉的用戶端：直接失敗，不要等一個永遠不會執行的 Future
+            coro.close()
+            raise RuntimeError("HTTP 用戶端已關閉，請重新以 get_client() 取得")
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def get(self, url: str, params: Optional[Dict[str, Any]] = None,
+            headers: Optional[Dict[str, str]] = None) -> httpx.Response:
+        return self.run(self.aio.get(url, params=params, headers=headers))
+
+    def get_json(self, url: str, params: Optional[Dict[str, Any]] = None,
+                 headers: Optional[Dict[str, str]] = None) -> Any:
+        return self.run(self.aio.get_json(url, params=params, headers=headers))
+
+    def metrics(self) -> Dict[str, Dict[str, Any]]:
+        return self.aio.metrics()
+
+    def close(self) -> None:
+        """關閉連線池並停止背景事件迴圈；若是共用用戶端，之後的 get_client() 會建立新的"""
+        global _shared_client
+        with _shared_lock:
+            if _shared_client is self:
+                _shared_client = None
+        if self.loop.is_running():
+            self.run(self.aio.aclose())
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join(timeout=5)
+        if not self.loop.is_running() and not self.loop.is_closed():
+            self.loop.close()
+
+
+_shared_client: Optional[HttpClient] = None
+_shared_lock = threading.Lock()
+
+
+def get_client() -> HttpClient:
+    """取得整個程序共用的 HTTP 用戶端"""
+    global _shared_client
+    with _shared_lock:
+        if _shared_client is None or not _shared_client.loop.is_running():
+            _shared_client = HttpClient()
+        return _shared_client
@@ -0,0 +1,212 @@
+import asyncio
+import hashlib
+import io
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable
+
+from http_client import get_client, HttpError, HttpStatusError, ResponseTooLarge
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow 為選用套件，沒有安裝時略過圖片處理
+    Image = None
+
+# 縮圖存放位置（以內容雜湊分目錄存放）
+THUMB_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'media', 'thumbs')
+
+# 與列表卡片相同的 4:3 比例
+THUMB_SIZE = (400, 300)
+THUMB_FORMATS = {"webp": "WEBP", "jpg": "JPEG"}
+
+# 原圖大小上限，避免超大檔案拖垮匯入
+MAX_IMAGE_BYTES = 15 * 1024 * 1024
+
+# 確定失效的狀態碼；其他錯誤（逾時、5xx、斷路器開啟）視為暫時失敗
+DEAD_STATUS = {404, 410}
+
+# 暫時失敗的網址隔多久再試一次
+RETRY_AFTER = timedelta(hours=6)
+
+# 已標記失效的網址隔多久重新確認一次（來源可能補上圖片）
+DEAD_RECHECK_AFTER = timedelta(days=30)
+
+
+def url_hash(url: str) -> str:
+    """圖片網址的雜湊值，用來去除重複下載"""
+    return hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+
+def thumb_path(key: str, ext: str, root: str = THUMB_ROOT) -> str:
+    """縮圖在內容定址儲存區中的路徑"""
+    return os.path.join(root, key[:2], f"{key}.{ext}")
+
+
+def make_thumbnails(content: bytes, root: str = THUMB_ROOT) -> Dict[str, Any]:
+    """產生固定尺寸的 WebP/JPEG 縮圖，回傳內容雜湊與原圖尺寸"""
+    key = hashlib.sha256(content).hexdigest()
+    with Image.open(io.BytesIO(content)) as image:
+        width, height = image.size
+        if all(os.path.exists(thumb_path(key, ext, root)) for ext in THUMB_FORMATS):
+            return {"thumb_key": key, "width": width, "height": height}
+
+        # 置中裁切成卡片比例後縮小
+        thumb = image.convert("RGB")
+        target_ratio = THUMB_SIZE[0] / THUMB_SIZE[1]
+        if width / height > target_ratio:
+            new_width = int(height * target_ratio)
+            left = (width - new_width) // 2
+            thumb = thumb.crop((left, 0, left + new_width, height))
+        else:
+            new_height = int(width / target_ratio)
+            top = (height - new_height) // 2
+            thumb = thumb.crop((0, top, width, top + new_height))
+        thumb = thumb.resize(THUMB_SIZE, Image.LANCZOS)
+
+        os.makedirs(os.path.dirname(thumb_path(key, "jpg", root)), exist_ok=True)
+        for ext, image_format in THUMB_FORMATS.items():
+            path = thumb_path(key, ext, root)
+            # 先寫暫存檔再改名，避免讀取到寫到一半的檔案
+            tmp_path = f"{path}.tmp"
+            thumb.save(tmp_path, image_format, quality=80)
+            os.replace(tmp_path, path)
+
+    return {"thumb_key": key, "width": width, "height": height}
+
+
+async def fetch_image(url: str, semaphore: asyncio.Semaphore, root: str = THUMB_ROOT,
+                      max_bytes: int = MAX_IMAGE_BYTES) -> Dict[str, Any]:
+    """
+    下載單張圖片並產生縮圖
+
+    只有確定的失敗（404/410、內容不是圖片、超過大小上限）才標記為失效連結（dead）；
+    逾時、5xx 與斷路器開啟等暫時失敗標記為 retry，之後再重試
+    """
+    result = {"url": url, "thumb_key": None, "width": None, "height": None,
+              "dead": False, "retry": False}
+    async with semaphore:
+        try:
+            response = await get_client().aio.get(url, max_bytes=max_bytes)
+        except ResponseTooLarge as e:
+            print(f"圖片過大 {url}: {e}")
+            result["dead"] = True
+            return result
+        except HttpStatusError as e:
+            print(f"圖片下載失敗 {url}: {e}")
+            result["dead" if e.response.status_code in DEAD_STATUS else "retry"] = True
+            return result
+        except HttpError as e:
+            print(f"圖片暫時無法下載 {url}: {e!r}")
+            result["retry"] = True
+            return result
+
+    content = response.content
+    if not content:
+        result["dead"] = True
+        return result
+    if Image is None:
+        result["retry"] = True
+        return result
+
+    try:
+        # 影像處理較耗 CPU，移到執行緒中避免卡住事件迴圈
+        result.update(await asyncio.to_thread(make_thumbnails, content, root))
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        print(f"無法處理圖片 {url}: {e}")
+        result["dead"] = True
+    return result
+
+
+async def fetch_images(urls: Iterable[str], concurrency: int = 8, root: str = THUMB_ROOT,
+                       max_bytes: int = MAX_IMAGE_BYTES) -> Dict[str, Dict[str, Any]]:
+    """以有限並行數下載一批圖片（相同網址只下載一次），回傳 url_hash → 結果"""
+    unique = {url_hash(url): url for url in urls if url}
+    semaphore = asyncio.Semaphore(concurrency)
+    results = await asyncio.gather(
+        *(fetch_image(url, semaphore, root, max_bytes) for url in unique.values()))
+    return {url_hash(result["url"]): result for result in results}
+
+
+def run_image_stage(connection, concurrency: int = 8, batch_size: int = 500,
+                    root: str = THUMB_ROOT) -> int:
+    """
+    匯入後的圖片處理：找出尚未處理過的圖片網址，下載並產生縮圖，
+    再把尺寸、縮圖鍵與失效標記寫回 events
+
+    暫時失敗的網址（沒有縮圖也沒有標記失效）在 RETRY_AFTER 之後重新選出，
+    已失效的網址在 DEAD_RECHECK_AFTER 之後重新確認
+
+    Returns:
+        int: 本次處理的圖片網址數
+    """
+    if Image is None:
+        # 不寫入任何紀錄，安裝 Pillow 之後所有圖片仍會被處理
+        print("未安裝 Pillow，略過圖片處理")
+        return 0
+
+    cursor = None
+    processed = 0
+    try:
+        cursor = connection.cursor()
+        while True:
+            # 已成功處理的網址不再下載；這一輪處理過的網址 checked_at 為現在，不會再被選出
+            now = datetime.now()
+            cursor.execute(
+                """SELECT DISTINCT e.image_url FROM events e
+                   LEFT JOIN image_assets a ON a.url_hash = SHA1(e.image_url)
+                   WHERE e.image_url IS NOT NULL AND e.image_url != ''
+                     AND (a.url_hash IS NULL
+                          OR (a.thumb_key IS NULL AND a.dead = 0 AND a.checked_at < %s)
+                          OR (a.dead = 1 AND a.checked_at < %s))
+                   LIMIT %s""",
+                (now - RETRY_AFTER, now - DEAD_RECHECK_AFTER, batch_size)
+            )
+            urls = [row[0] for row in cursor.fetchall()]
+            if not urls:
+                break
+
+            results = get_client().run(fetch_images(urls, concurrency, root))
+            done = [r for r in results.values() if not r["retry"]]
+            retry = [r for r in results.values() if r["retry"]]
+            if done:
+                cursor.executemany(
+                    """INSERT INTO image_assets
+                       (url_hash, url, thumb_key, width, height, dead, checked_at)
+                       VALUES (%s, %s, %s, %s, %s, %s, %s)
+                       ON DUPLICATE KEY UPDATE
+                           thumb_key = VALUES(thumb_key), width = VALUES(width),
+                           height = VALUES(height), dead = VALUES(dead),
+                           checked_at = VALUES(checked_at)""",
+                    [(url_hash(r["url"]), r["url"], r["thumb_key"], r["width"], r["height"],
+                      r["dead"], now) for r in done]
+                )
+            if retry:
+                # 暫時失敗只更新檢查時間，原本的失效標記不變（重新確認失效連結時遇到暫時失敗也一樣）
+                cursor.executemany(
+                    """INSERT INTO image_assets (url_hash, url, dead, checked_at)
+                       VALUES (%s, %s, 0, %s)
+                       ON DUPLICATE KEY UPDATE checked_at = VALUES(checked_at)""",
+                    [(url_hash(r["url"]), r["url"], now) for r in retry]
+                )
+            processed += len(results)
+            connection.commit()
+            print(f"已處理 {processed} 個圖片網址")
+
+        # 將圖片資訊寫回活動（只更新尚未標記的活動）
+        cursor.execute(
+            """UPDATE events e JOIN image_assets a ON a.url_hash = SHA1(e.image_url)
+               SET e.thumb_key = a.thumb_key, e.image_width = a.width,
+                   e.image_height = a.height, e.image_dead = a.dead
+               WHERE e.image_url IS NOT NULL AND e.image_url != ''
+                 AND (NOT (e.thumb_key <=> a.thumb_key)
+                      OR NOT (e.image_dead <=> a.dead))"""
+        )
+        connection.commit()
+        return processed
+
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        if cursor:
+            cursor.close()
@@ -0,0 +1,87 @@
+"""
+本機圖片測試伺服器，讓圖片處理流程不必連到外部網站
+
+路徑規則:
+    /img/<寬>x<高>.<png|jpg>           依尺寸即時產生圖片（同一路徑內容固定）
+    /nolength/img/<寬>x<高>.<png|jpg>  同上，但不送 Content-Length（只能邊讀邊檢查大小）
+    /dead/<任意>                       回應 404，模擬失效連結
+    /error/<任意>                      回應 503，模擬來源暫時故障
+    /broken/<任意>                     回應 200 但內容不是圖片
+    /slow/<秒數>/img/<寬>x<高>.png      延遲後才回應，用來測試並行上限與逾時
+
+用法:
+    python image_stub.py --port 8089
+"""
+import argparse
+import hashlib
+import http.server
+import io
+import re
+import threading
+import time
+
+from PIL import Image
+
+IMAGE_PATH = re.compile(r'^/(?:slow/(?P<delay>[\d.]+)/)?(?P<nolength>nolength/)?img/(?P<w>\d+)x(?P<h>\d+)\.(?P<ext>png|jpg)$')
+IMAGE_FORMATS = {"png": ("PNG", "image/png"), "jpg": ("JPEG", "image/jpeg")}
+
+
+def render_image(width: int, height: int, ext: str, seed: str) -> bytes:
+    """依路徑產生固定顏色的圖片"""
+    color = tuple(hashlib.md5(seed.encode('utf-8')).digest()[:3])
+    image = Image.new("RGB", (width, height), color)
+    buffer = io.BytesIO()
+    image.save(buffer, IMAGE_FORMATS[ext][0])
+    return buffer.getvalue()
+
+
+class ImageStubHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        match = IMAGE_PATH.match(self.path)
+        if match:
+            if match.group("delay"):
+                time.sleep(float(match.group("delay")))
+            width, height = int(match.group("w")), int(match.group("h"))
+            ext = match.group("ext")
+            self._send(200, render_image(width, height, ext, self.path), IMAGE_FORMATS[ext][1],
+                       with_length=not match.group("nolength"))
+        elif self.path.startswith("/broken/"):
+            self._send(200, b"not an image", "image/jpeg")
+        elif self.path.startswith("/error/"):
+            self._send(503, b"service unavailable", "text/plain")
+        else:
+            self._send(404, b"not found", "text/plain")
+
+    def _send(self, status: int, body: bytes, content_type: str, with_length: bool = True) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        if with_length:
+            self.send_header("Content-Length", str(len(body)))
+        else:
+            # 沒有長度時以關閉連線表示內容結束
+            self.send_header("Connection", "close")
+            self.close_connection = True
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server(port: int = 0) -> http.server.ThreadingHTTPServer:
+    """在背景執行緒啟動測試伺服器（port=0 代表自動選擇），回傳伺服器物件"""
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", port), ImageStubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本機圖片測試伺服器")
+    parser.add_argument("--port", type=int, default=8089)
+    args = parser.parse_args()
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", args.port), ImageStubHandler)
+    print(f"圖片測試伺服器已啟動：http://127.0.0.1:{args.port}/img/800x600.jpg")
+    server.serve_forever()
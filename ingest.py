@@ -0,0 +1,288 @@
+"""
+匯入流程的統一命令列工具
+
+只載入該子命令實際用到的資料來源轉接器、資料庫驅動與序列化模組，
+排程或 cron 觸發的短時間執行不必每次付出全部模組的載入成本。
+
+用法:
+    python ingest.py run --source culture,ntpc
+    python ingest.py run --source taipei --skip-post
+    python ingest.py replay --source ntpc
+    python ingest.py replay --source culture --file culture_api/所有藝文活動_20250101_000000.json --dry-run
+    python ingest.py replay --bulk
+    python ingest.py drain
+    python ingest.py bench startup
+    python ingest.py --import-times run --source ntpc
+"""
+import argparse
+import glob
+import os
+import re
+import subprocess
+import sys
+from typing import Any, Callable, Dict, List, Optional
+
+# 與 main.SOURCE_JOBS 的鍵相同；寫在這裡是為了 --help 不必載入 main
+SOURCES = ("culture", "tfam", "taipei", "ntpc")
+
+# 可重播的原始資料存檔（來源 → 存檔路徑樣式）
+REPLAY_ARCHIVES = {
+    "culture": os.path.join("culture_api", "*藝文活動_*.json"),
+    "taipei": os.path.join("taipei_api", "市政網站整合平台之熱門活動_*.json"),
+    "ntpc": os.path.join("newtaipei_api", "新北市政府近期活動_*.csv"),
+}
+
+# -X importtime 輸出格式：import time: self [us] | cumulative | imported package
+IMPORT_TIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def parse_sources(value: str) -> List[str]:
+    """解析以逗號分隔的來源清單"""
+    sources = [source.strip() for source in value.split(",") if source.strip()]
+    unknown = [source for source in sources if source not in SOURCES]
+    if unknown or not sources:
+        raise argparse.ArgumentTypeError(
+            f"未知的來源：{', '.join(unknown) or value}（可用：{', '.join(SOURCES)}）")
+    return sources
+
+
+def command_run(args: argparse.Namespace) -> int:
+    """執行指定來源的匯入"""
+    from main import (SOURCE_JOBS, connect_to_mysql, init_database, ingest_lock,
+                      print_http_metrics, run_post_ingest)
+    from staging_queue import staged_ingest
+
+    init_database()
+    connection = connect_to_mysql()
+    try:
+        with ingest_lock(connection) as acquired:
+            if not acquired:
+                print("另一個匯入程序正在執行，本次略過")
+                return 1
+            # 抓取與寫入資料庫分開進行，中斷時已抓到的批次留在匯入佇列
+            with staged_ingest() as save:
+                for source in args.source:
+                    name, job = SOURCE_JOBS[source]
+                    print(f"正在獲取{name}...")
+                    job(connection, save)
+            if not args.skip_post:
+                run_post_ingest(connection, retention=not args.skip_retention)
+        return 0
+    finally:
+        connection.close()
+        print_http_metrics()
+
+
+def _replay_culture(path: str) -> Optional[Dict[str, Any]]:
+    import json
+    from culture_api import normalize_culture_events
+
+    with open(path, encoding="utf-8-sig") as f:
+        raw_data = json.load(f)
+    if raw_data and "showInfo" not in raw_data[0]:
+        # 舊版存檔保存的是已過濾的欄位，缺少重新正規化需要的原始資料
+        print(f"{path} 不是原始回應存檔，略過")
+        return None
+
+    # 由存檔檔名還原類別（與 CultureAPI.get_events 的命名方式相反）
+    category_name = os.path.basename(path).split("藝文活動_")[0]
+    if category_name.startswith("類別"):
+        category = category_name[len("類別"):]
+    elif category_name == "文化部整合綜藝活動":
+        category = "11"
+    else:
+        category = "all"
+    return {"result": list(normalize_culture_events(raw_data, category=category)),
+            "source": f"culture:{category}"}
+
+
+def _replay_taipei(path: str) -> Optional[Dict[str, Any]]:
+    import json
+    from taipei_api import normalize_taipei_events
+
+    with open(path, encoding="utf-8-sig") as f:
+        return {"result": normalize_taipei_events(json.load(f)), "source": "taipei"}
+
+
+def _replay_ntpc(path: str) -> Optional[Dict[str, Any]]:
+    from newtaipei_api import parse_ntpc_payload
+
+    with open(path, "rb") as f:
+        return {"result": parse_ntpc_payload(f.read()), "source": "ntpc"}
+
+
+REPLAY_LOADERS: Dict[str, Callable[[str], Optional[Dict[str, Any]]]] = {
+    "culture": _replay_culture,
+    "taipei": _replay_taipei,
+    "ntpc": _replay_ntpc,
+}
+
+
+def latest_archives(source: str) -> List[str]:
+    """各來源最新的原始資料存檔（文化部每個類別各取最新一份）"""
+    paths = sorted(glob.glob(REPLAY_ARCHIVES[source]))
+    latest: Dict[str, str] = {}
+    for path in paths:
+        # 去掉時間戳記後的檔名當作分組鍵，依檔名排序後最後一份即為最新
+        latest[os.path.basename(path).rsplit("_", 2)[0]] = path
+    return list(latest.values())
+
+
+def command_replay(args: argparse.Namespace) -> int:
+    """以保存的原始回應重新正規化並寫入（不必再向上游請求）"""
+    unsupported = [source for source in args.source if source not in REPLAY_LOADERS]
+    if unsupported:
+        print(f"以下來源沒有可重播的原始存檔：{', '.join(unsupported)}")
+        return 2
+    if args.file and len(args.source) != 1:
+        print("--file 只能搭配單一來源")
+        return 2
+
+    payloads = []
+    for source in args.source:
+        paths = [args.file] if args.file else latest_archives(source)
+        if not paths:
+            print(f"找不到 {source} 的原始存檔")
+        for path in paths:
+            data = REPLAY_LOADERS[source](path)
+            if data is not None:
+                print(f"{path}：{len(data['result'])} 筆（{data['source']}）")
+                payloads.append(data)
+
+    if args.dry_run or not payloads:
+        return 0
+
+    from datetime import datetime
+    from main import connect_to_mysql, ingest_lock, save_to_mysql
+    from watermark import filter_unseen
+
+    if args.bulk:
+        from bulk_load import bulk_save, connect_for_bulk_load
+        from calendar_rollup import rebuild_day_counts
+        connection = connect_for_bulk_load()
+    else:
+        connection = connect_to_mysql()
+    try:
+        with ingest_lock(connection) as acquired:
+            if not acquired:
+                print("另一個匯入程序正在執行，本次略過")
+                return 1
+            for data in payloads:
+                data.update(queryTime=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                            total=len(data["result"]), limit=len(data["result"]), offset=0)
+                # 重播不更新同步水位，但寫入內容摘要供之後的增量比對
+                if args.bulk:
+                    bulk_save(filter_unseen(data, {}), connection, rollup=False)
+                else:
+                    save_to_mysql(filter_unseen(data, {}), connection)
+
+            if args.bulk:
+                # 每日活動數在全部寫入後重新計算一次
+                cursor = connection.cursor(buffered=True)
+                try:
+                    rebuild_day_counts(cursor)
+                    connection.commit()
+                finally:
+                    cursor.close()
+        return 0
+    finally:
+        connection.close()
+
+
+def command_drain(args: argparse.Namespace) -> int:
+    """把匯入佇列中尚未寫入的批次寫入資料庫（不向上游抓取）"""
+    from main import connect_to_mysql, ingest_lock, run_post_ingest
+    from staging_queue import StagingQueue, drain
+
+    connection = connect_to_mysql()
+    try:
+        with ingest_lock(connection) as acquired:
+            if not acquired:
+                print("另一個匯入程序正在執行，本次略過")
+                return 1
+            written = drain(StagingQueue(), connect_to_mysql)
+            print(f"已由匯入佇列寫入 {written} 個批次")
+            if written and not args.skip_post:
+                run_post_ingest(connection, retention=False)
+        return 0
+    finally:
+        connection.close()
+
+
+def command_bench(args: argparse.Namespace) -> int:
+    """執行 benchmarks.py 中的效能基準測試"""
+    import benchmarks
+
+    sys.argv = ["benchmarks.py", *args.names] + (["--rows", str(args.rows)] if args.rows else [])
+    benchmarks.main()
+    return 0
+
+
+def report_import_times(argv: List[str], top: int = 15) -> int:
+    """以 -X importtime 重新執行同一個命令，並列出載入最久的模組"""
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", os.path.abspath(__file__), *argv],
+        stderr=subprocess.PIPE, text=True)
+
+    modules = []
+    for line in process.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if not match:
+            # 不是 importtime 的輸出（例如錯誤訊息）照原樣顯示
+            if not line.startswith("import time:"):
+                print(line, file=sys.stderr)
+            continue
+        self_us, cumulative_us, indent, name = match.groups()
+        modules.append((int(cumulative_us), int(self_us), len(indent) // 2, name))
+
+    total = sum(cumulative for cumulative, _, depth, _ in modules if depth == 0)
+    print(f"\n=== 模組載入時間（共 {total / 1000:.1f} ms，{len(modules)} 個模組）===")
+    for cumulative, self_us, _, name in sorted(modules, reverse=True)[:top]:
+        print(f"{name:<40} 累計 {cumulative / 1000:8.1f} ms  自身 {self_us / 1000:8.1f} ms")
+    return process.returncode
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="活動資料匯入工具")
+    parser.add_argument("--import-times", action="store_true",
+                        help="列出本次執行載入最久的模組")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="從上游抓取並匯入")
+    run.add_argument("--source", type=parse_sources, default=list(SOURCES),
+                     help=f"以逗號分隔的來源（預設全部）：{','.join(SOURCES)}")
+    run.add_argument("--skip-post", action="store_true",
+                     help="略過封存、圖片、地理編碼、重複比對、讀取表與唯讀副本更新等匯入後處理")
+    run.add_argument("--skip-retention", action="store_true", help="略過分區維護")
+    run.set_defaults(handler=command_run)
+
+    replay = commands.add_parser("replay", help="以保存的原始回應重新正規化並匯入")
+    replay.add_argument("--source", type=parse_sources, default=list(REPLAY_LOADERS),
+                        help=f"以逗號分隔的來源（預設全部）：{','.join(REPLAY_LOADERS)}")
+    replay.add_argument("--file", help="指定存檔路徑（預設為各來源最新的存檔）")
+    replay.add_argument("--dry-run", action="store_true", help="只正規化並顯示筆數，不寫入資料庫")
+    replay.add_argument("--bulk", action="store_true",
+                        help="以 LOAD DATA 整批載入（首次回填或整批重建時使用）")
+    replay.set_defaults(handler=command_replay)
+
+    drain = commands.add_parser("drain", help="把匯入佇列中尚未寫入的批次寫入資料庫")
+    drain.add_argument("--skip-post", action="store_true", help="略過匯入後處理")
+    drain.set_defaults(handler=command_drain)
+
+    bench = commands.add_parser("bench", help="執行效能基準測試")
+    bench.add_argument("names", nargs="*", help="要執行的測試（預設全部）")
+    bench.add_argument("--rows", type=int, help="合成資料筆數")
+    bench.set_defaults(handler=command_bench)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    args = build_parser().parse_args(argv)
+    if args.import_times:
+        return report_import_times([arg for arg in argv if arg != "--import-times"])
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,13 +1,44 @@
-from culture_api import CultureAPI
-from tfam_api import TaipeiOpenDataAPI
-from taipei_api import fetch_taipei_events as taipei_events
-from newtaipei_api import fetch_newtaipei_events as newtaipei_events
+# 各資料來源的轉接器、HTTP 用戶端與匯入後處理模組在用到時才載入，
+# 只跑單一來源（python ingest.py run --source ntpc）時不必載入全部
+from retention import migrate_legacy_log_tables, pack_event_ids
+from archive import restore_archived
+from dimensions import (DimensionCache, migrate_event_dimensions, backfill_event_cities,
+                        event_category, event_city, event_coordinates)
+from calendar_rollup import DayCountDelta, ensure_day_counts, rebuild_day_counts, rollup_key
+from watermark import (load_watermark, load_known_digests, filter_unseen,
+                       save_watermark, payload_digest)
 import time
+from contextlib import contextmanager
 from datetime import datetime
 import mysql.connector
 import json
-from typing import Dict, Any
+from typing import Any, Callable, Dict, Optional
 import os
+import sys
+
+
+# 主辦單位與場地 id 的行程內快取（整個匯入程序共用）
+dimension_cache = DimensionCache()
+
+
+# 各資料表的索引（init_database 建立；bulk_load 整批重建時暫時移除 events 的次要索引）
+INDEXES = [
+    ("events", "idx_events_uid", "uid"),
+    ("events", "idx_events_source", "source"),
+    ("events", "idx_events_organizer_id", "organizer_id"),
+    ("events", "idx_events_venue_id", "venue_id"),
+    ("events", "idx_events_canonical_id", "canonical_id"),
+    ("events", "idx_events_category", "category"),
+    ("events", "idx_events_city", "city"),
+    ("events", "idx_events_start_date", "start_date"),
+    ("events", "idx_events_end_date", "end_date"),
+    ("current_events", "idx_current_events_geo", "latitude, longitude"),
+    ("current_events", "idx_current_events_category", "category, position"),
+    ("current_events", "idx_current_events_city", "city, position"),
+    ("current_events", "idx_current_events_source", "source, position"),
+    ("import_dates", "idx_import_dates_date", "import_date"),
+    ("query_results", "idx_query_results_timestamp", "query_timestamp")
+]
 
 
 def init_database() -> None:
@@ -44,16 +75,60 @@ def init_database() -> None:
                         else:
                             raise
 
-        # 建立索引（如果不存在）
-        indexes = [
-            ("events", "idx_events_uid", "uid"),
-            ("events", "idx_events_start_date", "start_date"),
-            ("events", "idx_events_end_date", "end_date"),
-            ("import_dates", "idx_import_dates_date", "import_date"),
-            ("query_results", "idx_query_results_timestamp", "query_timestamp")
+        # 補上舊版資料表缺少的欄位（如果不存在）
+        columns = [
+            ("events", "source", "VARCHAR(50)"),
+            ("events", "content_digest", "CHAR(32)"),
+            ("events", "organizer_id", "BIGINT"),
+            ("events", "venue_id", "BIGINT"),
+            ("events", "thumb_key", "CHAR(64)"),
+            ("events", "image_width", "INTEGER"),
+            ("events", "image_height", "INTEGER"),
+            ("events", "image_dead", "TINYINT(1) NOT NULL DEFAULT 0"),
+            ("events", "canonical_id", "BIGINT"),
+            ("events", "category", "VARCHAR(50)"),
+            ("events", "city", "VARCHAR(20)"),
+            ("current_events", "source", "VARCHAR(20)"),
+            ("current_events", "category", "VARCHAR(50)"),
+            ("current_events", "city", "VARCHAR(20)"),
         ]
 
-        for table, index_name, column in indexes:
+        added = set()
+        for table, column, definition in columns:
+            try:
+                cursor.execute(
+                    f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+                added.add((table, column))
+                print(f"已新增欄位：{table}.{column}")
+            except mysql.connector.Error as e:
+                if e.errno == 1060:  # 欄位已存在
+                    continue
+                else:
+                    raise
+
+        # 移除舊版水位表中沒有用到的欄位
+        try:
+            cursor.execute("ALTER TABLE sync_watermarks DROP COLUMN max_event_date")
+        except mysql.connector.Error as e:
+            if e.errno != 1091:  # 欄位不存在
+                raise
+
+        # 舊版資料表的主辦單位與場地字串改存到維度表
+        migrate_event_dimensions(cursor)
+
+        # 舊版紀錄表改為依月份分區
+        migrate_legacy_log_tables(cursor)
+
+        # 剛新增縣市欄位時由場地地址補上，彙總表的鍵也跟著改用新欄位重新計算
+        if ("events", "city") in added:
+            backfill_event_cities(cursor)
+            rebuild_day_counts(cursor)
+
+        # 剛建立的每日活動數彙總表由既有活動完整計算一次，之後由匯入流程增量維護
+        ensure_day_counts(cursor)
+
+        # 建立索引（如果不存在）
+        for table, index_name, column in INDEXES:
             try:
                 cursor.execute(f"CREATE INDEX {index_name} ON {
                                table}({column})")
@@ -77,14 +152,18 @@ def init_database() -> None:
             connection.close()
 
 
+# 匯入程序使用的資料庫連線設定
+DB_CONFIG = {
+    "host": "localhost",
+    "user": "root",
+    "password": "Kai114615",  # 請更改為您的MySQL密碼
+    "database": "fun_events",
+}
+
+
 def connect_to_mysql() -> mysql.connector.connection.MySQLConnection:
     """建立MySQL資料庫連接"""
-    return mysql.connector.connect(
-        host="localhost",
-        user="root",
-        password="Kai114615",  # 請更改為您的MySQL密碼
-        database="fun_events"
-    )
+    return mysql.connector.connect(**DB_CONFIG)
 
 
 def parse_date(date_str: str) -> str:
@@ -128,6 +207,15 @@ def parse_date(date_str: str) -> str:
         return None
 
 
+# 寫入前比對用的既有活動欄位
+EXISTING_EVENT_SELECT = """
+    SELECT e.id, e.start_date, e.end_date, e.ticket_price,
+           e.related_link, e.image_url, e.organizer_id, e.venue_id,
+           e.source, e.category, e.city, e.canonical_id
+    FROM events e WHERE e.uid = %s
+"""
+
+
 def save_to_mysql(data: Dict[str, Any], connection: mysql.connector.connection.MySQLConnection) -> None:
     """將資料儲存到MySQL資料庫，檢查並更新已存在的資料"""
     if not data:
@@ -148,36 +236,45 @@ def save_to_mysql(data: Dict[str, Any], connection: mysql.connector.connection.M
         # 儲存查詢結果資訊
         if "result" in data:
             cursor.execute(
-                "INSERT INTO query_results (query_timestamp, limit_count, offset_count, total_count, sort_order) VALUES (%s, %s, %s, %s, %s)",
+                "INSERT INTO query_results (query_timestamp, limit_count, offset_count, total_count, sort_order, created_at) VALUES (%s, %s, %s, %s, %s, %s)",
                 (data.get("queryTime", current_time.strftime("%Y-%m-%d %H:%M:%S")),
                  data.get("limit", 0),
                  data.get("offset", 0),
                  data.get("total", 0),
-                 data.get("sort", ""))
+                 data.get("sort", ""),
+                 current_time)
             )
             query_id = cursor.lastrowid
+            event_ids = []
+            day_counts = DayCountDelta()
 
             # 儲存活動資訊
             for idx, event in enumerate(data["result"]):
                 # 檢查是否已存在相同的活動
-                cursor.execute(
-                    """SELECT id, start_date, end_date, ticket_price,
-                              related_link, image_url, address
-                       FROM events WHERE uid = %s""",
-                    (event.get("uid", ""),)
-                )
+                cursor.execute(EXISTING_EVENT_SELECT, (event.get("uid", ""),))
                 existing_event = cursor.fetchone()
 
+                # 已封存的活動再次出現：搬回 events 後照一般的更新規則比對
+                if not existing_event and restore_archived(cursor, [event.get("uid", "")]):
+                    cursor.execute(EXISTING_EVENT_SELECT, (event.get("uid", ""),))
+                    existing_event = cursor.fetchone()
+
                 # 處理日期格式
                 start_date = parse_date(event.get("startDate"))
                 end_date = parse_date(event.get("endDate"))
 
+                # 主辦單位與場地改以維度表 id 儲存
+                organizer_id, venue_id = dimension_cache.ids_for(cursor, event)
+                category = event_category(event)
+                city = event_city(event)
+
                 updates = []
 
                 if existing_event:
                     # 檢查是否需要更新
                     event_id, old_start_date, old_end_date, old_price, \
-                        old_link, old_image, old_address = existing_event
+                        old_link, old_image, old_organizer_id, old_venue_id, \
+                        old_source, old_category, old_city, canonical_id = existing_event
 
                     values = []
 
@@ -202,9 +299,28 @@ def save_to_mysql(data: Dict[str, Any], connection: mysql.connector.connection.M
                         updates.append("image_url = %s")
                         values.append(event.get("imageUrl"))
 
-                    if event.get("address") and event.get("address") != old_address:
-                        updates.append("address = %s")
-                        values.append(event.get("address"))
+                    if organizer_id and organizer_id != old_organizer_id:
+                        updates.append("organizer_id = %s")
+                        values.append(organizer_id)
+
+                    if venue_id and venue_id != old_venue_id:
+                        updates.append("venue_id = %s")
+                        values.append(venue_id)
+
+                    if category and category != old_category:
+                        updates.append("category = %s")
+                        values.append(category)
+
+                    if city and city != old_city:
+                        updates.append("city = %s")
+                        values.append(city)
+
+                    # 更新來源與內容摘要，供下次增量比對
+                    if event.get("contentDigest"):
+                        updates.append("source = %s")
+                        values.append(data.get("source"))
+                        updates.append("content_digest = %s")
+                        values.append(event.get("contentDigest"))
 
                     # 如果有需要更新的欄位
                     if updates:
@@ -214,65 +330,250 @@ def save_to_mysql(data: Dict[str, Any], connection: mysql.connector.connection.M
                                          WHERE id = %s"""
                         cursor.execute(update_query, values)
 
+                    # 代表活動的日期、來源、縣市或類別變動時，每日活動數由舊區間移到新區間
+                    if updates and canonical_id is None:
+                        new_source = data.get("source") if event.get("contentDigest") else old_source
+                        day_counts.move(
+                            (old_start_date, old_end_date,
+                             rollup_key(old_source, old_city, old_category)),
+                            (start_date or old_start_date, end_date or old_end_date,
+                             rollup_key(new_source, city or old_city, category or old_category)))
+
                 else:
-                    # 如果活動不存在，則新增
+                    # 如果活動不存在，則新增（經緯度寫反時對調，不在臺灣範圍內則留給地理編碼補上）
+                    latitude, longitude = event_coordinates(event)
                     cursor.execute(
                         """INSERT INTO events
-                        (uid, activity_name, description, organizer, address,
-                         start_date, end_date, location, latitude, longitude,
-                         ticket_price, related_link, image_url)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)""",
+                        (uid, activity_name, description, organizer_id, venue_id,
+                         start_date, end_date, latitude, longitude,
+                         ticket_price, related_link, image_url,
+                         source, category, city, content_digest)
+                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)""",
                         (event.get("uid", ""),
                          event.get("title", ""),
                          event.get("description", ""),
-                         event.get("organizer", ""),
-                         event.get("address", ""),
+                         organizer_id,
+                         venue_id,
                          start_date,
                          end_date,
-                         event.get("location", ""),
-                         event.get("latitude", None),
-                         event.get("longitude", None),
+                         latitude,
+                         longitude,
                          event.get("price", ""),
                          event.get("url", ""),
-                         event.get("imageUrl", ""))
+                         event.get("imageUrl", ""),
+                         data.get("source"),
+                         category or None,
+                         city or None,
+                         event.get("contentDigest"))
                     )
                     event_id = cursor.lastrowid
+                    day_counts.add(start_date, end_date,
+                                   rollup_key(data.get("source"), city, category))
 
-                # 建立查詢結果和活動的關聯（先檢查是否已存在）
-                cursor.execute(
-                    """SELECT query_id, event_id FROM query_event_relations
-                       WHERE query_id = %s AND event_id = %s""",
-                    (query_id, event_id)
-                )
-                existing_relation = cursor.fetchone()
+                event_ids.append(event_id)
 
-                if not existing_relation:
-                    cursor.execute(
-                        """INSERT INTO query_event_relations
-                           (query_id, event_id, display_order)
-                           VALUES (%s, %s, %s)""",
-                        (query_id, event_id, idx + 1)
-                    )
-                else:
-                    # 如果關聯已存在，更新 display_order
-                    cursor.execute(
-                        """UPDATE query_event_relations
-                           SET display_order = %s
-                           WHERE query_id = %s AND event_id = %s""",
-                        (idx + 1, query_id, event_id)
-                    )
+            # 本次查詢包含的活動依顯示順序壓縮成一列（取代逐筆關聯列）
+            cursor.execute(
+                """INSERT INTO run_event_sets (query_id, created_at, event_count, event_ids)
+                   VALUES (%s, %s, %s, %s)""",
+                (query_id, current_time, len(event_ids), pack_event_ids(event_ids))
+            )
+            day_counts.apply(cursor)
 
         connection.commit()
 
     except Exception as e:
         connection.rollback()
+        dimension_cache.reset()
         raise e
     finally:
         if cursor:
             cursor.close()
 
 
+def sync_source(data: Dict[str, Any], connection: mysql.connector.connection.MySQLConnection) -> None:
+    """依照來源水位做增量匯入：內容未變動則略過，否則只寫入新增或變動的活動"""
+    if not data or "result" not in data:
+        return
+
+    source = data.get("source")
+    if not source:
+        save_to_mysql(data, connection)
+        return
+
+    digest = payload_digest(data["result"])
+    watermark = load_watermark(connection, source)
+    if watermark and watermark["content_digest"] == digest:
+        print(f"{source} 資料未變動，略過匯入")
+        save_watermark(connection, source, data, digest)
+        return
+
+    uids = [str(event.get("uid", "")) for event in data["result"]]
+    fresh = filter_unseen(data, load_known_digests(connection, uids))
+    print(f"{source} 共 {len(data['result'])} 筆，其中 {len(fresh['result'])} 筆為新增或變動")
+    if fresh["result"]:
+        save_to_mysql(fresh, connection)
+    save_watermark(connection, source, data, digest)
+
+
+# 匯入程序之間的互斥鎖名稱（MySQL advisory lock，連線中斷時自動釋放）
+INGEST_LOCK_NAME = "fun_events.ingest"
+
+
+@contextmanager
+def ingest_lock(connection: mysql.connector.connection.MySQLConnection, timeout: int = 0):
+    """
+    取得匯入互斥鎖，避免排程常駐程式與手動執行同時寫入
+
+    Yields:
+        bool: 是否成功取得鎖；未取得時呼叫端應略過本次匯入
+    """
+    cursor = connection.cursor(buffered=True)
+    try:
+        cursor.execute("SELECT GET_LOCK(%s, %s)", (INGEST_LOCK_NAME, timeout))
+        acquired = cursor.fetchone()[0] == 1
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                cursor.execute("SELECT RELEASE_LOCK(%s)", (INGEST_LOCK_NAME,))
+                cursor.fetchone()
+    finally:
+        cursor.close()
+
+
+def _direct_save(connection: mysql.connector.connection.MySQLConnection
+                 ) -> Callable[[Dict[str, Any]], None]:
+    """不經過匯入佇列，抓到的批次直接寫入資料庫"""
+    return lambda data: sync_source(data, connection)
+
+
+def ingest_culture(connection: mysql.connector.connection.MySQLConnection,
+                   save: Optional[Callable[[Dict[str, Any]], None]] = None) -> None:
+    """文化部展演資訊（依類別分片並行抓取，包含整合綜藝活動）與節慶活動"""
+    from culture_api import CultureAPI
+    save = save or _direct_save(connection)
+
+    # 每個類別分片一到就正規化並放入佇列，跨分片重複的活動只寫入一次
+    culture_api = CultureAPI()
+    for shard in culture_api.get_events_by_category():
+        save(shard)
+    print("文化部展演資訊獲取完成！\n")
+
+    festival_events = culture_api.get_festival_events()
+    save(festival_events)
+    print("文化部節慶活動獲取完成！\n")
+
+
+def ingest_tfam(connection: mysql.connector.connection.MySQLConnection,
+                save: Optional[Callable[[Dict[str, Any]], None]] = None) -> None:
+    """台北市立美術館展覽與活動資訊（每次讀取整份資料集，只寫入新增或修改的活動）"""
+    from tfam_api import TaipeiOpenDataAPI
+    save = save or _direct_save(connection)
+
+    tfam_api_1 = TaipeiOpenDataAPI()  # 展覽資訊
+    tfam_api_2 = TaipeiOpenDataAPI(
+        "1700a7e6-3d27-47f9-89d9-1811c9f7489c")  # 活動資訊
+
+    for tfam_api in (tfam_api_1, tfam_api_2):
+        results = tfam_api.fetch_all()
+        if results:
+            save(results)
+    print("台北市立美術館資訊獲取完成！\n")
+
+
+def ingest_taipei(connection: mysql.connector.connection.MySQLConnection,
+                  save: Optional[Callable[[Dict[str, Any]], None]] = None) -> None:
+    """台北市政府開放資料活動資訊"""
+    from taipei_api import fetch_taipei_events as taipei_events
+    save = save or _direct_save(connection)
+
+    taipei_data = taipei_events()
+    save(taipei_data)
+    print("台北市政府活動資訊獲取完成！\n")
+
+
+def ingest_ntpc(connection: mysql.connector.connection.MySQLConnection,
+                save: Optional[Callable[[Dict[str, Any]], None]] = None) -> None:
+    """新北市政府開放資料活動資訊"""
+    from newtaipei_api import fetch_newtaipei_events as newtaipei_events
+    save = save or _direct_save(connection)
+
+    newtaipei_data = newtaipei_events()
+    save(newtaipei_data)
+    print("新北市政府活動資訊獲取完成！\n")
+
+
+# 各資料來源的匯入工作（鍵與 sync_watermarks.source 的前綴相同）
+SOURCE_JOBS = {
+    "culture": ("文化部展演資訊", ingest_culture),
+    "tfam": ("台北市立美術館資訊", ingest_tfam),
+    "taipei": ("台北市政府活動資訊", ingest_taipei),
+    "ntpc": ("新北市政府活動資訊", ingest_ntpc),
+}
+
+
+def run_post_ingest(connection: mysql.connector.connection.MySQLConnection,
+                    retention: bool = True) -> None:
+    """匯入後的共用處理：封存、圖片、地理編碼、重複比對、目前活動讀取表、唯讀副本與分區維護"""
+    from archive import run_archive
+    from image_pipeline import run_image_stage
+    from geocode import run_geocode_stage
+    from dedup import run_dedup
+    from current_events import refresh_current_events
+    from replica import publish_replica
+    from retention import run_retention
+
+    # 結束一段時間的活動移到封存表，之後的階段只處理熱資料表
+    print("正在封存已結束的活動...")
+    run_archive(connection)
+    print("活動封存完成！\n")
+
+    # 下載活動圖片並產生縮圖
+    print("正在處理活動圖片...")
+    run_image_stage(connection)
+    print("活動圖片處理完成！\n")
+
+    # 以本機地名資料為沒有座標的活動補上座標
+    print("正在補上活動座標...")
+    run_geocode_stage(connection)
+    print("活動座標處理完成！\n")
+
+    # 比對跨來源的重複活動
+    print("正在比對跨來源重複活動...")
+    run_dedup(connection)
+    print("重複活動比對完成！\n")
+
+    # 重建目前活動讀取表並原子換上（只包含代表活動）
+    print("正在更新目前活動讀取表...")
+    refresh_current_events(connection)
+    print("目前活動讀取表更新完成！\n")
+
+    # 發布網站讀取用的 SQLite 副本
+    print("正在發布唯讀副本...")
+    publish_replica(connection)
+    print("唯讀副本發布完成！\n")
+
+    # 維護紀錄表分區並刪除過期資料
+    if retention:
+        run_retention(connection)
+
+
+def print_http_metrics() -> None:
+    """顯示各上游主機的限流與斷路器狀態，並關閉共用的 HTTP 用戶端"""
+    # 沒有載入過 HTTP 用戶端（沒有抓取任何來源）時不必為了關閉而載入
+    if "http_client" not in sys.modules:
+        return
+    from http_client import get_client
+
+    for host, stats in get_client().metrics().items():
+        print(f"{host}: {stats}")
+    get_client().close()
+
+
 def main():
+    from staging_queue import staged_ingest
+
     print(
         f"\n=== 開始執行資料獲取程序 - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ===\n")
 
@@ -286,50 +587,18 @@ def main():
         # 建立資料庫連接
         connection = connect_to_mysql()
 
-        # 1. 執行文化部展演資訊 API
-        print("1. 正在獲取文化部展演資訊...")
-        culture_api = CultureAPI()
-        culture_events = culture_api.get_events()
-        # 儲存到MySQL
-        save_to_mysql(culture_events, connection)
-        print("文化部展演資訊獲取完成並儲存到資料庫！\n")
-
-        integrated_events = culture_api.get_integrated_events()
-        save_to_mysql(integrated_events, connection)
-        print("文化部整合綜藝活動獲取完成並儲存到資料庫！\n")
-
-        festival_events = culture_api.get_festival_events()
-        save_to_mysql(festival_events, connection)
-        print("文化部節慶活動獲取完成並儲存到資料庫！\n")
-
-        # 2. 執行台北市立美術館 API
-        print("2. 正在獲取台北市立美術館資訊...")
-        tfam_api_1 = TaipeiOpenDataAPI()  # 展覽資訊
-        tfam_api_2 = TaipeiOpenDataAPI(
-            "1700a7e6-3d27-47f9-89d9-1811c9f7489c")  # 活動資訊
-
-        # 獲取展覽資訊
-        results_1 = tfam_api_1.fetch_data(limit=10)
-        if results_1:
-            save_to_mysql(results_1, connection)
-
-        # 獲取活動資訊
-        results_2 = tfam_api_2.fetch_data(limit=10)
-        if results_2:
-            save_to_mysql(results_2, connection)
-        print("台北市立美術館資訊獲取完成並儲存到資料庫！\n")
-
-        # 3. 執行台北市政府開放資料 API
-        print("3. 正在獲取台北市政府活動資訊...")
-        taipei_data = taipei_events()
-        save_to_mysql(taipei_data, connection)
-        print("台北市政府活動資訊獲取完成並儲存到資料庫！\n")
-
-        # 4. 執行新北市政府開放資料 API
-        print("4. 正在獲取新北市政府活動資訊...")
-        newtaipei_data = newtaipei_events()
-        save_to_mysql(newtaipei_data, connection)
-        print("新北市政府活動資訊獲取完成並儲存到資料庫！\n")
+        with ingest_lock(connection) as acquired:
+            if not acquired:
+                print("另一個匯入程序正在執行，本次略過")
+                return
+
+            # 抓到的批次先放進匯入佇列，由背景執行緒寫入資料庫（上次未寫完的批次優先）
+            with staged_ingest() as save:
+                for step, (name, job) in enumerate(SOURCE_JOBS.values(), start=1):
+                    print(f"{step}. 正在獲取{name}...")
+                    job(connection, save)
+
+            run_post_ingest(connection)
 
         print(
             f"\n=== 所有資料獲取完成並儲存到資料庫 - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ===")
@@ -340,6 +609,8 @@ def main():
         if connection:
             connection.close()
 
+        print_http_metrics()
+
 
 if __name__ == "__main__":
     main()
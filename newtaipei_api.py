@@ -1,10 +1,11 @@
-import requests
 import json
 from datetime import datetime
 import os
 import csv
 import io
-import time
+import itertools
+from typing import Any, Dict, Iterator, List, Optional
+from http_client import get_client, HttpError, HttpTimeout
 
 
 def convert_date_format(date_str: str) -> str:
@@ -43,140 +44,152 @@ def convert_date_format(date_str: str) -> str:
     return None
 
 
+# 新北市 CSV 欄位 → 標準格式欄位
+NTPC_FIELDS = {
+    "id": "uid",
+    "title": "title",
+    "description": "description",
+    "author": "organizer",
+    "address": "address",
+    "activedate": "startDate",
+    "activeenddate": "endDate",
+    "place": "location",
+    "abouturl": "url",
+    "picurl": "imageUrl",
+    "classname": "category",
+}
+
+# 需要做日期轉換的標準欄位
+NTPC_DATE_FIELDS = ("startDate", "endDate")
+
+
+def read_csv_columns(raw: bytes, chunk_rows: int = 5000) -> Iterator[Dict[str, List[str]]]:
+    """直接從位元組分塊解析 CSV，每個區塊以「標準欄位 → 值陣列」的欄式結構回傳"""
+    stream = io.TextIOWrapper(io.BytesIO(raw), encoding='utf-8-sig', newline='')
+    reader = csv.reader(stream)
+    header = next(reader, None)
+    if not header:
+        return
+
+    # 只保留需要的欄位及其位置
+    wanted = [(idx, NTPC_FIELDS[name.strip()])
+              for idx, name in enumerate(header) if name.strip() in NTPC_FIELDS]
+
+    while True:
+        rows = list(itertools.islice(reader, chunk_rows))
+        if not rows:
+            break
+        yield {field: [row[idx] if idx < len(row) else "" for row in rows]
+               for idx, field in wanted}
+
+
+def convert_date_column(values: List[str]) -> List[Optional[str]]:
+    """整欄批次轉換日期：相同字串只解析一次"""
+    cache = {value: convert_date_format(value) for value in set(values)}
+    return [cache[value] for value in values]
+
+
+def normalize_columns(columns: Dict[str, List[str]]) -> List[Dict[str, Any]]:
+    """將欄式資料一次轉成標準格式的活動清單"""
+    size = len(next(iter(columns.values()), []))
+    blank = [""] * size
+    for field in NTPC_DATE_FIELDS:
+        if field in columns:
+            columns[field] = convert_date_column(columns[field])
+
+    return [
+        {
+            "uid": uid,
+            "title": title,
+            "description": description,
+            "organizer": organizer,
+            "address": address,
+            "startDate": start_date or None,
+            "endDate": end_date or None,
+            "location": location,
+            "latitude": None,  # 新北市的資料沒有經緯度資訊
+            "longitude": None,
+            "price": "",  # 新北市的資料沒有價格資訊
+            "url": url,
+            "imageUrl": image_url,
+            "category": category,
+            "city": "新北市"
+        }
+        for uid, title, description, organizer, address, start_date, end_date,
+        location, url, image_url, category in zip(
+            *(columns.get(field, blank) for field in (
+                "uid", "title", "description", "organizer", "address",
+                "startDate", "endDate", "location", "url", "imageUrl", "category")))
+    ]
+
+
+def parse_ntpc_payload(raw: bytes, chunk_rows: int = 5000) -> List[Dict[str, Any]]:
+    """解析新北市回應內容（CSV 為主，偶爾會是 JSON），直接產生標準格式活動"""
+    head = raw[:16].lstrip(b'\xef\xbb\xbf \t\r\n')
+    if head[:1] in (b'[', b'{'):
+        events = json.loads(raw.decode('utf-8-sig'))
+        columns = {field: [str(event.get(name, "") or "") for event in events]
+                   for name, field in NTPC_FIELDS.items()}
+        return normalize_columns(columns)
+
+    result = []
+    for columns in read_csv_columns(raw, chunk_rows):
+        result.extend(normalize_columns(columns))
+    return result
+
+
 def fetch_newtaipei_events():
     """
     從新北市政府開放資料平台獲取活動資訊
     """
     url = "https://data.ntpc.gov.tw/api/datasets/029e3fc2-1927-4534-8702-da7323be969b/csv"
 
-    # 設定請求參數
-    timeout = 30  # 設定30秒超時
-    max_retries = 3
-    retry_delay = 5  # 重試間隔5秒
+    try:
+        response = get_client().get(url)
+        raw = response.content
 
-    for attempt in range(max_retries):
         try:
-            response = requests.get(url, timeout=timeout)
-            response.raise_for_status()
-
-            try:
-                # 先嘗試解析為 JSON
-                events = response.json()
-            except json.JSONDecodeError:
-                try:
-                    # JSON 解析失敗，嘗試解析 CSV
-                    csv_content = io.StringIO(
-                        response.content.decode('utf-8-sig'))
-                    csv_reader = csv.DictReader(csv_content)
-                    events = []
-                    for row in csv_reader:
-                        event = {
-                            "id": row.get("id", ""),
-                            "title": row.get("title", ""),
-                            "activedate": row.get("activedate", ""),
-                            "activeenddate": row.get("activeenddate", ""),
-                            "description": row.get("description", ""),
-                            "classname": row.get("classname", ""),
-                            "author": row.get("author", ""),
-                            "place": row.get("place", ""),
-                            "placeTel": row.get("placeTel", ""),
-                            "address": row.get("address", ""),
-                            "traffic": row.get("traffic", ""),
-                            "abouturl": row.get("abouturl", ""),
-                            "picurl": row.get("picurl", "")
-                        }
-                        events.append(event)
-                except (csv.Error, UnicodeDecodeError) as e:
-                    print(f"CSV 解析錯誤: {e}")
-                    raise
-
-            # 將資料轉換為標準格式
-            formatted_events = []
-            for event in events:
-                formatted_event = {
-                    "id": event.get("id", ""),
-                    "活動名稱": event.get("title", ""),
-                    "活動起始日期": event.get("activedate", ""),
-                    "活動結束日期": event.get("activeenddate", ""),
-                    "簡介說明": event.get("description", ""),
-                    "活動類別": event.get("classname", ""),
-                    "主辦單位": event.get("author", ""),
-                    "活動場地": event.get("place", ""),
-                    "場地電話": event.get("placeTel", ""),
-                    "地址": event.get("address", ""),
-                    "交通說明": event.get("traffic", ""),
-                    "相關連結": event.get("abouturl", ""),
-                    "圖片連結": event.get("picurl", "")
-                }
-                formatted_events.append(formatted_event)
-            events = formatted_events
-
-            # 建立固定名稱的輸出目錄
-            output_dir = "newtaipei_api"
-            if not os.path.exists(output_dir):
-                os.makedirs(output_dir)
-
-            # 儲存完整資料（檔名包含時間戳記）
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            output_file = os.path.join(
-                output_dir, f"新北市政府近期活動_{timestamp}.json")
-            with open(output_file, "w", encoding="utf-8-sig") as f:
-                json.dump(events, f, ensure_ascii=False, indent=2)
-
-            print(f"成功獲取 {len(events)} 筆活動資料")
-            print(f"資料已儲存至: {output_file}")
-
-            # 將資料轉換為標準格式
-            formatted_data = {
-                "result": [],
-                "queryTime": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "total": len(events),
-                "limit": len(events),
-                "offset": 0
-            }
-
-            for event in events:
-                formatted_event = {
-                    "uid": event["id"],
-                    "title": event["活動名稱"],
-                    "description": event["簡介說明"],
-                    "organizer": event["主辦單位"],
-                    "address": event["地址"],
-                    "startDate": convert_date_format(event["活動起始日期"]),
-                    "endDate": convert_date_format(event["活動結束日期"]),
-                    "location": event["活動場地"],
-                    "latitude": None,  # 新北市的資料沒有經緯度資訊
-                    "longitude": None,
-                    "price": "",  # 新北市的資料沒有價格資訊
-                    "url": event["相關連結"],
-                    "imageUrl": event["圖片連結"]
-                }
-                formatted_data["result"].append(formatted_event)
-
-            return formatted_data
-
-        except requests.exceptions.Timeout:
-            if attempt < max_retries - 1:
-                print(f"請求超時，{retry_delay}秒後進行第{attempt + 2}次嘗試...")
-                time.sleep(retry_delay)
-                continue
-            print(f"請求超時，已重試{max_retries}次仍然失敗")
-            return {"result": [], "error": "請求超時"}
-
-        except requests.exceptions.RequestException as e:
-            if attempt < max_retries - 1:
-                print(f"請求失敗，{retry_delay}秒後進行第{attempt + 2}次嘗試... 錯誤: {e}")
-                time.sleep(retry_delay)
-                continue
-            print(f"獲取資料失敗，已重試{max_retries}次: {e}")
-            return {"result": [], "error": str(e)}
-
-        except Exception as e:
-            print(f"發生未預期的錯誤: {e}")
-            return {"result": [], "error": str(e)}
-
-        # 如果成功獲取數據，跳出重試循環
-        break
+            events = parse_ntpc_payload(raw)
+        except (csv.Error, UnicodeDecodeError, json.JSONDecodeError) as e:
+            print(f"CSV 解析錯誤: {e}")
+            raise
+
+        # 建立固定名稱的輸出目錄
+        output_dir = "newtaipei_api"
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+
+        # 儲存原始資料（檔名包含時間戳記），不另外產生解碼後的副本
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        output_file = os.path.join(
+            output_dir, f"新北市政府近期活動_{timestamp}.csv")
+        with open(output_file, "wb") as f:
+            f.write(raw)
+
+        print(f"成功獲取 {len(events)} 筆活動資料")
+        print(f"資料已儲存至: {output_file}")
+
+        # 將資料轉換為標準格式
+        return {
+            "result": events,
+            "source": "ntpc",
+            "queryTime": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "total": len(events),
+            "limit": len(events),
+            "offset": 0
+        }
+
+    except HttpTimeout:
+        print("請求超時，已重試仍然失敗")
+        return {"result": [], "error": "請求超時"}
+
+    except HttpError as e:
+        print(f"獲取資料失敗: {e}")
+        return {"result": [], "error": str(e)}
+
+    except Exception as e:
+        print(f"發生未預期的錯誤: {e}")
+        return {"result": [], "error": str(e)}
 
 
 if __name__ == "__main__":
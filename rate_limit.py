@@ -0,0 +1,182 @@
+import asyncio
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Optional
+
+import httpx
+
+
+class CircuitOpenError(httpx.RequestError):
+    """主機斷路器開啟中，直接失敗不送出請求"""
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析 Retry-After 標頭（秒數或 HTTP 日期），回傳需等待的秒數"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """自適應權杖桶：被限流時速率減半並暫停到 Retry-After，成功時再逐步回升"""
+
+    def __init__(self, rate: float = 5.0, capacity: float = 5.0, min_rate: float = 0.2):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min_rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.throttled = 0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self) -> None:
+        """取得一個權杖，不足時以非阻塞方式等待"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def throttle(self, retry_after: Optional[float] = None) -> None:
+        """收到 429/503 時呼叫：速率減半，並依 Retry-After 暫停"""
+        self.throttled += 1
+        self.rate = max(self.min_rate, self.rate / 2)
+        if retry_after:
+            self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+
+    def success(self) -> None:
+        """請求成功時緩慢恢復速率"""
+        self.rate = min(self.max_rate, self.rate + self.max_rate * 0.1)
+
+
+class CircuitBreaker:
+    """連續失敗達門檻即開啟，冷卻期間直接失敗；冷卻後只放行一個試探請求，結果出來前其餘請求照樣直接失敗"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, cooldown: float = 60.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.rejected = 0
+
+    def allow(self) -> bool:
+        """判斷目前是否允許送出請求（同一事件迴圈內呼叫，不需要額外加鎖）"""
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN and not self.probing:
+            self.probing = True
+            return True
+        if self.state == self.CLOSED:
+            return True
+        self.rejected += 1
+        return False
+
+    def release_probe(self) -> None:
+        """試探請求沒有得到結果（例如被取消）時交還名額，下一個請求可以再試探"""
+        self.probing = False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.probing = False
+        self.state = self.CLOSED
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self.probing = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+
+class HostGuard:
+    """單一上游主機的限流器、斷路器與統計"""
+
+    def __init__(self, host: str, rate: float = 5.0, failure_threshold: int = 5, cooldown: float = 60.0):
+        self.host = host
+        self.bucket = TokenBucket(rate=rate, capacity=rate)
+        self.breaker = CircuitBreaker(failure_threshold, cooldown)
+        self.requests = 0
+        self.errors = 0
+
+    async def before_request(self, request: Optional[httpx.Request] = None) -> bool:
+        """
+        送出請求前檢查斷路器並取得權杖
+
+        Returns:
+            bool: 這個請求是否為半開狀態下的試探請求
+        """
+        if not self.breaker.allow():
+            if self.breaker.state == CircuitBreaker.HALF_OPEN:
+                raise CircuitOpenError(f"{self.host} 斷路器試探中，暫不送出其他請求", request=request)
+            remaining = self.breaker.cooldown - (time.monotonic() - self.breaker.opened_at)
+            raise CircuitOpenError(
+                f"{self.host} 斷路器開啟中，{remaining:.0f}秒內不再嘗試", request=request)
+        probe = self.breaker.state == CircuitBreaker.HALF_OPEN
+        try:
+            await self.bucket.acquire()
+        except BaseException:
+            self.after_abort(probe)
+            raise
+        self.requests += 1
+        return probe
+
+    def after_response(self, response: httpx.Response) -> None:
+        """依回應狀態更新限流與斷路器"""
+        if response.status_code in (429, 503):
+            self.bucket.throttle(parse_retry_after(response.headers.get("Retry-After")))
+        if response.status_code >= 500 or response.status_code == 429:
+            self.errors += 1
+            self.breaker.record_failure()
+        else:
+            self.bucket.success()
+            self.breaker.record_success()
+
+    def after_error(self) -> None:
+        """連線錯誤或逾時"""
+        self.errors += 1
+        self.breaker.record_failure()
+
+    def after_abort(self, probe: bool) -> None:
+        """請求被取消或發生非連線錯誤，沒有任何回應可判斷主機狀態；試探請求要交還名額"""
+        if probe:
+            self.breaker.release_probe()
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "rate": round(self.bucket.rate, 2),
+            "tokens": round(self.bucket.tokens, 2),
+            "throttled": self.bucket.throttled,
+            "breaker": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "rejected": self.breaker.rejected,
+        }
@@ -0,0 +1,217 @@
+"""
+網站讀取用的 SQLite 唯讀副本
+
+每次匯入成功後，把活動 API 需要的資料表（目前活動讀取表、分面統計、每日活動數、
+變更紀錄，以及活動詳情與 include_past 列表所需的欄位）從 MySQL 複製成
+一個建好索引的 SQLite 檔案，先寫到同目錄的暫存檔，完成後以 os.replace 原子地換上。
+Django 透過資料庫路由讓活動 API 讀這個檔案：匯入期間的長交易不影響讀取延遲，
+本機開發不必架 MySQL，網站也能以複製單一檔案的方式水平擴充。
+
+用法:
+    python replica.py
+    python replica.py --path /srv/events/events.sqlite3
+"""
+import argparse
+import os
+import sqlite3
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Optional
+
+# 預設位置（與 theme_entertainment/settings.py 的 EVENT_REPLICA_PATH 相同）
+REPLICA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "replica", "events.sqlite3")
+
+# events 與 events_archive 複製到副本的欄位
+ARCHIVE_COLUMNS = """id, uid, activity_name, description, organizer_id, venue_id,
+    start_date, end_date, related_link, image_url, thumb_key, image_dead,
+    canonical_id, source, category, city"""
+ARCHIVE_COLUMNS_DDL = """
+    id INTEGER PRIMARY KEY, uid TEXT NOT NULL, activity_name TEXT NOT NULL,
+    description TEXT, organizer_id INTEGER, venue_id INTEGER,
+    start_date DATE, end_date DATE, related_link TEXT, image_url TEXT, thumb_key TEXT,
+    image_dead INTEGER NOT NULL DEFAULT 0, canonical_id INTEGER,
+    source TEXT, category TEXT, city TEXT"""
+
+# 副本的資料表：(建表敘述, 從 MySQL 讀取的 SELECT)，欄位順序需一致
+REPLICA_TABLES = {
+    "current_events": (
+        """CREATE TABLE current_events (
+            position INTEGER PRIMARY KEY, event_id INTEGER, uid TEXT NOT NULL,
+            title TEXT NOT NULL, description TEXT, organizer_id INTEGER, organizer TEXT,
+            venue_id INTEGER, location TEXT, address TEXT, start_date DATE, end_date DATE,
+            latitude REAL, longitude REAL, ticket_price TEXT, related_link TEXT,
+            image_url TEXT, thumb_key TEXT, has_image INTEGER NOT NULL DEFAULT 0,
+            source TEXT, category TEXT, city TEXT)""",
+        """SELECT position, event_id, uid, title, description, organizer_id, organizer,
+                  venue_id, location, address, start_date, end_date, latitude, longitude,
+                  ticket_price, related_link, image_url, thumb_key, has_image,
+                  source, category, city
+           FROM current_events""",
+    ),
+    "current_event_facets": (
+        """CREATE TABLE current_event_facets (
+            category TEXT, city TEXT, source TEXT, has_image INTEGER NOT NULL DEFAULT 0,
+            end_date DATE, event_count INTEGER NOT NULL)""",
+        """SELECT category, city, source, has_image, end_date, event_count
+           FROM current_event_facets""",
+    ),
+    "event_day_counts": (
+        """CREATE TABLE event_day_counts (
+            day DATE NOT NULL, source TEXT NOT NULL, city TEXT NOT NULL,
+            category TEXT NOT NULL, event_count INTEGER NOT NULL,
+            PRIMARY KEY (day, source, city, category))""",
+        "SELECT day, source, city, category, event_count FROM event_day_counts",
+    ),
+    "event_day_ranges": (
+        """CREATE TABLE event_day_ranges (
+            start_day DATE NOT NULL, end_day DATE NOT NULL, source TEXT NOT NULL,
+            city TEXT NOT NULL, category TEXT NOT NULL, event_count INTEGER NOT NULL,
+            PRIMARY KEY (start_day, end_day, source, city, category))""",
+        "SELECT start_day, end_day, source, city, category, event_count FROM event_day_ranges",
+    ),
+    # 活動詳情以 uid 查 events（包含已結束與重複的活動），列表加上 include_past 時連同
+    # 封存表一起查詢；只複製詳情與篩選用得到的欄位
+    "events": (
+        f"CREATE TABLE events ({ARCHIVE_COLUMNS_DDL})",
+        f"SELECT {ARCHIVE_COLUMNS} FROM events",
+    ),
+    "events_archive": (
+        f"CREATE TABLE events_archive ({ARCHIVE_COLUMNS_DDL})",
+        f"SELECT {ARCHIVE_COLUMNS} FROM events_archive",
+    ),
+    # 增量同步用的變更紀錄（與 current_events 來自同一次匯入，序號與讀取表一致）
+    "event_changes": (
+        """CREATE TABLE event_changes (
+            seq INTEGER PRIMARY KEY, uid TEXT NOT NULL, deleted INTEGER NOT NULL DEFAULT 0)""",
+        "SELECT seq, uid, deleted FROM event_changes",
+    ),
+    "organizers": (
+        "CREATE TABLE organizers (id INTEGER PRIMARY KEY, name TEXT NOT NULL)",
+        "SELECT id, name FROM organizers",
+    ),
+    "venues": (
+        "CREATE TABLE venues (id INTEGER PRIMARY KEY, name TEXT NOT NULL, address TEXT)",
+        "SELECT id, name, address FROM venues",
+    ),
+}
+
+# 資料寫完才建立索引；涵蓋列表篩選、關鍵字搜尋前的條件、日期與詳情查詢
+REPLICA_INDEXES = [
+    "CREATE UNIQUE INDEX uq_current_events_uid ON current_events (uid)",
+    "CREATE INDEX idx_current_events_end_date ON current_events (end_date, position)",
+    "CREATE INDEX idx_current_events_image ON current_events (has_image, position)",
+    "CREATE INDEX idx_current_events_organizer ON current_events (organizer_id, position)",
+    "CREATE INDEX idx_current_events_venue ON current_events (venue_id, position)",
+    "CREATE INDEX idx_current_events_category ON current_events (category, position)",
+    "CREATE INDEX idx_current_events_city ON current_events (city, position)",
+    "CREATE INDEX idx_current_events_source ON current_events (source, position)",
+    "CREATE INDEX idx_current_events_geo ON current_events (latitude, longitude)",
+    "CREATE INDEX idx_events_uid ON events (uid)",
+    "CREATE INDEX idx_events_archive_uid ON events_archive (uid)",
+]
+
+# 副本的版本資訊（每次發布一列）
+META_TABLE = """CREATE TABLE replica_meta (
+    generation TEXT NOT NULL, published_at TEXT NOT NULL, event_count INTEGER NOT NULL)"""
+
+# MySQL 的 DECIMAL 與 DATE 寫入 SQLite 時的轉換
+sqlite3.register_adapter(Decimal, float)
+sqlite3.register_adapter(date, date.isoformat)
+
+
+def _copy_table(source_cursor, target: sqlite3.Connection, create: str, select: str,
+                batch_size: int) -> int:
+    target.execute(create)
+    table = create.split()[2]
+    source_cursor.execute(select)
+    placeholders = ", ".join("?" * len(source_cursor.description))
+    count = 0
+    while True:
+        rows = source_cursor.fetchmany(batch_size)
+        if not rows:
+            return count
+        target.executemany(f"INSERT INTO {table} VALUES ({placeholders})", rows)
+        count += len(rows)
+
+
+def publish_replica(connection, path: Optional[str] = None, batch_size: int = 5000) -> str:
+    """
+    由 MySQL 建立 SQLite 副本並原子地換上
+
+    Returns:
+        str: 這次發布的版本（generation）
+    """
+    path = path or REPLICA_PATH
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+
+    generation = datetime.now().strftime("%Y%m%d%H%M%S%f")
+    cursor = None
+    target = sqlite3.connect(temp_path)
+    try:
+        # 暫存檔在換上前沒有讀取端，不需要日誌與同步寫入
+        target.execute("PRAGMA journal_mode = OFF")
+        target.execute("PRAGMA synchronous = OFF")
+
+        # 以不緩衝的游標分批讀取，不必把整張表放進記憶體
+        cursor = connection.cursor()
+        counts = {table: _copy_table(cursor, target, create, select, batch_size)
+                  for table, (create, select) in REPLICA_TABLES.items()}
+        for statement in REPLICA_INDEXES:
+            target.execute(statement)
+
+        target.execute(META_TABLE)
+        target.execute("INSERT INTO replica_meta VALUES (?, ?, ?)",
+                       (generation, datetime.now().isoformat(timespec="seconds"),
+                        counts["current_events"]))
+        target.commit()
+        # 讓 SQLite 依實際資料分布選擇索引
+        target.execute("ANALYZE")
+        target.close()
+        target = None
+
+        os.replace(temp_path, path)
+        print(f"已發布唯讀副本：{path}（{counts['current_events']} 筆目前活動）")
+        return generation
+
+    except Exception:
+        if os.path.exists(temp_path):
+            if target is not None:
+                target.close()
+                target = None
+            os.remove(temp_path)
+        raise
+    finally:
+        if target is not None:
+            target.close()
+        if cursor:
+            cursor.close()
+
+
+def replica_generation(path: Optional[str] = None) -> Optional[str]:
+    """目前副本的版本，副本不存在時為 None"""
+    path = path or REPLICA_PATH
+    if not os.path.exists(path):
+        return None
+    replica = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        row = replica.execute("SELECT generation FROM replica_meta").fetchone()
+        return row[0] if row else None
+    finally:
+        replica.close()
+
+
+if __name__ == "__main__":
+    from main import connect_to_mysql
+
+    parser = argparse.ArgumentParser(description="發布網站讀取用的 SQLite 唯讀副本")
+    parser.add_argument("--path", default=REPLICA_PATH, help=f"副本位置（預設 {REPLICA_PATH}）")
+    args = parser.parse_args()
+
+    connection = connect_to_mysql()
+    try:
+        publish_replica(connection, args.path)
+    finally:
+        connection.close()
@@ -0,0 +1,196 @@
+"""
+匯入紀錄表（import_dates / query_results / run_event_sets）的分區維護與保留期限清理
+
+每張表依時間以月份做 RANGE 分區，過期資料以 DROP PARTITION 整塊移除，
+不必逐筆 DELETE，也不會讓熱路徑上的索引隨歷史筆數成長。
+
+用法:
+    python retention.py --days 90
+"""
+import argparse
+import zlib
+from array import array
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Sequence
+
+# 分區表 → 分區欄位
+PARTITIONED_TABLES = {
+    "import_dates": "import_date",
+    "query_results": "created_at",
+    "run_event_sets": "created_at",
+}
+
+# 預設保留天數
+DEFAULT_RETENTION_DAYS = 90
+
+# 預先建立的未來月份數，避免資料落入 pmax
+MONTHS_AHEAD = 2
+
+
+def pack_event_ids(event_ids: Sequence[int]) -> bytes:
+    """將一次匯入的活動 id 依顯示順序壓縮成一個 blob（取代逐筆關聯列）"""
+    return zlib.compress(array('Q', event_ids).tobytes())
+
+
+def unpack_event_ids(blob: bytes) -> List[int]:
+    """還原 pack_event_ids 壓縮的活動 id 清單"""
+    ids = array('Q')
+    ids.frombytes(zlib.decompress(blob))
+    return ids.tolist()
+
+
+def _month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def _next_month(day: date) -> date:
+    return (day.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+
+def _partition_name(month: date) -> str:
+    return f"p{month:%Y%m}"
+
+
+def list_partitions(cursor, table: str) -> Dict[str, Optional[str]]:
+    """列出資料表的分區名稱與上界（pmax 的上界為 None）"""
+    cursor.execute(
+        """SELECT PARTITION_NAME, PARTITION_DESCRIPTION
+           FROM information_schema.PARTITIONS
+           WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+             AND PARTITION_NAME IS NOT NULL
+           ORDER BY PARTITION_ORDINAL_POSITION""",
+        (table,)
+    )
+    return {name: (None if bound == "MAXVALUE" else bound.strip("'"))
+            for name, bound in cursor.fetchall()}
+
+
+def ensure_partitions(cursor, table: str, months_ahead: int = MONTHS_AHEAD) -> None:
+    """從 pmax 切出直到未來數個月的月分區"""
+    column = PARTITIONED_TABLES[table]
+    partitions = list_partitions(cursor, table)
+    bounds = [bound for bound in partitions.values() if bound]
+
+    if bounds:
+        month = date.fromisoformat(max(bounds)[:10])
+    else:
+        # 第一次切分：從表中最早的資料月份開始，讓舊資料也能依月份過期
+        cursor.execute(f"SELECT MIN({column}) FROM {table}")
+        oldest = cursor.fetchone()[0]
+        month = _month_start(min(oldest.date(), date.today()) if oldest else date.today())
+
+    last = _next_month(_month_start(date.today()))
+    for _ in range(months_ahead - 1):
+        last = _next_month(last)
+
+    new_partitions = []
+    while month < last:
+        upper = _next_month(month)
+        new_partitions.append(
+            f"PARTITION {_partition_name(month)} VALUES LESS THAN ('{upper:%Y-%m-%d}')")
+        month = upper
+
+    if new_partitions:
+        cursor.execute(
+            f"""ALTER TABLE {table} REORGANIZE PARTITION pmax INTO (
+                    {', '.join(new_partitions)},
+                    PARTITION pmax VALUES LESS THAN MAXVALUE)""")
+
+
+def drop_expired_partitions(cursor, table: str, retention_days: int) -> List[str]:
+    """整塊刪除上界早於保留期限的分區（只改中繼資料，與資料量無關）"""
+    cutoff = (datetime.now() - timedelta(days=retention_days)).strftime("%Y-%m-%d")
+    expired = [name for name, bound in list_partitions(cursor, table).items()
+               if bound and bound[:10] <= cutoff]
+    if expired:
+        cursor.execute(f"ALTER TABLE {table} DROP PARTITION {', '.join(expired)}")
+    return expired
+
+
+def _is_partitioned(cursor, table: str) -> bool:
+    return bool(list_partitions(cursor, table))
+
+
+def migrate_legacy_log_tables(cursor) -> None:
+    """將舊版未分區的紀錄表改為分區表，並把 query_event_relations 轉成 run_event_sets"""
+    cursor.execute(
+        """SELECT COUNT(*) FROM information_schema.TABLES
+           WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'query_event_relations'"""
+    )
+    if cursor.fetchone()[0]:
+        print("正在將 query_event_relations 轉換為 run_event_sets...")
+        cursor.execute(
+            """SELECT r.query_id, q.created_at, r.event_id
+               FROM query_event_relations r
+               JOIN query_results q ON q.id = r.query_id
+               ORDER BY r.query_id, r.display_order"""
+        )
+        runs: Dict[int, list] = {}
+        created: Dict[int, datetime] = {}
+        for query_id, created_at, event_id in cursor.fetchall():
+            runs.setdefault(query_id, []).append(event_id)
+            created[query_id] = created_at
+        cursor.executemany(
+            """INSERT IGNORE INTO run_event_sets (query_id, created_at, event_count, event_ids)
+               VALUES (%s, %s, %s, %s)""",
+            [(query_id, created[query_id], len(ids), pack_event_ids(ids))
+             for query_id, ids in runs.items()]
+        )
+        # 關聯表的外鍵會擋住 query_results 分區，轉換完即刪除
+        cursor.execute("DROP TABLE query_event_relations")
+
+    if not _is_partitioned(cursor, "import_dates"):
+        print("正在將 import_dates 改為分區表...")
+        cursor.execute(
+            """ALTER TABLE import_dates
+               DROP PRIMARY KEY, ADD PRIMARY KEY (id, import_date)""")
+        cursor.execute(
+            """ALTER TABLE import_dates PARTITION BY RANGE COLUMNS(import_date)
+               (PARTITION pmax VALUES LESS THAN MAXVALUE)""")
+
+    if not _is_partitioned(cursor, "query_results"):
+        print("正在將 query_results 改為分區表...")
+        cursor.execute(
+            """ALTER TABLE query_results
+               MODIFY created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+               DROP PRIMARY KEY, ADD PRIMARY KEY (id, created_at)""")
+        cursor.execute(
+            """ALTER TABLE query_results PARTITION BY RANGE COLUMNS(created_at)
+               (PARTITION pmax VALUES LESS THAN MAXVALUE)""")
+
+
+def run_retention(connection, retention_days: int = DEFAULT_RETENTION_DAYS,
+                  months_ahead: int = MONTHS_AHEAD) -> Dict[str, List[str]]:
+    """維護所有紀錄表的分區：補齊未來月份並刪除過期分區"""
+    cursor = None
+    dropped = {}
+    try:
+        cursor = connection.cursor(buffered=True)
+        for table in PARTITIONED_TABLES:
+            ensure_partitions(cursor, table, months_ahead)
+            dropped[table] = drop_expired_partitions(cursor, table, retention_days)
+            if dropped[table]:
+                print(f"{table} 已刪除過期分區：{', '.join(dropped[table])}")
+        connection.commit()
+        return dropped
+    finally:
+        if cursor:
+            cursor.close()
+
+
+if __name__ == "__main__":
+    from main import connect_to_mysql
+
+    parser = argparse.ArgumentParser(description="匯入紀錄表分區維護與保留期限清理")
+    parser.add_argument("--days", type=int, default=DEFAULT_RETENTION_DAYS,
+                        help=f"保留天數（預設 {DEFAULT_RETENTION_DAYS}）")
+    parser.add_argument("--months-ahead", type=int, default=MONTHS_AHEAD,
+                        help="預先建立的未來月份數")
+    args = parser.parse_args()
+
+    connection = connect_to_mysql()
+    try:
+        run_retention(connection, args.days, args.months_ahead)
+        print("分區維護完成！")
+    finally:
+        connection.close()
@@ -0,0 +1,197 @@
+"""
+常駐匯入排程
+
+每個資料來源依各自的週期（加上隨機抖動，避免整點同時打上游）重新匯入，
+整個程序共用同一個 HTTP 用戶端與資料庫連線池，不必每次重新建立。
+每一輪都先取得 MySQL advisory lock，與手動執行的 main.py 或其他排程互斥；
+收到 SIGINT / SIGTERM 時會等目前這一輪做完再結束。重新啟動後依
+sync_watermarks 的上次同步時間排定下一次執行，不會一啟動就全部重抓。
+
+用法:
+    python scheduler.py
+    python scheduler.py --interval taipei=600 --interval culture=21600
+    python scheduler.py --once
+"""
+import argparse
+import random
+import signal
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from mysql.connector import pooling
+
+from dedup import source_family
+from main import (DB_CONFIG, SOURCE_JOBS, init_database, ingest_lock,
+                  print_http_metrics, run_post_ingest)
+from staging_queue import staged_ingest
+
+# 各來源預設的匯入週期（秒）
+DEFAULT_INTERVALS = {
+    "culture": 6 * 60 * 60,
+    "tfam": 12 * 60 * 60,
+    "taipei": 60 * 60,
+    "ntpc": 3 * 60 * 60,
+}
+
+# 分區維護一天一次即可
+RETENTION_INTERVAL = 24 * 60 * 60
+
+# 週期的隨機抖動比例（±10%）
+JITTER = 0.1
+
+# 取不到鎖時多久後再試
+LOCK_RETRY_SECONDS = 60
+
+
+def next_delay(interval: float, jitter: float = JITTER) -> float:
+    """加上隨機抖動後的等待秒數"""
+    return interval * (1 + random.uniform(-jitter, jitter))
+
+
+def load_last_sync(connection) -> Dict[str, float]:
+    """各來源最近一次同步的時間（epoch 秒），依 sync_watermarks 的來源前綴分組取最舊者"""
+    cursor = None
+    try:
+        cursor = connection.cursor(buffered=True)
+        cursor.execute("SELECT source, last_sync_at FROM sync_watermarks")
+        last_sync: Dict[str, float] = {}
+        for source, last_sync_at in cursor.fetchall():
+            family = source_family(source)
+            timestamp = last_sync_at.timestamp()
+            last_sync[family] = min(last_sync.get(family, timestamp), timestamp)
+        return last_sync
+    finally:
+        if cursor:
+            cursor.close()
+
+
+class IngestScheduler:
+    """依來源週期執行匯入的常駐排程器"""
+
+    def __init__(self, intervals: Optional[Dict[str, float]] = None, pool_size: int = 2):
+        self.intervals = dict(DEFAULT_INTERVALS, **(intervals or {}))
+        self.pool = pooling.MySQLConnectionPool(
+            pool_name="ingest", pool_size=pool_size, **DB_CONFIG)
+        self.stop_event = threading.Event()
+        self.next_run: Dict[str, float] = {}
+        self.next_retention = 0.0
+
+    def request_stop(self, signum=None, frame=None) -> None:
+        """收到結束訊號：不中斷目前這一輪，下一次等待時結束"""
+        if not self.stop_event.is_set():
+            print("\n收到結束訊號，完成目前工作後停止...")
+        self.stop_event.set()
+
+    def schedule_from_watermarks(self) -> None:
+        """依上次同步時間排定各來源的第一次執行"""
+        connection = self.pool.get_connection()
+        try:
+            last_sync = load_last_sync(connection)
+        finally:
+            connection.close()
+
+        now = time.time()
+        for source, interval in self.intervals.items():
+            last = last_sync.get(source)
+            self.next_run[source] = max(now, last + interval) if last else now
+
+    def due_sources(self) -> List[str]:
+        now = time.time()
+        return [source for source, at in self.next_run.items() if at <= now]
+
+    def run_cycle(self, sources: List[str]) -> bool:
+        """
+        執行一輪匯入；單一來源失敗不影響其他來源
+
+        Returns:
+            bool: 是否有取得鎖並實際執行
+        """
+        connection = self.pool.get_connection()
+        try:
+            with ingest_lock(connection) as acquired:
+                if not acquired:
+                    print("另一個匯入程序正在執行，稍後再試")
+                    return False
+
+                print(f"\n=== {datetime.now():%Y-%m-%d %H:%M:%S} 匯入：{', '.join(sources)} ===")
+                # 抓到的批次經匯入佇列由背景執行緒寫入，資料庫中斷時留待下一輪
+                with staged_ingest() as save:
+                    for source in sources:
+                        name, job = SOURCE_JOBS[source]
+                        try:
+                            print(f"正在獲取{name}...")
+                            job(connection, save)
+                        except Exception as e:
+                            # 下一輪依水位增量續跑
+                            print(f"{name}匯入失敗：{str(e)}")
+                        self.next_run[source] = time.time() + next_delay(self.intervals[source])
+
+                retention = time.time() >= self.next_retention
+                run_post_ingest(connection, retention=retention)
+                if retention:
+                    self.next_retention = time.time() + RETENTION_INTERVAL
+                return True
+        finally:
+            connection.close()
+
+    def run(self, once: bool = False) -> None:
+        """主迴圈：等到最早到期的來源，執行後重新排程，直到收到結束訊號"""
+        signal.signal(signal.SIGINT, self.request_stop)
+        signal.signal(signal.SIGTERM, self.request_stop)
+
+        init_database()
+        self.schedule_from_watermarks()
+        if once:
+            self.next_run = {source: 0.0 for source in self.next_run}
+
+        try:
+            while not self.stop_event.is_set():
+                sources = self.due_sources()
+                if sources:
+                    try:
+                        ran = self.run_cycle(sources)
+                    except Exception as e:
+                        print(f"匯入後處理失敗：{str(e)}")
+                        ran = True
+                    if not ran:
+                        for source in sources:
+                            self.next_run[source] = time.time() + LOCK_RETRY_SECONDS
+                    if once and ran:
+                        break
+
+                wait = max(0.0, min(self.next_run.values()) - time.time())
+                if wait:
+                    print(f"下一次匯入：{datetime.fromtimestamp(time.time() + wait):%Y-%m-%d %H:%M:%S}")
+                self.stop_event.wait(wait)
+        finally:
+            print_http_metrics()
+            print("匯入排程已停止")
+
+
+def parse_intervals(values: List[str]) -> Dict[str, float]:
+    """解析 --interval 來源=秒數"""
+    intervals = {}
+    for value in values:
+        source, _, seconds = value.partition("=")
+        if source not in SOURCE_JOBS or not seconds.isdigit():
+            raise argparse.ArgumentTypeError(
+                f"格式應為 來源=秒數，來源為 {', '.join(SOURCE_JOBS)}：{value}")
+        intervals[source] = int(seconds)
+    return intervals
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="常駐匯入排程")
+    parser.add_argument("--interval", action="append", default=[],
+                        help="覆寫來源的匯入週期，例如 taipei=600（可重複指定）")
+    parser.add_argument("--once", action="store_true", help="所有來源各執行一次後結束")
+    args = parser.parse_args()
+
+    try:
+        intervals = parse_intervals(args.interval)
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+
+    IngestScheduler(intervals).run(once=args.once)
@@ -0,0 +1,317 @@
+"""
+匯入暫存佇列（本機磁碟上的持久化佇列）
+
+抓取與寫入資料庫分開：各來源抓到、正規化好的批次先附加到 queue/ 下的分段檔，
+由背景的寫入執行緒依序以 sync_source 寫入 MySQL，每寫完一批就更新檢查點。
+- 抓取不必等資料庫寫入，上游的速度不受 MySQL 拖累
+- MySQL 中斷或寫入失敗時批次仍留在佇列，下一次執行（或 python ingest.py drain）
+  從最後一個已提交的批次之後繼續，不必重新抓取
+- 每筆紀錄帶長度與 CRC32，程序當掉留下的半筆紀錄在下次開啟時截掉
+
+檢查點在資料庫提交之後才寫入，當掉時最後一批可能重寫一次；
+sync_source 以內容摘要比對，重寫不會產生重複的活動。
+
+用法:
+    python ingest.py drain
+"""
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+import mysql.connector
+
+QUEUE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "queue")
+
+# 單一分段檔的大小上限，超過時換下一個分段（已寫完的分段整檔刪除）
+SEGMENT_BYTES = 64 * 1024 * 1024
+
+# 紀錄標頭：識別碼、內容長度、CRC32
+RECORD_MAGIC = b"EVQ1"
+RECORD_HEADER = struct.Struct(">4sII")
+
+# 資料庫連線失敗時的重試間隔（秒），全部失敗後留待下次執行
+RETRY_DELAYS = (1, 5, 15)
+
+# 視為資料庫暫時無法使用的錯誤碼：斷線（2006/2013/2055）、鎖等待逾時（1205）、死結（1213）；
+# mysql.connector 把其中幾個歸類為 DatabaseError / InternalError，不能只看例外型別
+TRANSIENT_ERRNOS = {2006, 2013, 2055, 1205, 1213}
+
+# 表示批次本身有問題的錯誤，只有這些會把批次移到 failed/；其餘錯誤批次都留在佇列重試
+REJECT_ERRORS = (mysql.connector.errors.DataError,
+                 mysql.connector.errors.IntegrityError,
+                 mysql.connector.errors.ProgrammingError)
+
+Position = Tuple[int, int]
+
+
+def _segment_name(number: int) -> str:
+    return f"{number:010d}.seg"
+
+
+def _fsync_replace(path: str, content: bytes) -> None:
+    """先寫暫存檔並同步到磁碟，再原子地換上"""
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(content)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+def read_record(f) -> Optional[Tuple[bytes, int]]:
+    """
+    由目前位置讀取一筆紀錄
+
+    Returns:
+        (內容, 紀錄結束位置)；檔案在這裡結束或只寫了一半時為 None
+    Raises:
+        ValueError: 識別碼或 CRC32 不符（紀錄損毀）
+    """
+    header = f.read(RECORD_HEADER.size)
+    if len(header) < RECORD_HEADER.size:
+        return None
+    magic, length, checksum = RECORD_HEADER.unpack(header)
+    if magic != RECORD_MAGIC:
+        raise ValueError("紀錄識別碼不符")
+    payload = f.read(length)
+    if len(payload) < length:
+        return None
+    if zlib.crc32(payload) != checksum:
+        raise ValueError("紀錄 CRC32 不符")
+    return payload, f.tell()
+
+
+class StagingQueue:
+    """分段檔組成的附加式佇列，檢查點記錄最後一個已寫入資料庫的批次之後的位置"""
+
+    def __init__(self, directory: str = QUEUE_DIR, segment_bytes: int = SEGMENT_BYTES):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.checkpoint_path = os.path.join(directory, "checkpoint.json")
+        self.failed_dir = os.path.join(directory, "failed")
+        os.makedirs(directory, exist_ok=True)
+
+        self.lock = threading.Condition()
+        self.segments = sorted(int(name.split(".")[0]) for name in os.listdir(directory)
+                               if name.endswith(".seg"))
+        if not self.segments:
+            self.segments = [self.checkpoint()[0]]
+        self._recover_tail()
+
+    def _path(self, number: int) -> str:
+        return os.path.join(self.directory, _segment_name(number))
+
+    def _recover_tail(self) -> None:
+        """截掉最後一個分段尾端寫到一半的紀錄（上次程序在寫入途中結束）"""
+        path = self._path(self.segments[-1])
+        if not os.path.exists(path):
+            return
+        end = 0
+        with open(path, "rb") as f:
+            try:
+                while True:
+                    record = read_record(f)
+                    if record is None:
+                        break
+                    end = record[1]
+            except ValueError:
+                pass
+        if end < os.path.getsize(path):
+            segment, offset = self.checkpoint()
+            if segment == self.segments[-1] and offset > end:
+                # 檢查點已在損毀處之後，截掉會讓新紀錄落在檢查點之前
+                self._quarantine(self.segments[-1], "corrupt")
+            else:
+                print(f"佇列分段 {_segment_name(self.segments[-1])} 尾端有不完整的紀錄，已截掉")
+                with open(path, "r+b") as f:
+                    f.truncate(end)
+
+    def checkpoint(self) -> Position:
+        """最後一個已提交批次之後的位置 (分段編號, 位移)"""
+        try:
+            with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return data["segment"], data["offset"]
+        except FileNotFoundError:
+            return 0, 0
+
+    def append(self, data: Dict[str, Any]) -> None:
+        """附加一個批次（標準格式的活動資料），同步到磁碟後才回傳"""
+        if not data or not data.get("result"):
+            return
+        payload = json.dumps(data, ensure_ascii=False, separators=(",", ":"),
+                             default=str).encode("utf-8")
+        record = RECORD_HEADER.pack(RECORD_MAGIC, len(payload), zlib.crc32(payload)) + payload
+
+        with self.lock:
+            path = self._path(self.segments[-1])
+            if os.path.exists(path) and os.path.getsize(path) >= self.segment_bytes:
+                self.segments.append(self.segments[-1] + 1)
+                path = self._path(self.segments[-1])
+            with open(path, "ab") as f:
+                f.write(record)
+                f.flush()
+                os.fsync(f.fileno())
+            self.lock.notify_all()
+        print(f"{data.get('source')} 已放入匯入佇列：{len(data['result'])} 筆")
+
+    def pending(self) -> Iterator[Tuple[Dict[str, Any], Position]]:
+        """
+        由檢查點開始依序讀出尚未寫入資料庫的批次
+
+        Yields:
+            (批次, 這個批次之後的位置)；寫入成功後以該位置呼叫 commit
+        """
+        segment, offset = self.checkpoint()
+        while True:
+            with self.lock:
+                later = [number for number in self.segments if number > segment]
+            path = self._path(segment)
+            record = None
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    f.seek(offset)
+                    try:
+                        record = read_record(f)
+                    except ValueError as e:
+                        # 已提交位置之後的紀錄損毀：隔離這個分段，從下一個分段繼續
+                        print(f"佇列分段 {_segment_name(segment)} 損毀（{e}），已移到 failed/")
+                        with self.lock:
+                            self._quarantine(segment, "corrupt")
+                            later = [number for number in self.segments if number > segment]
+            if record is None:
+                if not later:
+                    return
+                # 這個分段已讀完，換下一個分段
+                segment, offset = later[0], 0
+                continue
+
+            payload, offset = record
+            yield json.loads(payload), (segment, offset)
+
+    def commit(self, position: Position) -> None:
+        """批次已寫入資料庫：更新檢查點並刪除已讀完的分段"""
+        _fsync_replace(self.checkpoint_path,
+                       json.dumps({"segment": position[0], "offset": position[1]}).encode("utf-8"))
+        with self.lock:
+            for number in [number for number in self.segments if number < position[0]]:
+                os.remove(self._path(number))
+                self.segments.remove(number)
+
+    def _quarantine(self, number: int, suffix: str) -> None:
+        """把分段移到 failed/（呼叫端需持有 lock）；移走的是最後一個分段時改寫到新分段"""
+        os.makedirs(self.failed_dir, exist_ok=True)
+        os.replace(self._path(number),
+                   os.path.join(self.failed_dir, f"{_segment_name(number)}.{suffix}"))
+        if number == self.segments[-1]:
+            self.segments.append(number + 1)
+        self.segments.remove(number)
+
+    def reject(self, data: Dict[str, Any], position: Position) -> None:
+        """無法寫入的批次另存到 failed/ 供人工檢查，佇列繼續往下"""
+        os.makedirs(self.failed_dir, exist_ok=True)
+        name = f"{_segment_name(position[0])}-{position[1]}.json"
+        _fsync_replace(os.path.join(self.failed_dir, name),
+                       json.dumps(data, ensure_ascii=False, indent=2, default=str).encode("utf-8"))
+        self.commit(position)
+
+    def wait(self, timeout: float) -> None:
+        with self.lock:
+            self.lock.wait(timeout)
+
+
+def _is_rejectable(error: Exception, connection) -> bool:
+    """寫入失敗是否是批次本身的問題（連線仍正常且不是暫時性的錯誤碼）"""
+    if not isinstance(error, REJECT_ERRORS) or error.errno in TRANSIENT_ERRNOS:
+        return False
+    return connection is not None and connection.is_connected()
+
+
+def _close_quietly(connection) -> None:
+    try:
+        connection.close()
+    except mysql.connector.Error:
+        pass
+
+
+def drain(queue: StagingQueue, connect: Callable, stop: Optional[threading.Event] = None,
+          poll: float = 0.5) -> int:
+    """
+    依序把佇列中的批次寫入資料庫，每批提交後更新檢查點
+
+    stop 未設定時一直等待新批次；設定後寫完佇列中剩下的批次就結束。
+    資料庫連線失敗、鎖等待逾時或死結時依 RETRY_DELAYS 重試，仍失敗則停止（批次留在佇列）；
+    只有資料錯誤、違反唯一鍵等批次本身的問題才把批次移到 failed/。
+
+    Returns:
+        int: 寫入的批次數
+    """
+    from main import sync_source
+
+    written = 0
+    connection = None
+    try:
+        while True:
+            drained = True
+            for data, position in queue.pending():
+                drained = False
+                for attempt, delay in enumerate((0, *RETRY_DELAYS)):
+                    time.sleep(delay)
+                    try:
+                        if connection is None or not connection.is_connected():
+                            connection = connect()
+                        sync_source(data, connection)
+                        queue.commit(position)
+                        written += 1
+                        break
+                    except Exception as e:
+                        if _is_rejectable(e, connection):
+                            print(f"{data.get('source')} 批次無法寫入，已移到 failed/：{e}")
+                            queue.reject(data, position)
+                            break
+                        print(f"寫入資料庫失敗（第 {attempt + 1} 次）：{e}")
+                        # 重新連線，交易中途失敗的部分由資料庫回復
+                        if connection is not None:
+                            _close_quietly(connection)
+                        connection = None
+                else:
+                    print("資料庫暫時無法寫入，剩下的批次留在佇列中，下次執行時繼續")
+                    return written
+            if drained:
+                if stop is None or stop.is_set():
+                    return written
+                queue.wait(poll)
+    finally:
+        if connection is not None:
+            connection.close()
+
+
+@contextmanager
+def staged_ingest(queue: Optional[StagingQueue] = None):
+    """
+    啟動背景寫入執行緒，區塊內取得的 save 函式把批次放進佇列；
+    離開區塊時等寫入執行緒把佇列寫完（包含上次執行留下的批次）
+
+    用法:
+        with staged_ingest() as save:
+            ingest_culture(connection, save)
+    """
+    from main import connect_to_mysql
+
+    queue = queue or StagingQueue()
+    stop = threading.Event()
+    writer = threading.Thread(target=drain, args=(queue, connect_to_mysql, stop),
+                              name="ingest-writer", daemon=True)
+    writer.start()
+    try:
+        yield queue.append
+    finally:
+        stop.set()
+        with queue.lock:
+            queue.lock.notify_all()
+        writer.join()
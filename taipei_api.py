@@ -1,7 +1,8 @@
-import requests
 import json
 from datetime import datetime
 import os
+from typing import Any, Dict, List
+from http_client import get_client, HttpError
 
 
 def convert_date_format(date_str):
@@ -30,6 +31,39 @@ def convert_date_format(date_str):
     return None
 
 
+def normalize_taipei_events(events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """將台北市政府活動原始資料轉換為標準格式（重播歷史存檔時也會用到）"""
+    result = []
+    for event in events:
+        try:
+            # 轉換日期格式
+            start_date = convert_date_format(event.get("活動開始時間", ""))
+            end_date = convert_date_format(event.get("活動結束時間", ""))
+
+            # 確保所有欄位都是字串或 None
+            formatted_event = {
+                "uid": str(event.get("DataSN", "")),
+                "title": str(event.get("title", "")),
+                "description": str(event.get("內容", "")),
+                "organizer": str(event.get("主辦單位", "")),
+                "address": str(event.get("活動地址", "")),
+                "startDate": start_date,
+                "endDate": end_date,
+                "location": str(event.get("地點", "")),
+                "latitude": None,
+                "longitude": None,
+                "price": str(event.get("費用", "")),
+                "url": str(event.get("Source", "")),
+                "imageUrl": str(event.get("相關圖片")[0]["url"]) if event.get("相關圖片") and len(event.get("相關圖片")) > 0 else ""
+            }
+            result.append(formatted_event)
+        except Exception as e:
+            print(f"處理活動資料時發生錯誤: {e}")
+            continue
+
+    return result
+
+
 def fetch_taipei_events():
     """
     從台北市政府開放資料平台獲取活動資訊
@@ -37,8 +71,7 @@ def fetch_taipei_events():
     url = "https://www.gov.taipei/OpenData.aspx?SN=DD102593FDB1A032"
 
     try:
-        response = requests.get(url)
-        response.raise_for_status()
+        response = get_client().get(url)
 
         try:
             # 先嘗試直接解析
@@ -65,44 +98,18 @@ def fetch_taipei_events():
 
         # 將資料轉換為標準格式
         formatted_data = {
-            "result": [],
+            "result": normalize_taipei_events(events),
+            "source": "taipei",
             "queryTime": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
             "total": len(events),
             "limit": len(events),
             "offset": 0
         }
 
-        for event in events:
-            try:
-                # 轉換日期格式
-                start_date = convert_date_format(event.get("活動開始時間", ""))
-                end_date = convert_date_format(event.get("活動結束時間", ""))
-
-                # 確保所有欄位都是字串或 None
-                formatted_event = {
-                    "uid": str(event.get("DataSN", "")),
-                    "title": str(event.get("title", "")),
-                    "description": str(event.get("內容", "")),
-                    "organizer": str(event.get("主辦單位", "")),
-                    "address": str(event.get("活動地址", "")),
-                    "startDate": start_date,
-                    "endDate": end_date,
-                    "location": str(event.get("地點", "")),
-                    "latitude": None,
-                    "longitude": None,
-                    "price": str(event.get("費用", "")),
-                    "url": str(event.get("Source", "")),
-                    "imageUrl": str(event.get("相關圖片")[0]["url"]) if event.get("相關圖片") and len(event.get("相關圖片")) > 0 else ""
-                }
-                formatted_data["result"].append(formatted_event)
-            except Exception as e:
-                print(f"處理活動資料時發生錯誤: {e}")
-                continue
-
         return formatted_data
         # return events
 
-    except requests.exceptions.RequestException as e:
+    except HttpError as e:
         print(f"獲取資料時發生錯誤: {e}")
         return {"result": []}
     except json.JSONDecodeError as e:
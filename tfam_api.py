@@ -1,8 +1,8 @@
-import requests
 import json
 import os
 from typing import Dict, Optional
 from datetime import datetime
+from http_client import get_client, HttpError
 
 
 def convert_date_format(date_str: Optional[str]) -> Optional[str]:
@@ -45,6 +45,8 @@ class TaipeiOpenDataAPI:
     def __init__(self, dataset_id: str = "fef040da-75d3-42bc-98dd-a292919a251a"):
         self.base_url = f"https://data.taipei/api/v1/dataset/{dataset_id}"
         self.dataset_id = dataset_id
+        self.source = f"tfam:{dataset_id}"
+        self.client = get_client()
         self.headers = {
             'accept': 'application/json',
             'Content-Type': 'application/json',
@@ -53,7 +55,8 @@ class TaipeiOpenDataAPI:
     def fetch_data(self,
                    q: Optional[str] = None,
                    limit: Optional[int] = None,
-                   offset: Optional[int] = None) -> Dict:
+                   offset: Optional[int] = None,
+                   sort: Optional[str] = None) -> Dict:
         """
         從台北市資料開放平台獲取資料
 
@@ -61,6 +64,7 @@ class TaipeiOpenDataAPI:
             q (str, optional): 關鍵字查詢
             limit (int, optional): 筆數上限(1000)
             offset (int, optional): 位移筆數
+            sort (str, optional): 排序欄位
 
         Returns:
             Dict: API回傳的資料
@@ -78,26 +82,26 @@ class TaipeiOpenDataAPI:
                 params['limit'] = min(limit, 1000)  # 確保不超過1000筆
             if offset is not None:
                 params['offset'] = offset
+            if sort is not None:
+                params['sort'] = sort
 
-            response = requests.get(
+            response = self.client.get(
                 self.base_url,
                 params=params,
                 headers=self.headers
             )
 
-            if response.status_code != 200:
-                print(f"錯誤回應內容: {response.text}")
-                response.raise_for_status()
-
             raw_data = response.json()
 
             # 將資料轉換為標準格式
             formatted_data = {
                 "result": [],
+                "source": self.source,
                 "queryTime": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
                 "total": raw_data.get("result", {}).get("total", 0),
                 "limit": limit if limit is not None else raw_data.get("result", {}).get("limit", 0),
-                "offset": offset if offset is not None else raw_data.get("result", {}).get("offset", 0)
+                "offset": offset if offset is not None else raw_data.get("result", {}).get("offset", 0),
+                "sort": sort or ""
             }
 
             # 處理活動資料
@@ -119,7 +123,9 @@ class TaipeiOpenDataAPI:
                             "longitude": 121.524536,
                             "price": item.get("price", ""),
                             "url": item.get("url", ""),
-                            "imageUrl": item.get("imageUrl", "")
+                            "imageUrl": item.get("imageUrl", ""),
+                            "category": "展覽",
+                            "city": "臺北市"
                         }
                     else:
                         # 活動資訊
@@ -136,7 +142,8 @@ class TaipeiOpenDataAPI:
                             "longitude": 121.524536,
                             "price": item.get("price", ""),
                             "url": item.get("url", ""),
-                            "imageUrl": item.get("imageUrl", "")
+                            "imageUrl": item.get("imageUrl", ""),
+                            "city": "臺北市"
                         }
                     formatted_data["result"].append(formatted_event)
 
@@ -148,9 +155,9 @@ class TaipeiOpenDataAPI:
 
             return formatted_data
 
-        except requests.exceptions.RequestException as e:
+        except HttpError as e:
             print(f"發生錯誤: {str(e)}")
-            if hasattr(e, 'response') and hasattr(e.response, 'text'):
+            if getattr(e, 'response', None) is not None:
                 print(f"錯誤詳細資訊: {e.response.text}")
             return {"result": []}
         except json.JSONDecodeError as e:
@@ -161,6 +168,35 @@ class TaipeiOpenDataAPI:
             print(f"發生未預期的錯誤: {str(e)}")
             return {"result": []}
 
+    def fetch_all(self, page_size: int = 1000) -> Dict:
+        """
+        依 _id 排序分頁讀取整份資料集
+
+        每次都重新讀取全部資料（資料集只有數百筆），已抓過的活動若被修改（日期、票價、連結）
+        也會再次讀到；內容未變動的活動由 sync_source 以內容摘要略過，不會重寫資料庫。
+
+        Args:
+            page_size (int): 每頁筆數(上限1000)
+
+        Returns:
+            Dict: 標準格式資料；任一頁抓取失敗時回傳空結果，不以不完整的資料更新水位
+        """
+        data = None
+        offset = 0
+        while True:
+            page = self.fetch_data(limit=page_size, offset=offset, sort="_id")
+            if "total" not in page:
+                print(f"{self.source} 第 {offset} 筆起的資料抓取失敗，本次略過")
+                return {"result": []}
+            if data is None:
+                data = page
+            else:
+                data["result"].extend(page["result"])
+            offset += len(page["result"])
+            if len(page["result"]) < min(page_size, 1000) or offset >= page.get("total", 0):
+                break
+        return data
+
     def save_to_json(self, data: Dict, filename: Optional[str] = None, output_dir: str = 'tfam_api') -> str:
         """
         將資料儲存為JSON檔案
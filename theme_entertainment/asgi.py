@@ -12,5 +12,12 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'theme_entertainment.settings')
+# ASGI 下活動 API 使用非同步 view（見 async_views.py）
+os.environ.setdefault('EVENT_API_ASYNC', '1')
 
 application = get_asgi_application()
+
+# 啟動時先載入活動 API 的記憶體索引，第一個請求不必等待
+from theme_entertainment import event_index
+
+event_index.get_index()
@@ -0,0 +1,171 @@
+"""
+活動 API 的非同步版本（ASGI 部署時使用）
+
+查詢組裝與回應格式沿用 views.py，只有資料庫存取改為：
+- 交給固定大小的執行緒池（同時佔用的資料庫連線數有上限，不會每個請求各佔一條執行緒）
+- 同一時間內完全相同的查詢只打一次資料庫，其餘請求等待同一份結果
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import JsonResponse
+
+from . import event_index, views
+
+# 查詢用的執行緒數，也就是非同步 view 最多同時使用的資料庫連線數
+DB_THREADS = getattr(settings, 'EVENT_API_DB_THREADS', 8)
+
+_executor = ThreadPoolExecutor(max_workers=DB_THREADS, thread_name_prefix='event-api-db')
+
+# 進行中的查詢：(事件迴圈, SQL, 參數) → Future
+_inflight = {}
+
+
+def _query_in_thread(sql, params):
+    # 執行緒池中的連線不會經過 request_finished，依 CONN_MAX_AGE 自行回收
+    close_old_connections()
+    return views._run_query(sql, params)
+
+
+async def coalesced_query(sql, params):
+    """在執行緒池中執行查詢；相同的查詢正在進行時直接共用其結果"""
+    loop = asyncio.get_running_loop()
+    key = (id(loop), sql, tuple(params))
+    future = _inflight.get(key)
+    if future is None:
+        future = loop.run_in_executor(_executor, _query_in_thread, sql, params)
+        _inflight[key] = future
+        future.add_done_callback(lambda _: _inflight.pop(key, None))
+    # 某個請求被取消時不影響其他等待同一查詢的請求
+    return await asyncio.shield(future)
+
+
+def _index_in_thread():
+    close_old_connections()
+    return event_index.get_index()
+
+
+async def memory_index():
+    """記憶體索引；只有到了檢查版本的時間才交給執行緒池（可能查詢資料庫或重新載入）"""
+    if not event_index.enabled():
+        return None
+    if not event_index.check_due():
+        return event_index.current()
+    return await asyncio.get_running_loop().run_in_executor(_executor, _index_in_thread)
+
+
+def _changes_in_thread(since):
+    close_old_connections()
+    return views.event_changes_payload(since)
+
+
+async def get_event_detail(request, event_id):
+    """單一活動詳情（非同步版本，已封存的活動也查得到）"""
+    try:
+        events = await coalesced_query(*views.event_detail_query(event_id))
+        if not events:
+            events = await coalesced_query(*views.event_detail_query(event_id, archived=True))
+        return views.event_detail_response(request, events)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+async def get_event_details(request):
+    """批次取得多筆活動詳情（非同步版本，參數同 views.get_event_details）"""
+    try:
+        uids = views.event_details_uids(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    try:
+        events = await coalesced_query(*views.event_details_query(uids))
+        missing = views.missing_uids(uids, events)
+        if missing:
+            # 不直接修改共用查詢的結果（同一查詢的其他請求也拿到這個 list）
+            events = events + await coalesced_query(*views.event_details_query(missing, archived=True))
+        return views.event_details_response(request, events)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+async def get_events(request):
+    """目前與即將舉行的活動列表（非同步版本，參數同 views.get_events）"""
+    try:
+        sql, params, paginated, page, page_size = views.event_list_query(request)
+        filters = views._current_filters(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    try:
+        # 記憶體索引的查詢只花 CPU 時間，直接在事件迴圈中回應；include_past 時查資料庫
+        index = None if views._include_past(request) else await memory_index()
+        if index is not None:
+            return index.list_response(request, filters, paginated, page, page_size)
+        events = await coalesced_query(sql, params)
+        return views.event_list_response(events, paginated, page, page_size)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+async def search_events(request):
+    """關鍵字搜尋（非同步版本，必須提供 q）"""
+    if not request.GET.get('q', '').strip():
+        return JsonResponse({'error': '請提供 q 參數'}, status=400)
+    return await get_events(request)
+
+
+async def get_event_changes(request):
+    """增量同步（非同步版本，參數同 views.get_event_changes）"""
+    try:
+        since = views._parse_int(request, 'since', 0, minimum=0)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    try:
+        # 依序執行數個查詢，整段交給執行緒池
+        payload = await asyncio.get_running_loop().run_in_executor(
+            _executor, _changes_in_thread, since)
+        return views._cached_json(request, payload)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+async def get_nearby_events(request):
+    """附近的目前活動（非同步版本，參數同 views.get_nearby_events）"""
+    try:
+        sql, params, args = views.nearby_query(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    try:
+        return views.nearby_response(await coalesced_query(sql, params), *args)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+async def get_event_calendar(request):
+    """每日進行中的活動數（非同步版本，參數同 views.get_event_calendar）"""
+    try:
+        sql, params, args = views.calendar_query(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    try:
+        return views.calendar_response(request, await coalesced_query(sql, params), *args)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+async def get_event_facets(request):
+    """各分面的活動數（非同步版本，參數同 views.get_event_facets）"""
+    try:
+        sql, params = views.facets_query(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    try:
+        return views.facets_response(request, await coalesced_query(sql, params))
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
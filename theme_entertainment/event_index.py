@@ -0,0 +1,290 @@
+"""
+活動 API 行程內的欄式索引
+
+目前活動（current_events）整份放在記憶體中：每個欄位是一個陣列，
+結束日期另存排序後的陣列，篩選欄位有反向索引，標題有二字詞的反向索引，
+每筆活動的列表與詳情 JSON 片段在載入時就先編碼好。
+活動列表、篩選與搜尋因此不必查詢資料庫，回應只是把片段接起來。
+
+匯入發布新的副本（或重建 current_events）後，下一次檢查時整份重新載入並換上；
+載入失敗時保留舊索引，完全沒有索引時 view 照舊查資料庫。
+"""
+import heapq
+import json
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import date
+from itertools import islice
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, router
+from django.http import HttpResponse
+
+# 篩選用的整數與字串欄位（查詢參數名稱 → 載入時的欄位別名）
+POSTING_FIELDS = {
+    'organizer_id': 'organizerId',
+    'venue_id': 'venueId',
+    'category': 'category',
+    'city': 'city',
+    'source': 'source',
+}
+
+EMPTY = array('i')
+
+# 每隔幾秒檢查一次資料版本（檢查副本只需 stat，不查詢資料庫）
+CHECK_SECONDS = getattr(settings, 'EVENT_INDEX_CHECK_SECONDS', 5)
+
+
+def _field_names(fields_sql):
+    """由 SELECT 欄位片段取出結果欄位名稱（c.uid → uid，x as y → y）"""
+    names = []
+    for field in fields_sql.split(','):
+        field = field.strip()
+        if field:
+            names.append(field.split(' as ')[-1].split('.')[-1].strip())
+    return names
+
+
+def _bigrams(text):
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+def _ordinal(value):
+    # 副本與 MySQL 回傳 date，其他後端可能回傳字串
+    if isinstance(value, str):
+        value = date.fromisoformat(value)
+    return value.toordinal()
+
+
+def _joined(values):
+    """小寫後以 NUL 字元接成一整串，並記錄每筆的起點（搜尋時以 str.find 在 C 層掃描）"""
+    values = [(value or '').lower() for value in values]
+    offsets, offset = array('q'), 0
+    for value in values:
+        offsets.append(offset)
+        offset += len(value) + 1
+    return values, '\x00'.join(values), offsets
+
+
+def _scan(text, offsets, keyword):
+    """在接起來的字串中依序找出包含關鍵字的每一筆（每筆只產生一次）"""
+    start = text.find(keyword)
+    while start != -1:
+        position = bisect_left(offsets, start + 1) - 1
+        yield position
+        # 跳到下一筆繼續找
+        if position + 1 >= len(offsets):
+            return
+        start = text.find(keyword, offsets[position + 1])
+
+
+def _unique(positions):
+    last = -1
+    for position in positions:
+        if position != last:
+            yield position
+            last = position
+
+
+def _encode(obj):
+    # 與 JsonResponse 相同的編碼方式，接起來的結果與逐筆序列化一致
+    return json.dumps(obj, cls=DjangoJSONEncoder)
+
+
+class EventIndex:
+    """一份 current_events 的欄式索引（建立後不再修改，可在多執行緒間共用）"""
+
+    def __init__(self, rows, generation, list_fields, detail_fields):
+        self.generation = generation
+        self.size = len(rows)
+
+        # 列表與詳情欄位的 JSON 片段（欄位順序與查資料庫時相同，thumbUrl 在最後）
+        self.list_json = []
+        self.full_json = []
+        for row in rows:
+            self.list_json.append(_encode(
+                {**{name: row[name] for name in list_fields}, 'thumbUrl': row['thumbUrl']}))
+            self.full_json.append(_encode(
+                {**{name: row[name] for name in detail_fields}, 'thumbUrl': row['thumbUrl']}))
+
+        # 結束日期：排序後的日期序數與對應列號，用二分搜尋找出已結束的活動
+        dated = sorted((_ordinal(row['endDate']), position)
+                       for position, row in enumerate(rows) if row['endDate'] is not None)
+        self.end_ordinals = array('i', (ordinal for ordinal, _ in dated))
+        self.end_rows = array('i', (position for _, position in dated))
+        self._expired_day = None
+        self._expired = frozenset()
+
+        # 篩選欄位：每欄一個陣列（逐筆比對用），以及值 → 依顯示順序排列的列號（反向索引）
+        self.columns = {field: [row[name] for row in rows] for field, name in POSTING_FIELDS.items()}
+        self.has_image = bytearray(1 if row['hasImage'] else 0 for row in rows)
+        self.image_rows = array('i', (position for position in range(self.size)
+                                      if self.has_image[position]))
+        postings = {field: defaultdict(lambda: array('i')) for field in POSTING_FIELDS}
+        title_postings = defaultdict(lambda: array('i'))
+        for position, row in enumerate(rows):
+            for field, name in POSTING_FIELDS.items():
+                if row[name] is not None and row[name] != '':
+                    postings[field][row[name]].append(position)
+            for gram in _bigrams((row['title'] or '').lower()):
+                title_postings[gram].append(position)
+        self.postings = {field: dict(values) for field, values in postings.items()}
+        self.title_postings = dict(title_postings)
+
+        # 小寫的標題與簡介；單一字的關鍵字與簡介搜尋直接掃描接起來的字串
+        self.titles, self.title_text, self.title_offsets = _joined(row['title'] for row in rows)
+        _, self.descriptions, self.description_offsets = _joined(
+            row['description'] for row in rows)
+
+    def expired(self, today):
+        """今天以前已結束的活動列號（每天計算一次）"""
+        if self._expired_day != today:
+            cut = bisect_left(self.end_ordinals, today.toordinal())
+            self._expired = frozenset(self.end_rows[:cut])
+            self._expired_day = today
+        return self._expired
+
+    def search(self, keyword):
+        """
+        標題或簡介包含關鍵字（不分大小寫）的列號，依顯示順序逐筆產生
+
+        標題從最短的二字詞反向索引出發再確認整個關鍵字連續出現，簡介以 str.find 掃描，
+        兩者合併；分頁只需要前幾筆時不會掃完全部活動。
+        """
+        keyword = keyword.lower()
+        if '\x00' in keyword:
+            return iter(())
+
+        grams = _bigrams(keyword)
+        if grams:
+            shortest = min((self.title_postings.get(gram, EMPTY) for gram in grams), key=len)
+            titles = self.titles
+            title_matches = (position for position in shortest if keyword in titles[position])
+        else:
+            title_matches = _scan(self.title_text, self.title_offsets, keyword)
+        return _unique(heapq.merge(
+            title_matches, _scan(self.descriptions, self.description_offsets, keyword)))
+
+    def select(self, request, filters):
+        """
+        依查詢參數產生符合條件的列號（依顯示順序，逐筆產生以便分頁時提早停止）
+
+        有關鍵字時以搜尋結果為出發點，否則從最短的反向索引出發；
+        其餘條件以欄位陣列逐筆比對，不必為每個請求建立集合。
+        """
+        expired = self.expired(date.today())
+        drivers = [self.postings[field].get(value, EMPTY) for field, value in filters.items()]
+        checks = [(self.columns[field], value) for field, value in filters.items()]
+        if request.GET.get('has_image') == '1':
+            drivers.append(self.image_rows)
+            checks.append((self.has_image, 1))
+
+        keyword = request.GET.get('q', '').strip()
+        if keyword:
+            positions = self.search(keyword)
+        elif drivers:
+            shortest = min(range(len(drivers)), key=lambda i: len(drivers[i]))
+            positions = drivers[shortest]
+            del checks[shortest]
+        else:
+            positions = range(self.size)
+        return (position for position in positions
+                if position not in expired and all(column[position] == value
+                                                   for column, value in checks))
+
+    def list_response(self, request, filters, paginated, page, page_size):
+        """與 views.event_list_response 相同格式的回應"""
+        fragments = self.full_json if request.GET.get('fields') == 'full' else self.list_json
+        rows = self.select(request, filters)
+        if not paginated:
+            body = '[' + ', '.join(fragments[position] for position in rows) + ']'
+        else:
+            start = (page - 1) * page_size
+            selected = list(islice(rows, start, start + page_size + 1))
+            body = '{"results": [%s], "page": %d, "pageSize": %d, "hasMore": %s}' % (
+                ', '.join(fragments[position] for position in selected[:page_size]),
+                page, page_size, 'true' if len(selected) > page_size else 'false')
+        return HttpResponse(body, content_type='application/json')
+
+
+_index = None
+_checked_at = float('-inf')
+_lock = threading.Lock()
+
+
+def _generation():
+    """目前資料的版本：副本檔案的 inode 與修改時間，或 current_events 的建立時間"""
+    alias = router.db_for_read(None, event_api=True)
+    if alias == 'replica':
+        stat = settings.EVENT_REPLICA_PATH.stat()
+        return ('replica', stat.st_ino, stat.st_mtime_ns)
+
+    # current_events 每次匯入都以 RENAME TABLE 換成新建的表
+    with connections[alias].cursor() as cursor:
+        if connections[alias].vendor == 'mysql':
+            cursor.execute(
+                """SELECT CREATE_TIME FROM information_schema.TABLES
+                   WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'current_events'""")
+        else:
+            cursor.execute("SELECT COUNT(*), MAX(position) FROM current_events")
+        return (alias, *cursor.fetchone())
+
+
+def load_index(generation=None):
+    """由資料庫（或副本）載入一份新的索引"""
+    from . import views
+
+    fields = (f"{views.CURRENT_DETAIL_FIELDS}, c.has_image as hasImage, "
+              "c.category, c.city, c.source")
+    rows = views._run_query(f"SELECT {fields} FROM current_events c ORDER BY c.position", [])
+    # _run_query 已把 thumbKey 換成放在最後的 thumbUrl
+    return EventIndex(rows, generation,
+                      [name for name in _field_names(views.CURRENT_LIST_FIELDS) if name != 'thumbKey'],
+                      [name for name in _field_names(views.CURRENT_DETAIL_FIELDS) if name != 'thumbKey'])
+
+
+def enabled():
+    return getattr(settings, 'EVENT_API_MEMORY_INDEX', False)
+
+
+def check_due():
+    """距離上次檢查資料版本是否已超過 CHECK_SECONDS"""
+    return time.monotonic() - _checked_at >= CHECK_SECONDS
+
+
+def current():
+    return _index
+
+
+def get_index():
+    """
+    取得目前的索引，必要時檢查版本並重新載入（會查詢資料庫，非同步 view 需在執行緒中呼叫）
+
+    未啟用或從未載入成功時回傳 None，由 view 查詢資料庫。
+    """
+    global _index, _checked_at
+    if not enabled():
+        return None
+    if not check_due():
+        return _index
+
+    # 已有索引時，其他執行緒在重新載入期間繼續使用舊索引，不必等待
+    if not _lock.acquire(blocking=_index is None):
+        return _index
+    try:
+        if check_due():
+            try:
+                generation = _generation()
+                if _index is None or _index.generation != generation:
+                    _index = load_index(generation)
+            except Exception as e:
+                # 載入失敗時沿用舊索引，下一次檢查再試
+                print(f'活動索引載入失敗：{e}')
+            _checked_at = time.monotonic()
+    finally:
+        _lock.release()
+    return _index
@@ -0,0 +1,22 @@
+from django.conf import settings
+
+
+class EventReplicaRouter:
+    """
+    活動 API 的讀取改走匯入流程發布的 SQLite 副本
+
+    views 以 router.db_for_read(None, event_api=True) 取得連線別名；
+    副本尚未發布（例如剛部署、還沒跑過匯入）時回傳 None，交給預設的 MySQL。
+    副本是唯讀檔案，不接受寫入與 migrate。
+    """
+
+    def db_for_read(self, model, **hints):
+        if hints.get('event_api') and settings.EVENT_REPLICA_PATH.exists():
+            return 'replica'
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != 'replica'
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -86,9 +87,18 @@ DATABASES = {
         'PASSWORD': 'Kai114615',  # 家裡SQL
         'HOST': 'localhost',
         'PORT': 3306
-    }
+    },
+    # 匯入流程每次成功後發布的 SQLite 唯讀副本（replica.py），活動 API 由路由改讀這裡
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': f"file:{BASE_DIR / 'replica' / 'events.sqlite3'}?mode=ro",
+    },
 }
 
+# 副本檔案存在時活動 API 讀副本，否則照舊讀 MySQL
+EVENT_REPLICA_PATH = BASE_DIR / 'replica' / 'events.sqlite3'
+DATABASE_ROUTERS = ['theme_entertainment.routers.EventReplicaRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -126,6 +136,20 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# 匯入流程產生的活動縮圖（內容定址，檔名即內容雜湊）
+THUMBNAIL_ROOT = BASE_DIR / 'media' / 'thumbs'
+
+# 活動 API 是否使用非同步 view（ASGI 部署時由 asgi.py 開啟）
+EVENT_API_ASYNC = os.environ.get('EVENT_API_ASYNC') == '1'
+
+# 非同步 view 查詢資料庫用的執行緒數（即最多同時使用的資料庫連線數）
+EVENT_API_DB_THREADS = 8
+
+# 活動列表、篩選與搜尋改由行程內的記憶體索引回應（event_index.py），
+# 每隔 EVENT_INDEX_CHECK_SECONDS 秒檢查一次副本或 current_events 是否已換新
+EVENT_API_MEMORY_INDEX = True
+EVENT_INDEX_CHECK_SECONDS = 5
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -14,9 +14,13 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path
-from . import views
+from . import views, async_views
+
+# ASGI 部署時活動 API 改用非同步版本（asgi.py 會設定 EVENT_API_ASYNC）
+api = async_views if settings.EVENT_API_ASYNC else views
 
 urlpatterns = [
     # path('admin/', admin.site.urls),
@@ -24,7 +28,20 @@ urlpatterns = [
     path('create/', views.theme_create, name='theme_create'),
     path('activity_management/', views.activity_management,
          name='activity_management'),
-    path('api/events/', views.get_events, name='get_events'),
-    # path('api/events/<str:event_id>/',
-    #      views.get_event_detail, name='get_event_detail'),
+    path('api/events/', api.get_events, name='get_events'),
+    path('api/events/details/', api.get_event_details,
+         name='get_event_details'),
+    path('api/events/search/', api.search_events, name='search_events'),
+    path('api/events/nearby/', api.get_nearby_events,
+         name='get_nearby_events'),
+    path('api/events/calendar/', api.get_event_calendar,
+         name='get_event_calendar'),
+    path('api/events/changes/', api.get_event_changes,
+         name='get_event_changes'),
+    path('api/events/facets/', api.get_event_facets,
+         name='get_event_facets'),
+    path('api/events/<str:event_id>/',
+         api.get_event_detail, name='get_event_detail'),
+    path('api/thumbs/<str:key>.<str:ext>', views.get_thumbnail,
+         name='get_thumbnail'),
 ]
@@ -1,6 +1,107 @@
+import hashlib
+import json
+import math
+import re
+from datetime import date, timedelta
+
+from django.conf import settings
 from django.shortcuts import render
-from django.http import JsonResponse
-from django.db import connection
+from django.http import JsonResponse, HttpResponseNotModified, FileResponse, Http404
+from django.db import connections, router
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.cache import patch_cache_control
+
+from . import event_index
+
+
+# 列表卡片只需要的欄位
+LIST_FIELDS = """
+    e.uid,
+    e.activity_name as title,
+    e.organizer_id as organizerId,
+    o.name as organizer,
+    e.venue_id as venueId,
+    v.name as location,
+    e.start_date as startDate,
+    e.end_date as endDate,
+    e.image_url as imageUrl,
+    e.thumb_key as thumbKey
+"""
+# 詳情彈窗才需要的欄位
+DETAIL_FIELDS = LIST_FIELDS + """,
+    v.address,
+    e.related_link as url,
+    e.description
+"""
+
+EVENT_JOINS = """
+    FROM events e
+    LEFT JOIN organizers o ON o.id = e.organizer_id
+    LEFT JOIN venues v ON v.id = e.venue_id
+"""
+
+# 封存表（archive.py 搬過去的已結束活動），活動詳情在 events 查不到時改查這裡
+ARCHIVE_JOINS = EVENT_JOINS.replace('FROM events e', 'FROM events_archive e')
+
+# include_past=1 的列表：熱資料表與封存表合併，包含已結束的活動
+PAST_EVENT_COLUMNS = """id, uid, activity_name, description, organizer_id, venue_id,
+    start_date, end_date, related_link, image_url, thumb_key, image_dead,
+    canonical_id, source, category, city"""
+PAST_EVENT_JOINS = f"""
+    FROM (
+        SELECT {PAST_EVENT_COLUMNS} FROM events
+        UNION ALL
+        SELECT {PAST_EVENT_COLUMNS} FROM events_archive
+    ) e
+    LEFT JOIN organizers o ON o.id = e.organizer_id
+    LEFT JOIN venues v ON v.id = e.venue_id
+"""
+
+# 列表改查匯入後重建的 current_events（已反正規化並依 position 排好順序）
+CURRENT_LIST_FIELDS = """
+    c.uid,
+    c.title,
+    c.organizer_id as organizerId,
+    c.organizer,
+    c.venue_id as venueId,
+    c.location,
+    c.start_date as startDate,
+    c.end_date as endDate,
+    c.image_url as imageUrl,
+    c.thumb_key as thumbKey
+"""
+CURRENT_DETAIL_FIELDS = CURRENT_LIST_FIELDS + """,
+    c.address,
+    c.related_link as url,
+    c.description
+"""
+# 增量同步的活動欄位（列表欄位加上前端本機篩選與排序用的欄位）
+CHANGE_FIELDS = CURRENT_LIST_FIELDS + """,
+    c.has_image as hasImage,
+    c.event_id as eventId
+"""
+
+MAX_PAGE_SIZE = 100
+MAX_BATCH_UIDS = 100
+
+# 附近活動的搜尋半徑上限（公里）
+MAX_NEARBY_RADIUS_KM = 20
+KM_PER_DEGREE = 111.32
+EARTH_RADIUS_KM = 6371.0
+
+# 可篩選並統計的分面欄位
+FACET_FIELDS = ('category', 'city', 'source')
+
+# 行事曆一次最多查詢的天數
+MAX_CALENDAR_DAYS = 366
+
+# 活動詳情快取秒數（資料每次匯入才會變動）
+DETAIL_MAX_AGE = 300
+
+# 縮圖以內容雜湊命名，內容永遠不變，可長期快取
+THUMBNAIL_MAX_AGE = 365 * 24 * 60 * 60
+THUMBNAIL_TYPES = {'webp': 'image/webp', 'jpg': 'image/jpeg'}
+THUMBNAIL_KEY = re.compile(r'^[0-9a-f]{64}$')
 
 
 def theme_list(request):
@@ -15,72 +116,586 @@ def activity_management(request):
     return render(request, 'theme_entertainment/activity_management.html')
 
 
+def _parse_int(request, name, default, minimum=1, maximum=None):
+    """讀取整數查詢參數，格式錯誤時拋出 ValueError"""
+    value = request.GET.get(name)
+    if value in (None, ''):
+        return default
+    if not value.isdigit() or int(value) < minimum:
+        raise ValueError(f'{name} 必須為不小於 {minimum} 的整數')
+    return min(int(value), maximum) if maximum else int(value)
+
+
+def _escape_like(value):
+    """跳脫 LIKE 的萬用字元（搭配 ESCAPE '!'，MySQL 與 SQLite 皆適用）"""
+    return value.replace('!', '!!').replace('%', '!%').replace('_', '!_')
+
+
+def _fetch_dicts(cursor):
+    """將查詢結果轉換為字典列表，並把縮圖鍵換成縮圖網址"""
+    columns = [col[0] for col in cursor.description]
+    events = [dict(zip(columns, row)) for row in cursor.fetchall()]
+    if 'thumbKey' in columns:
+        for event in events:
+            thumb_key = event.pop('thumbKey')
+            event['thumbUrl'] = f'/api/thumbs/{thumb_key}.webp' if thumb_key else None
+    return events
+
+
+def get_thumbnail(request, key, ext):
+    """提供匯入流程產生的縮圖，並加上長效快取標頭"""
+    if not THUMBNAIL_KEY.match(key) or ext not in THUMBNAIL_TYPES:
+        raise Http404('找不到縮圖')
+    path = settings.THUMBNAIL_ROOT / key[:2] / f'{key}.{ext}'
+    if not path.is_file():
+        raise Http404('找不到縮圖')
+
+    response = FileResponse(open(path, 'rb'), content_type=THUMBNAIL_TYPES[ext])
+    response['ETag'] = f'"{key}"'
+    patch_cache_control(response, public=True, max_age=THUMBNAIL_MAX_AGE, immutable=True)
+    return response
+
+
+def _cached_json(request, data, max_age=DETAIL_MAX_AGE):
+    """回傳帶有 ETag 與 Cache-Control 的 JSON，內容未變時回 304"""
+    body = json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False)
+    etag = f'"{hashlib.md5(body.encode("utf-8")).hexdigest()}"'
+    if request.headers.get('If-None-Match') == etag:
+        response = HttpResponseNotModified()
+    else:
+        response = JsonResponse(data, safe=False, json_dumps_params={'ensure_ascii': False})
+    response['ETag'] = etag
+    patch_cache_control(response, public=True, max_age=max_age)
+    return response
+
+
+def _run_query(sql, params):
+    """執行查詢並回傳字典列表（同步與非同步 view 共用），由資料庫路由決定讀副本或 MySQL"""
+    with connections[router.db_for_read(None, event_api=True)].cursor() as cursor:
+        cursor.execute(sql, params)
+        return _fetch_dicts(cursor)
+
+
+def event_detail_query(event_id, archived=False):
+    return f"""
+        SELECT {DETAIL_FIELDS}
+        {ARCHIVE_JOINS if archived else EVENT_JOINS}
+        WHERE e.uid = %s
+    """, [event_id]
+
+
+def event_detail_response(request, events):
+    if events:
+        return _cached_json(request, events[0])
+    return JsonResponse({'error': '找不到該活動'}, status=404)
+
+
 def get_event_detail(request, event_id):
+    """單一活動詳情（含簡介），可被瀏覽器與代理快取；已封存的活動也查得到"""
     try:
-        with connection.cursor() as cursor:
-            cursor.execute("""
-                SELECT
-                    uid,
-                    activity_name as title,
-                    description,
-                    organizer,
-                    location,
-                    start_date as startDate,
-                    end_date as endDate,
-                    address,
-                    image_url as imageUrl,
-                    related_link as url
-                FROM events
-                WHERE uid = %s
-            """, [event_id])
-
-            columns = [col[0] for col in cursor.description]
-            row = cursor.fetchone()
-
-            if row:
-                event = dict(zip(columns, row))
-                return JsonResponse(event)
-            else:
-                return JsonResponse({'error': '找不到該活動'}, status=404)
+        events = _run_query(*event_detail_query(event_id))
+        if not events:
+            events = _run_query(*event_detail_query(event_id, archived=True))
+        return event_detail_response(request, events)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+def event_details_uids(request):
+    """批次詳情要查詢的 uid（最多 MAX_BATCH_UIDS 個），沒有提供時拋出 ValueError"""
+    uids = [uid for uid in request.GET.get('uids', '').split(',') if uid][:MAX_BATCH_UIDS]
+    if not uids:
+        raise ValueError('請提供 uids 參數')
+    return uids
+
+
+def event_details_query(uids, archived=False):
+    placeholders = ', '.join(['%s'] * len(uids))
+    return f"""
+        SELECT {DETAIL_FIELDS}
+        {ARCHIVE_JOINS if archived else EVENT_JOINS}
+        WHERE e.uid IN ({placeholders})
+    """, list(uids)
+
+
+def missing_uids(uids, events):
+    """在 events 查不到、要改查封存表的 uid"""
+    found = {event['uid'] for event in events}
+    return [uid for uid in uids if uid not in found]
+
+
+def event_details_response(request, events):
+    return _cached_json(request, {event['uid']: event for event in events})
+
+
+def get_event_details(request):
+    """批次取得多筆活動詳情（?uids=a,b,c），供前端預先載入畫面上的卡片"""
+    try:
+        uids = event_details_uids(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    try:
+        events = _run_query(*event_details_query(uids))
+        missing = missing_uids(uids, events)
+        if missing:
+            events += _run_query(*event_details_query(missing, archived=True))
+        return event_details_response(request, events)
 
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
 
+def _current_filters(request):
+    """主辦單位、場地與分面的等值篩選（欄位 → 值），格式錯誤時拋出 ValueError"""
+    filters = {}
+    # 主辦單位與場地篩選直接比對整數外鍵
+    for field in ('organizer_id', 'venue_id'):
+        value = _parse_int(request, field, None)
+        if value is not None:
+            filters[field] = value
+
+    # 類別、縣市與來源都是有索引的低基數欄位
+    for field in FACET_FIELDS:
+        value = request.GET.get(field, '').strip()
+        if value:
+            filters[field] = value
+    return filters
+
+
+def _current_conditions(request):
+    """current_events 的共用篩選條件：排除已結束的活動、主辦單位、場地、分面與圖片"""
+    # 讀取表在匯入時重建，兩次匯入之間結束的活動在這裡排除
+    conditions = ["(c.end_date IS NULL OR c.end_date >= %s)"]
+    params = [date.today()]
+
+    for field, value in _current_filters(request).items():
+        conditions.append(f"c.{field} = %s")
+        params.append(value)
+
+    if request.GET.get('has_image') == '1':
+        # has_image 已排除匯入時確認失效的圖片連結
+        conditions.append("c.has_image = 1")
+    return conditions, params
+
+
+def _include_past(request):
+    return request.GET.get('include_past') == '1'
+
+
+def _past_conditions(request):
+    """include_past 的篩選條件：只留代表活動，其餘與 current_events 的條件相同"""
+    conditions = ["e.canonical_id IS NULL"]
+    params = []
+    for field, value in _current_filters(request).items():
+        if field == 'source':
+            # events.source 可能帶有資料集後綴（culture:xxx），current_events 只存前綴
+            conditions.append("(e.source = %s OR e.source LIKE %s ESCAPE '!')")
+            params.extend([value, f"{_escape_like(value)}:%"])
+        else:
+            conditions.append(f"e.{field} = %s")
+            params.append(value)
+
+    if request.GET.get('has_image') == '1':
+        conditions.append("(e.image_url IS NOT NULL AND e.image_url != '' AND e.image_dead = 0)")
+
+    keyword = request.GET.get('q', '').strip()
+    if keyword:
+        pattern = f"%{_escape_like(keyword)}%"
+        conditions.append(
+            "(e.activity_name LIKE %s ESCAPE '!' OR e.description LIKE %s ESCAPE '!')")
+        params.extend([pattern, pattern])
+    return conditions, params
+
+
+def _add_keyword_condition(request, conditions, params):
+    """q 參數：搜尋標題與簡介"""
+    keyword = request.GET.get('q', '').strip()
+    if keyword:
+        pattern = f"%{_escape_like(keyword)}%"
+        conditions.append(
+            "(c.title LIKE %s ESCAPE '!' OR c.description LIKE %s ESCAPE '!')")
+        params.extend([pattern, pattern])
+
+
+def event_list_query(request):
+    """
+    組出活動列表的查詢，參數格式錯誤時拋出 ValueError
+
+    Returns:
+        (sql, params, paginated, page, page_size)
+    """
+    full = request.GET.get('fields') == 'full'
+    if _include_past(request):
+        # 連同已結束與封存的活動，依相同的順序（開始日期、活動 id）排列
+        conditions, params = _past_conditions(request)
+        fields = DETAIL_FIELDS if full else LIST_FIELDS
+        source, order = PAST_EVENT_JOINS, "e.start_date IS NULL, e.start_date, e.id"
+    else:
+        conditions, params = _current_conditions(request)
+        _add_keyword_condition(request, conditions, params)
+        fields = CURRENT_DETAIL_FIELDS if full else CURRENT_LIST_FIELDS
+        source, order = "FROM current_events c", "c.position"
+
+    paginated = 'page' in request.GET or 'page_size' in request.GET
+    page = _parse_int(request, 'page', 1)
+    page_size = _parse_int(request, 'page_size', 24, maximum=MAX_PAGE_SIZE)
+    limit = ""
+    if paginated:
+        # 多取一筆用來判斷是否還有下一頁，不需要另外 COUNT
+        limit = "LIMIT %s OFFSET %s"
+        params.extend([page_size + 1, (page - 1) * page_size])
+
+    sql = f"""
+        SELECT {fields}
+        {source}
+        WHERE {' AND '.join(conditions)}
+        ORDER BY {order}
+        {limit}
+    """
+    return sql, params, paginated, page, page_size
+
+
+def event_list_response(events, paginated, page, page_size):
+    if not paginated:
+        return JsonResponse(events, safe=False)
+
+    return JsonResponse({
+        'results': events[:page_size],
+        'page': page,
+        'pageSize': page_size,
+        'hasMore': len(events) > page_size,
+    })
+
+
 def get_events(request):
+    """
+    目前與即將舉行的活動列表（依開始日期排序）
+
+    查詢參數:
+        fields: 預設只回傳列表欄位；full 才包含 description 等詳情欄位
+        has_image: 1 只回傳有圖片的活動
+        q: 搜尋標題與簡介
+        organizer_id / venue_id: 依主辦單位或場地篩選
+        category / city / source: 依類別、縣市或來源篩選
+        page / page_size: 分頁；有指定時回傳 {results, page, pageSize, hasMore}
+        include_past: 1 連同已結束與封存的活動（查詢熱資料表與封存表，不使用記憶體索引）
+
+    記憶體索引（event_index.py）已載入時直接由索引回應，不查詢資料庫。
+    """
     try:
-        with connection.cursor() as cursor:
-            # 查詢所有活動資料
-            cursor.execute("""
-                SELECT
-                    uid,
-                    activity_name as title,
-                    description,
-                    organizer,
-                    location,
-                    start_date as startDate,
-                    end_date as endDate,
-                    address,
-                    image_url as imageUrl,
-                    related_link as url
-                FROM events
-                # WHERE image_url IS NOT NULL AND image_url != ''
-                # ORDER BY start_date DESC
-            """)
-
-            # 獲取列名
-            columns = [col[0] for col in cursor.description]
-
-            # 將查詢結果轉換為字典列表
-            events = [
-                dict(zip(columns, row))
-                for row in cursor.fetchall()
-            ]
-
-            return JsonResponse(events, safe=False)
+        sql, params, paginated, page, page_size = event_list_query(request)
+        filters = _current_filters(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
 
+    try:
+        index = None if _include_past(request) else event_index.get_index()
+        if index is not None:
+            return index.list_response(request, filters, paginated, page, page_size)
+        return event_list_response(_run_query(sql, params), paginated, page, page_size)
     except Exception as e:
         return JsonResponse(
             {'error': str(e)},
             status=500
         )
+
+
+def search_events(request):
+    """關鍵字搜尋（必須提供 q），其餘參數與活動列表相同"""
+    if not request.GET.get('q', '').strip():
+        return JsonResponse({'error': '請提供 q 參數'}, status=400)
+    return get_events(request)
+
+
+def event_changes_payload(since):
+    """
+    上次同步（序號 since）之後的變更：仍在讀取表中的活動為 upserts，其餘為 deletes
+
+    同一活動在這段期間變更多次時只回傳目前的內容。since 為 0、早於保留的變更紀錄
+    或大於目前序號（資料庫重建）時回傳完整列表（reset 為 true），前端整份換掉。
+    """
+    bounds = _run_query("SELECT MIN(seq) as first, MAX(seq) as last FROM event_changes", [])[0]
+    first, last = bounds['first'], bounds['last']
+    reset = last is None or since == 0 or since < first - 1 or since > last
+    today = date.today()
+
+    if reset:
+        upserts = _run_query(f"""
+            SELECT {CHANGE_FIELDS}
+            FROM current_events c
+            WHERE c.end_date IS NULL OR c.end_date >= %s
+            ORDER BY c.position
+        """, [today])
+        deletes = []
+    else:
+        # 只讀到 last 為止，之後才寫入的變更留給下一次同步
+        upserts = _run_query(f"""
+            SELECT {CHANGE_FIELDS}
+            FROM current_events c
+            WHERE c.uid IN (SELECT ch.uid FROM event_changes ch WHERE ch.seq > %s AND ch.seq <= %s)
+              AND (c.end_date IS NULL OR c.end_date >= %s)
+            ORDER BY c.position
+        """, [since, last, today])
+        deletes = [row['uid'] for row in _run_query("""
+            SELECT DISTINCT ch.uid
+            FROM event_changes ch
+            LEFT JOIN current_events c ON c.uid = ch.uid
+            WHERE ch.seq > %s AND ch.seq <= %s AND c.uid IS NULL
+        """, [since, last])]
+
+    return {'seq': last or 0, 'reset': reset, 'upserts': upserts, 'deletes': deletes}
+
+
+def get_event_changes(request):
+    """
+    增量同步：上次同步之後新增、變動與移除的目前活動
+
+    查詢參數:
+        since: 上次回應的 seq（預設 0，回傳完整列表）
+
+    回傳 {seq, reset, upserts, deletes}；已結束的活動由前端依 endDate 自行排除。
+    """
+    try:
+        since = _parse_int(request, 'since', 0, minimum=0)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    try:
+        return _cached_json(request, event_changes_payload(since))
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+def _parse_float(request, name, minimum, maximum, default=None):
+    """讀取浮點數查詢參數，格式錯誤或超出範圍時拋出 ValueError"""
+    value = request.GET.get(name)
+    if value in (None, ''):
+        if default is None:
+            raise ValueError(f'請提供 {name} 參數')
+        return default
+    try:
+        number = float(value)
+    except ValueError:
+        raise ValueError(f'{name} 必須為數字')
+    if not minimum <= number <= maximum:
+        raise ValueError(f'{name} 必須介於 {minimum} 與 {maximum} 之間')
+    return number
+
+
+def nearby_query(request):
+    """
+    組出附近活動的查詢：先以經緯度方框在資料庫中粗篩，距離在 nearby_response 中計算
+
+    Returns:
+        (sql, params, (lat, lng, radius_km, limit))
+    """
+    lat = _parse_float(request, 'lat', -90, 90)
+    lng = _parse_float(request, 'lng', -180, 180)
+    radius_km = _parse_float(request, 'radius', 0.1, MAX_NEARBY_RADIUS_KM, default=2.0)
+    limit = _parse_int(request, 'limit', 24, maximum=MAX_PAGE_SIZE)
+
+    conditions, params = _current_conditions(request)
+    lat_delta = radius_km / KM_PER_DEGREE
+    lng_delta = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01))
+    conditions.append("c.latitude BETWEEN %s AND %s AND c.longitude BETWEEN %s AND %s")
+    params.extend([lat - lat_delta, lat + lat_delta, lng - lng_delta, lng + lng_delta])
+
+    sql = f"""
+        SELECT {CURRENT_LIST_FIELDS}, c.latitude, c.longitude
+        FROM current_events c
+        WHERE {' AND '.join(conditions)}
+    """
+    return sql, params, (lat, lng, radius_km, limit)
+
+
+def _distance_km(lat1, lng1, lat2, lng2):
+    """兩點間的大圓距離（公里）"""
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def nearby_response(events, lat, lng, radius_km, limit):
+    results = []
+    for event in events:
+        distance = _distance_km(lat, lng, float(event['latitude']), float(event['longitude']))
+        if distance <= radius_km:
+            # 不修改共用的查詢結果（非同步 view 會讓相同查詢共用同一份結果）
+            results.append(dict(event, distanceKm=round(distance, 3)))
+    results.sort(key=lambda event: event['distanceKm'])
+    return JsonResponse(results[:limit], safe=False)
+
+
+def get_nearby_events(request):
+    """
+    附近的目前活動，依距離排序
+
+    查詢參數:
+        lat / lng: 中心點座標（必填）
+        radius: 半徑公里數（預設 2，上限 20）
+        limit: 最多回傳筆數
+        has_image / organizer_id / venue_id: 與活動列表相同
+    """
+    try:
+        sql, params, args = nearby_query(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    try:
+        return nearby_response(_run_query(sql, params), *args)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+def _parse_date(request, name, default):
+    """讀取 YYYY-MM-DD 日期查詢參數，格式錯誤時拋出 ValueError"""
+    value = request.GET.get(name)
+    if value in (None, ''):
+        return default
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'{name} 必須為 YYYY-MM-DD 格式的日期')
+
+
+def calendar_query(request):
+    """
+    組出行事曆的查詢：直接讀每日活動數與長區間活動數彙總表，不掃描 events
+
+    Returns:
+        (sql, params, (start, end))
+    """
+    today = date.today()
+    start = _parse_date(request, 'from', today.replace(day=1))
+    # 預設到 from 所在月份的最後一天
+    month_end = (start.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+    end = _parse_date(request, 'to', month_end)
+    if end < start:
+        raise ValueError('to 不可早於 from')
+    if (end - start).days >= MAX_CALENDAR_DAYS:
+        raise ValueError(f'查詢區間最多 {MAX_CALENDAR_DAYS} 天')
+
+    conditions, params = [], []
+    for field in ('source', 'city', 'category'):
+        value = request.GET.get(field, '').strip()
+        if value:
+            conditions.append(f"{field} = %s")
+            params.append(value)
+    filters = ''.join(f" AND {condition}" for condition in conditions)
+
+    # 一年以內的活動讀每日列；更長的活動是區間列，在 calendar_response 展開到查詢區間內的每一天
+    sql = f"""
+        SELECT day as start_day, day as end_day, source, SUM(event_count) as count
+        FROM event_day_counts
+        WHERE day BETWEEN %s AND %s{filters}
+        GROUP BY day, source
+        UNION ALL
+        SELECT start_day, end_day, source, SUM(event_count) as count
+        FROM event_day_ranges
+        WHERE start_day <= %s AND end_day >= %s{filters}
+        GROUP BY start_day, end_day, source
+    """
+    return sql, [start, end, *params, end, start, *params], (start, end)
+
+
+def calendar_response(request, rows, start, end):
+    size = (end - start).days + 1
+    # 每個來源一個差分陣列：區間第一天 +count、最後一天的隔天 -count，最後再累加成每天的數量
+    diffs = {}
+    for row in rows:
+        # MySQL 回傳 date，SQLite 副本回傳字串
+        first = max((date.fromisoformat(str(row['start_day'])) - start).days, 0)
+        last = min((date.fromisoformat(str(row['end_day'])) - start).days, size - 1)
+        diff = diffs.setdefault(row['source'], [0] * (size + 1))
+        diff[first] += int(row['count'])
+        diff[last + 1] -= int(row['count'])
+
+    days = [{} for _ in range(size)]
+    for source, diff in diffs.items():
+        count = 0
+        for offset in range(size):
+            count += diff[offset]
+            if count:
+                days[offset][source] = count
+    return _cached_json(request, {
+        'from': start,
+        'to': end,
+        'days': [{'date': str(start + timedelta(days=offset)), 'count': sum(sources.values()),
+                  'sources': sources}
+                 for offset, sources in enumerate(days)],
+    })
+
+
+def get_event_calendar(request):
+    """
+    每日進行中的活動數（行事曆用），依來源分列
+
+    查詢參數:
+        from / to: 日期區間 YYYY-MM-DD（預設本月，最多 366 天）
+        source / city / category: 只計算指定的來源、縣市或類別
+    """
+    try:
+        sql, params, args = calendar_query(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    try:
+        return calendar_response(request, _run_query(sql, params), *args)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+def facets_query(request):
+    """
+    組出目前篩選條件下各分面的活動數（一次查詢，以 UNION ALL 合併三個分面）
+
+    只有分面、圖片條件時讀取匯入時預先彙總的 current_event_facets；
+    帶有關鍵字、主辦單位或場地條件時才改在 current_events 上統計。
+
+    Returns:
+        (sql, params)
+    """
+    conditions, params = _current_conditions(request)
+    if any(request.GET.get(name) for name in ('q', 'organizer_id', 'venue_id')):
+        table, count = 'current_events', 'COUNT(*)'
+        _add_keyword_condition(request, conditions, params)
+    else:
+        table, count = 'current_event_facets', 'SUM(c.event_count)'
+
+    where = ' AND '.join(conditions)
+    sql = ' UNION ALL '.join(f"""
+        SELECT '{field}' as facet, c.{field} as value, {count} as count
+        FROM {table} c
+        WHERE {where}
+        GROUP BY c.{field}
+    """ for field in FACET_FIELDS)
+    return sql, params * len(FACET_FIELDS)
+
+
+def facets_response(request, rows):
+    facets = {field: [] for field in FACET_FIELDS}
+    for row in rows:
+        if row['value']:
+            facets[row['facet']].append({'value': row['value'], 'count': int(row['count'])})
+    for values in facets.values():
+        values.sort(key=lambda item: (-item['count'], item['value']))
+    return _cached_json(request, facets)
+
+
+def get_event_facets(request):
+    """
+    目前篩選條件下各類別、縣市與來源的活動數
+
+    查詢參數與活動列表相同（category / city / source / has_image / q / organizer_id / venue_id）
+    """
+    try:
+        sql, params = facets_query(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    try:
+        return facets_response(request, _run_query(sql, params))
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
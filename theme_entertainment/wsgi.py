@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'theme_entertainment.settings')
 
 application = get_wsgi_application()
+
+# 啟動時先載入活動 API 的記憶體索引，第一個請求不必等待
+from theme_entertainment import event_index
+
+event_index.get_index()
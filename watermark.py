@@ -0,0 +1,102 @@
+import hashlib
+import json
+from datetime import datetime
+from typing import Dict, Any, Optional, List
+
+
+def event_digest(event: Dict[str, Any]) -> str:
+    """計算單筆標準格式活動的內容摘要（欄位順序不影響結果）"""
+    payload = json.dumps(event, ensure_ascii=False,
+                         sort_keys=True, default=str)
+    return hashlib.md5(payload.encode('utf-8')).hexdigest()
+
+
+def payload_digest(events: List[Dict[str, Any]]) -> str:
+    """計算整批資料的內容摘要，用來判斷來源資料是否完全沒有變動"""
+    digest = hashlib.md5()
+    for event in events:
+        digest.update(event_digest(event).encode('ascii'))
+    return digest.hexdigest()
+
+
+def load_watermark(connection, source: str) -> Optional[Dict[str, Any]]:
+    """讀取指定來源上次成功同步的水位資訊"""
+    cursor = None
+    try:
+        cursor = connection.cursor(buffered=True, dictionary=True)
+        cursor.execute(
+            """SELECT source, last_sync_at, content_digest,
+                      last_offset, record_count
+               FROM sync_watermarks WHERE source = %s""",
+            (source,)
+        )
+        return cursor.fetchone()
+    finally:
+        if cursor:
+            cursor.close()
+
+
+def load_known_digests(connection, uids: List[str], batch_size: int = 1000) -> Dict[str, str]:
+    """
+    分批取出這些 uid 已入庫的內容摘要（同一活動可能出現在多個來源切片中）
+
+    已封存的活動也算已入庫，來源仍列出但內容未變時不會被重新寫回 events。
+    """
+    known = {}
+    cursor = None
+    try:
+        cursor = connection.cursor()
+        for i in range(0, len(uids), batch_size):
+            batch = uids[i:i + batch_size]
+            placeholders = ", ".join(["%s"] * len(batch))
+            # 封存表在前，兩邊都有時以 events 為準
+            cursor.execute(
+                f"""SELECT uid, content_digest FROM events_archive WHERE uid IN ({placeholders})
+                    UNION ALL
+                    SELECT uid, content_digest FROM events WHERE uid IN ({placeholders})""",
+                batch + batch
+            )
+            known.update({uid: digest for uid, digest in cursor.fetchall()})
+        return known
+    finally:
+        if cursor:
+            cursor.close()
+
+
+def filter_unseen(data: Dict[str, Any], known_digests: Dict[str, str]) -> Dict[str, Any]:
+    """過濾掉 uid 與內容摘要都和資料庫相同的活動，只留下新增或變動的資料"""
+    fresh = []
+    for event in data.get("result", []):
+        digest = event_digest(event)
+        if known_digests.get(str(event.get("uid", ""))) == digest:
+            continue
+        fresh.append(dict(event, contentDigest=digest))
+
+    filtered = dict(data)
+    filtered["result"] = fresh
+    return filtered
+
+
+def save_watermark(connection, source: str, data: Dict[str, Any], digest: str) -> None:
+    """更新來源的同步水位（同步時間、內容摘要、下次位移）"""
+    events = data.get("result", [])
+    next_offset = (data.get("offset") or 0) + len(events)
+
+    cursor = None
+    try:
+        cursor = connection.cursor()
+        cursor.execute(
+            """INSERT INTO sync_watermarks
+               (source, last_sync_at, content_digest, last_offset, record_count)
+               VALUES (%s, %s, %s, %s, %s)
+               ON DUPLICATE KEY UPDATE
+                   last_sync_at = VALUES(last_sync_at),
+                   content_digest = VALUES(content_digest),
+                   last_offset = VALUES(last_offset),
+                   record_count = VALUES(record_count)""",
+            (source, datetime.now(), digest, next_offset, len(events))
+        )
+        connection.commit()
+    finally:
+        if cursor:
+            cursor.close()